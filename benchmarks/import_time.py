@@ -0,0 +1,118 @@
+"""
+Measure how long it takes to define model and to touch its data,
+with storages opened lazily and eagerly.
+
+Run from repository root:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --size 100000 --runs 5 --output import.json
+
+Every run is a fresh interpreter, which imports db, defines UserEntity-like
+model over existing data file of --size records and then gets one record:
+    define_s   model class definition, which is what CLI commands,
+               touching no data, pay
+    first_s    first get() of record, which opens lazy storage
+    process_s  whole interpreter run with the model defined but no data touched
+Best of --runs is reported.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict
+
+from benchmarks.stress_threads import fields, remove_files
+from db.base import BaseEntity
+from db.storage import FileDataStorage
+
+MODEL = "ImportBenchEntity"
+
+# Runs in fresh interpreter, {lazy} and {touch} are filled in
+CHILD = """
+import json, time
+start = time.perf_counter()
+from utils.settings import lazy_settings
+lazy_settings.LAZY_STORAGE = {lazy}
+from db.base import BaseEntity
+from db.storage import FileDataStorage
+from benchmarks.stress_threads import fields
+imported = time.perf_counter()
+Model = type("{model}", (BaseEntity,), {{"storage": FileDataStorage(), **fields()}})
+defined = time.perf_counter()
+if {touch}:
+    Model.storage.get(id=1)
+touched = time.perf_counter()
+print(json.dumps({{
+    "import_s": imported - start,
+    "define_s": defined - imported,
+    "first_s": touched - defined,
+}}))
+"""
+
+
+def generate(size: int) -> None:
+    remove_files(MODEL, FileDataStorage)
+    entity = type(MODEL, (BaseEntity,), {"storage": FileDataStorage(), **fields()})
+    batch = 10_000
+    for start in range(0, size, batch):
+        entity.storage.bulk_create(
+            entity(username=f"user{idx}", age=idx % 100)
+            for idx in range(start, min(start + batch, size))
+        )
+
+
+def run_child(lazy: bool, touch: bool) -> Dict[str, float]:
+    code = CHILD.format(lazy=lazy, touch=touch, model=MODEL)
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - start
+    return result
+
+
+def measure(lazy: bool, runs: int) -> Dict[str, float]:
+    untouched = [run_child(lazy, touch=False) for _ in range(runs)]
+    touched = [run_child(lazy, touch=True) for _ in range(runs)]
+    return {
+        "define_s": min(result["define_s"] for result in untouched),
+        "first_s": min(result["first_s"] for result in touched),
+        "process_s": min(result["process_s"] for result in untouched),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=10000, help="records in file")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="write results into JSON file")
+    args = parser.parse_args()
+
+    generate(args.size)
+    try:
+        results = {
+            mode: measure(mode == "lazy", args.runs) for mode in ("lazy", "eager")
+        }
+    finally:
+        remove_files(MODEL, FileDataStorage)
+
+    print(f"{'mode':8} {'define_s':>10} {'first_s':>10} {'process_s':>10}")
+    for mode, metrics in results.items():
+        print(
+            f"{mode:8} {metrics['define_s']:>10.4f} {metrics['first_s']:>10.4f} "
+            f"{metrics['process_s']:>10.4f}"
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"size": args.size, "results": results}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
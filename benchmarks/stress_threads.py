@@ -0,0 +1,180 @@
+"""
+Hammer storages with concurrent get/save/delete calls from thread pool
+and check, that nothing was lost or corrupted.
+
+Run from repository root:
+    python -m benchmarks.stress_threads
+    python -m benchmarks.stress_threads file log --threads 16 --ops 2000
+
+Every worker creates its own records and updates or deletes only them,
+while reading records of everybody. After the run storage is reopened
+from disk and compared with what workers expect. Exit code is 1
+if any check failed.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from db.base import BaseEntity
+from db.binary_storage import BinaryDataStorage
+from db.btree_storage import BTreeDataStorage
+from db.entities.fields import IntegerField, StringField
+from db.sqlite_storage import SqliteDataStorage
+from db.storage import FileDataStorage, JsonDataStorage, LogFileDataStorage
+from utils.settings import lazy_settings
+
+STORAGES = {
+    "file": FileDataStorage,
+    "log": LogFileDataStorage,
+    "json": JsonDataStorage,
+    "bin": BinaryDataStorage,
+    "btree": BTreeDataStorage,
+    "sqlite": SqliteDataStorage,
+}
+
+
+def make_entity(name: str, storage_class: type) -> type:
+    """
+    Build fresh model, stored in its own file, removing file of failed run.
+    """
+    model_name = f"Stress{name.capitalize()}Entity"
+    remove_files(model_name, storage_class)
+    return type(model_name, (BaseEntity,), {"storage": storage_class(), **fields()})
+
+
+def remove_files(model_name: str, storage_class: type) -> None:
+    filepath = os.path.join(
+        lazy_settings.DATA_DIR, f"{model_name.lower()}.{storage_class.file_format}"
+    )
+    for suffix in ("", ".lock", ".snapshot", "-wal", "-shm"):
+        if os.path.exists(filepath + suffix):
+            os.remove(filepath + suffix)
+
+
+def fields() -> dict:
+    return {
+        "id": IntegerField(),
+        "username": StringField(max_len=50, required=True, indexed=True),
+        "age": IntegerField(required=True),
+    }
+
+
+def worker(
+    entity: type, ops: int, seed: int, shared: List[int], shared_lock: threading.Lock
+) -> Tuple[Dict[int, int], List[str]]:
+    """
+    Run random mix of operations.
+
+    :return: Tuple of (alive, errors), where alive maps ids, created by worker
+        and not deleted, to their expected age.
+    """
+    rnd = random.Random(seed)
+    storage = entity.storage
+    alive: Dict[int, int] = {}
+    errors: List[str] = []
+    for _ in range(ops):
+        op = rnd.random()
+        if op < 0.3 or not alive:
+            age = rnd.randrange(1000)
+            instance = entity.create(username=f"w{seed}", age=age)
+            alive[instance.id] = age
+            with shared_lock:
+                shared.append(instance.id)
+        elif op < 0.7:
+            with shared_lock:
+                id = rnd.choice(shared)
+            try:
+                instance = storage.get(id=id)
+            except ValueError:
+                # Record was deleted by its owner, which is fine
+                continue
+            if instance.id != id:
+                errors.append(f"get({id}) returned record {instance.id}")
+        elif op < 0.9:
+            id = rnd.choice(list(alive))
+            instance = storage.get(id=id)
+            instance.age = alive[id] = rnd.randrange(1000)
+            instance.save()
+        else:
+            id = rnd.choice(list(alive))
+            storage.delete(id)
+            del alive[id]
+            try:
+                storage.get(id=id)
+                errors.append(f"Record {id} is alive after delete")
+            except ValueError:
+                pass
+    return alive, errors
+
+
+def run(name: str, threads: int, ops: int) -> List[str]:
+    storage_class = STORAGES[name]
+    entity = make_entity(name, storage_class)
+    shared: List[int] = []
+    shared_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [
+            pool.submit(worker, entity, ops, seed, shared, shared_lock)
+            for seed in range(threads)
+        ]
+        results = [future.result() for future in futures]
+
+    errors = [error for _, worker_errors in results for error in worker_errors]
+    expected: Dict[int, int] = {}
+    for alive, _ in results:
+        expected.update(alive)
+    if len(set(shared)) != len(shared):
+        errors.append("Same id was given to more than one record")
+
+    # Reopen storage, so checks see what was really written to disk
+    close = getattr(entity.storage, "close", None)
+    if close is not None:
+        close()
+    reopened = storage_class()
+    reopened._init(entity)
+    stored = {instance.id: instance.age for instance in reopened._iter_instances()}
+    if stored != expected:
+        missing = expected.keys() - stored.keys()
+        extra = stored.keys() - expected.keys()
+        changed = [
+            id for id in expected.keys() & stored.keys() if expected[id] != stored[id]
+        ]
+        errors.append(
+            f"Stored records differ: {len(missing)} missing, "
+            f"{len(extra)} unexpected, {len(changed)} with wrong age"
+        )
+    if reopened.latest_id < max(expected, default=0):
+        errors.append(f"latest_id {reopened.latest_id} is behind {max(expected)}")
+    close = getattr(reopened, "close", None)
+    if close is not None:
+        close()
+    remove_files(entity.__name__, storage_class)
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("storages", nargs="*", help=f"any of {', '.join(STORAGES)}")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=500, help="operations per thread")
+    args = parser.parse_args()
+    unknown = set(args.storages) - STORAGES.keys()
+    if unknown:
+        parser.error(f"Unknown storages: {', '.join(sorted(unknown))}")
+
+    failed = False
+    for name in args.storages or STORAGES:
+        errors = run(name, args.threads, args.ops)
+        print(f"{name:8} {'FAIL' if errors else 'ok'}")
+        for error in errors[:10]:
+            print(f"    {error}")
+        failed = failed or bool(errors)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
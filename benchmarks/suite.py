@@ -0,0 +1,297 @@
+"""
+Measure speed and memory of storages and containers on synthetic
+UserEntity-like datasets and compare results with saved baseline.
+
+Run from repository root:
+    python -m benchmarks.suite
+    python -m benchmarks.suite --sizes 1000 100000 --output results.json
+    python -m benchmarks.suite --baseline results.json --threshold 0.15
+
+For every case (storage with container) and dataset size it measures:
+    cold_start_s     class creation and opening of storage
+    bytes_per_record memory, allocated by loading, per record
+    create_ops       create() calls per second
+    get_ops          get(id=...) calls per second, random existing ids
+    update_ops       save() calls per second of changed instances
+    delete_ops       delete() calls per second
+
+Datasets are generated with fixed seed, so runs are comparable.
+Every metric is the best of --repeat runs (rounds of --ops / --repeat
+calls for throughput), which keeps noise of shared machines low.
+With --baseline every metric is compared with the same case of baseline
+and exit code is 1, when any of them got worse by more than --threshold.
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from benchmarks.stress_threads import STORAGES, fields, remove_files
+from db.base import BaseEntity
+from db.layers.containers import (
+    AVLTreeModelContainer,
+    DictModelContainer,
+    SortedArrayModelContainer,
+)
+
+SEED = 1
+CONTAINERS = {
+    "avl": {"container_class": AVLTreeModelContainer},
+    "dict": {"container_class": DictModelContainer},
+    "sorted": {"container_class": SortedArrayModelContainer},
+    # Keeps only 1% of records in memory, the rest are read from disk
+    "cached": {"cache_size": None},
+}
+# Storages, which hold records in container, run with every container
+CONTAINER_STORAGES = ("file", "log")
+# Metric -> whether greater value is better
+METRICS = {
+    "cold_start_s": False,
+    "bytes_per_record": False,
+    "create_ops": True,
+    "get_ops": True,
+    "update_ops": True,
+    "delete_ops": True,
+}
+
+
+def cases(storages: List[str], containers: List[str]) -> Iterator[Tuple[str, str]]:
+    for storage in storages:
+        if storage in CONTAINER_STORAGES:
+            for container in containers:
+                yield storage, container
+        else:
+            yield storage, "-"
+
+
+def storage_options(container: str, size: int) -> Dict[str, Any]:
+    if container == "-":
+        return {}
+    options = dict(CONTAINERS[container])
+    if "cache_size" in options:
+        options["cache_size"] = max(size // 100, 10)
+    return options
+
+
+def make_class(storage: str, options: Dict[str, Any]) -> type:
+    """
+    Create model class, which loads its storage from existing file.
+    """
+    entity = type(
+        "BenchEntity",
+        (BaseEntity,),
+        {"storage": STORAGES[storage](**options), **fields()},
+    )
+    # Storages are opened on first use, open it right away to measure loading
+    entity.storage.open()
+    return entity
+
+
+def close(entity: type) -> None:
+    # Log compaction may still run in background after deletes
+    compaction = getattr(entity.storage, "_compaction", None)
+    if compaction is not None:
+        compaction.join()
+    close = getattr(entity.storage, "close", None)
+    if close is not None:
+        close()
+
+
+def generate(entity: type, size: int, rnd: random.Random) -> None:
+    batch = 10_000
+    for start in range(0, size, batch):
+        entity.storage.bulk_create(
+            entity(username=f"user{idx}", age=rnd.randrange(100))
+            for idx in range(start, min(start + batch, size))
+        )
+
+
+def throughput(ops: int, action: Callable[[int], None], rounds: int) -> float:
+    """
+    Calls of action per second. Calls are split into rounds
+    and the best round is taken, so short hiccups don't count.
+    """
+    best = 0.0
+    size = max(ops // rounds, 1)
+    for first in range(0, ops, size):
+        calls = range(first, min(first + size, ops))
+        start = time.perf_counter()
+        for idx in calls:
+            action(idx)
+        best = max(best, len(calls) / (time.perf_counter() - start))
+    return best
+
+
+def run_case(
+    storage: str, container: str, size: int, ops: int, repeat: int
+) -> Dict[str, float]:
+    storage_class = STORAGES[storage]
+    options = storage_options(container, size)
+    rnd = random.Random(SEED)
+    remove_files("BenchEntity", storage_class)
+    entity = make_class(storage, options)
+    generate(entity, size, rnd)
+    close(entity)
+
+    metrics = {}
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        entity = make_class(storage, options)
+        timings.append(time.perf_counter() - start)
+        close(entity)
+    metrics["cold_start_s"] = min(timings)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    entity = make_class(storage, options)
+    metrics["bytes_per_record"] = (tracemalloc.get_traced_memory()[0] - before) / size
+    tracemalloc.stop()
+
+    ids = [rnd.randint(1, size) for _ in range(ops)]
+    age = rnd.randrange
+    created = []
+    metrics["create_ops"] = throughput(
+        ops,
+        lambda idx: created.append(entity.create(username=f"new{idx}", age=age(100))),
+        repeat,
+    )
+    get = entity.storage.get
+    metrics["get_ops"] = throughput(ops, lambda idx: get(id=ids[idx]), repeat)
+    instances = [get(id=id) for id in ids]
+
+    def update(idx: int) -> None:
+        instance = instances[idx]
+        instance.age = age(100)
+        instance.save()
+
+    metrics["update_ops"] = throughput(ops, update, repeat)
+    delete = entity.storage.delete
+    metrics["delete_ops"] = throughput(
+        ops, lambda idx: delete(created[idx].id), repeat
+    )
+    close(entity)
+    remove_files("BenchEntity", storage_class)
+    return metrics
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], threshold: float
+) -> List[str]:
+    """
+    Find metrics, which got worse than in baseline by more than threshold.
+
+    :return: List[str]. Descriptions of regressions.
+    """
+    known = {_key(result): result["metrics"] for result in baseline}
+    regressions = []
+    for result in results:
+        old = known.get(_key(result))
+        if old is None:
+            continue
+        for metric, value in result["metrics"].items():
+            if not old.get(metric):
+                continue
+            change = value / old[metric] - 1
+            worse = -change if METRICS[metric] else change
+            if worse > threshold:
+                regressions.append(
+                    f"{_name(result)} {metric}: {old[metric]:.4g} -> {value:.4g} "
+                    f"({change:+.0%})"
+                )
+    return regressions
+
+
+def _key(result: Dict[str, Any]) -> Tuple[str, str, int]:
+    return result["storage"], result["container"], result["size"]
+
+
+def _name(result: Dict[str, Any]) -> str:
+    return f"{result['storage']}/{result['container']}/{result['size']}"
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--storages", nargs="*", default=list(STORAGES), help="storages to measure"
+    )
+    parser.add_argument(
+        "--containers",
+        nargs="*",
+        default=list(CONTAINERS),
+        help=f"containers of {', '.join(CONTAINER_STORAGES)} storages",
+    )
+    parser.add_argument("--sizes", nargs="*", type=int, default=[1000, 10000])
+    parser.add_argument("--ops", type=int, default=1000, help="operations per metric")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every metric")
+    parser.add_argument("--output", help="write results into JSON file")
+    parser.add_argument("--baseline", help="compare with results in JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+    for option, known in (("storages", STORAGES), ("containers", CONTAINERS)):
+        unknown = set(getattr(args, option)) - known.keys()
+        if unknown:
+            parser.error(f"Unknown {option}: {', '.join(sorted(unknown))}")
+
+    results = []
+    print(f"{'case':24} " + " ".join(f"{metric:>16}" for metric in METRICS))
+    for size in args.sizes:
+        for storage, container in cases(args.storages, args.containers):
+            metrics = run_case(storage, container, size, args.ops, args.repeat)
+            result = {
+                "storage": storage,
+                "container": container,
+                "size": size,
+                "metrics": metrics,
+            }
+            results.append(result)
+            print(
+                f"{_name(result):24} "
+                + " ".join(f"{metrics[metric]:>16.4g}" for metric in METRICS)
+            )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {"environment": environment(), "results": results}, file, indent=2
+            )
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions over {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
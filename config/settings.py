@@ -1,3 +1,16 @@
 DEFAULT_MODEL_CONTAINER = "db.layers.containers.AVLTreeModelContainer"
 DEFAULT_DATA_STORAGE = "db.storage.FileDataStorage"
 DATA_DIR = "data"
+LOG_COMPACTION_THRESHOLD = 0.5
+# Count calls and latencies of operations of every storage, see storage.stats()
+STORAGE_METRICS = False
+# Open storages on first use of Model.storage, not when model class is defined
+LAZY_STORAGE = True
+# Keep snapshot of loaded records next to data file for fast start of text storages,
+# storages with cache_size or cache_bytes never keep it
+STORAGE_SNAPSHOT = True
+# Items, sorted in memory by external sort, before they are spilled to DATA_DIR
+SORT_BUFFER_SIZE = 100_000
+# Threads and concurrent writes of db.aio.AsyncStorage
+ASYNC_STORAGE_WORKERS = 4
+ASYNC_STORAGE_WRITES = 1
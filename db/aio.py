@@ -0,0 +1,149 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Union
+
+from db.base import BaseDataStorage, BaseEntity
+from utils.settings import lazy_settings
+
+
+class AsyncStorage:
+    """
+    Asyncio facade of any BaseDataStorage.
+
+    Every call of storage runs on bounded thread pool, so event loop,
+    serving many sessions, never blocks on disk reads or on locks
+    of storage. Storage, which is not opened yet, is opened there too.
+
+    Concurrent `get`s of the same id share one lookup: the first one
+    runs it, the rest wait for its result. Writes wait for each other
+    on storage lock anyway, so they are limited by semaphore and don't
+    take all workers from readers. Write of id
+    detaches running lookup of this id, so `get`, started after write,
+    never gets result, read before it.
+
+    Instances may be shared by storage and callers on other workers,
+    so change copies of them and publish changes with save.
+    Facade belongs to one event loop.
+
+        books = AsyncStorage.for_model(Book)
+        book = (await books.get(1)).copy()
+        book.title = "Dune"
+        await books.save(book)
+    """
+
+    def __init__(
+        self,
+        storage: BaseDataStorage,
+        max_workers: Union[int, None] = None,
+        max_writes: Union[int, None] = None,
+        executor: Union[Executor, None] = None,
+    ) -> None:
+        """
+        :param max_workers: int. Threads of own executor,
+            ASYNC_STORAGE_WORKERS setting is used, when not given.
+        :param max_writes: int. Writes, running at once,
+            ASYNC_STORAGE_WRITES setting is used, when not given.
+        :param executor: Executor to run storage calls on instead of own one.
+            It is not shut down by close.
+        """
+        if max_writes is None:
+            max_writes = lazy_settings.ASYNC_STORAGE_WRITES
+        if max_writes < 1:
+            raise ValueError(f"max_writes must be positive, got {max_writes}")
+        self.storage = storage
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers or lazy_settings.ASYNC_STORAGE_WORKERS,
+            thread_name_prefix="storage",
+        )
+        self._writes = asyncio.Semaphore(max_writes)
+        # id -> lookup, which is running for it
+        self._gets: Dict[int, asyncio.Future] = {}
+
+    @classmethod
+    def for_model(cls, model_class: type, **kwargs) -> "AsyncStorage":
+        """
+        Facade of model storage. Storage, which is not opened yet,
+        is opened on the first call, not here.
+
+        :raises: ValueError if model has no storage
+        """
+        storage = model_class._declared_storage()
+        if storage is None:
+            raise ValueError(f"Model {model_class.__name__} has no storage")
+        return cls(storage, **kwargs)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Call any blocking function on executor, e.g. storage.search_text.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, partial(func, *args, **kwargs)
+        )
+
+    async def open(self) -> BaseDataStorage:
+        if getattr(self.storage, "_pending_model", None) is not None:
+            await self.run(self.storage.open)
+        return self.storage
+
+    async def get(self, id: int) -> BaseEntity:
+        """
+        :raises: ValueError if there is no instance with such id
+        """
+        lookup = self._gets.get(id)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._get(id))
+            self._gets[id] = lookup
+            lookup.add_done_callback(partial(self._forget, id))
+        # Cancelled waiter must not cancel lookup of others
+        return await asyncio.shield(lookup)
+
+    async def _get(self, id: int) -> BaseEntity:
+        storage = await self.open()
+        return await self.run(storage.get, id=id)
+
+    def _forget(self, id: int, lookup: asyncio.Future) -> None:
+        if self._gets.get(id) is lookup:
+            del self._gets[id]
+        if not lookup.cancelled():
+            # Exception is delivered to waiters, nobody else retrieves it
+            lookup.exception()
+
+    async def search(self, **kwargs) -> List[BaseEntity]:
+        storage = await self.open()
+        return await self.run(storage.search, **kwargs)
+
+    async def create(self, **kwargs) -> BaseEntity:
+        """
+        Validate and save new instance of storage model.
+        """
+        storage = await self.open()
+        instance = storage.model_class(**kwargs)
+        await self.save(instance)
+        return instance
+
+    async def save(self, instance: BaseEntity) -> None:
+        storage = await self.open()
+        async with self._writes:
+            await self.run(storage.save, instance)
+        self._gets.pop(instance.id, None)
+
+    async def delete(self, entity: Union[int, BaseEntity]) -> None:
+        storage = await self.open()
+        async with self._writes:
+            await self.run(storage.delete, entity)
+        self._gets.pop(entity if isinstance(entity, int) else entity.id, None)
+
+    def close(self) -> None:
+        """
+        Shut down own executor, waiting for running calls.
+        """
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> "AsyncStorage":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -1,34 +1,130 @@
-from typing import Any, Dict, List, Union
+import json
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Union
+from db.entities.codec import RowCodec
+from db.query import Manager
+from src.utils.concurrency import IdAllocator, RWLock
+from src.utils.metrics import Metrics, instrument, uninstrument
 from utils.settings import lazy_settings
 
 
+class BaseEntityField:
+    """
+    Field schema: type, constraints and options of single model field.
+    Values themselves live on model instances.
+    """
+
+    typ = None
+
+    def __init__(self, required=False, default=None, indexed=False):
+        self.required = required
+        self.default = default
+        self.indexed = indexed
+        self.title = self.__class__.__name__
+        self.name = None
+
+    def validate(self, value) -> None:
+        if not isinstance(value, (self.typ, type(None))):
+            raise ValueError(f"Value must be of type {self.typ}")
+
+
 class EntityMeta(type):
+    """
+    Collects fields of model into `_fields` and replaces them with
+    `__slots__` of the same names, so instances hold only their values
+    and attributes are read with native speed. Also compiles `_codec`,
+    row layout used by storages for parsing and serializing.
+    """
+
     def __new__(cls, name, bases, dct):
+        fields = {
+            key: value
+            for key, value in dct.items()
+            if isinstance(value, BaseEntityField)
+        }
+        inherited = {}
+        for base in reversed(bases):
+            inherited.update(getattr(base, "_fields", {}))
+
+        for key, field in fields.items():
+            del dct[key]
+            field.name = key
+        if "__slots__" not in dct:
+            dct["__slots__"] = tuple(key for key in fields if key not in inherited)
 
         new_cls = super().__new__(cls, name, bases, dct)
+        new_cls._fields = {**inherited, **fields}
+        new_cls._codec = RowCodec(new_cls)
         new_cls._init_storage()
         return new_cls
 
 
+class LazyStorage:
+    """
+    Model attribute, which opens storage on first access and then
+    replaces itself with the storage, so later accesses cost nothing.
+    Threads, which come while storage is being opened, wait for it.
+    """
+
+    def __init__(self, storage: "BaseDataStorage", owner: type) -> None:
+        self.storage = storage
+        self.owner = owner
+
+    def __get__(self, instance: Any, owner: type) -> "BaseDataStorage":
+        self.storage.open()
+        if vars(self.owner).get("storage") is self:
+            setattr(self.owner, "storage", self.storage)
+        return self.storage
+
+
 class BaseEntity(metaclass=EntityMeta):
-    fields = {}
+    # Weak references let cached containers track instances, held by callers
+    __slots__ = ("__weakref__",)
+    objects = Manager()
 
     @classmethod
-    def _init_storage(cls) -> "BaseDataStorage":
-        if hasattr(cls, "storage"):
-            cls.storage._init(cls)
+    def _init_storage(cls) -> None:
+        """
+        Bind storage to model. Unless LAZY_STORAGE setting is off,
+        storage is opened only on first access of `Model.storage`,
+        so defining model doesn't read its data file.
+        """
+        storage = cls._declared_storage()
+        if storage is None:
+            return
+        if not lazy_settings.LAZY_STORAGE:
+            storage._init(cls)
+            return
+        storage._bind(cls)
+        cls.storage = LazyStorage(storage, cls)
+
+    @classmethod
+    def _declared_storage(cls) -> Union["BaseDataStorage", None]:
+        """
+        Storage of model, found without opening it.
+        """
+        for klass in cls.__mro__:
+            storage = vars(klass).get("storage")
+            if storage is not None:
+                break
+        else:
+            return None
+        if isinstance(storage, LazyStorage):
+            return storage.storage
+        return storage
 
     def __init__(self, **kwargs):
-        self.fields = self._get_fields()
         self._set_values(**kwargs)
 
     def _set_values(self, **kwargs) -> None:
-        for f, v in kwargs.items():
-            if f not in self.fields:
+        for f in kwargs:
+            if f not in self._fields:
                 raise ValueError(
                     f"Model {self.__class__.__name__} has no attribute {f}"
                 )
-            self.fields[f].value = v
+        for name, field in self._fields.items():
+            setattr(self, name, kwargs.get(name, field.default))
 
     @classmethod
     def create(cls, **kwargs) -> "BaseEntity":
@@ -36,61 +132,127 @@ class BaseEntity(metaclass=EntityMeta):
         instance.save()
         return instance
 
+    @classmethod
+    def bulk_create(
+        cls, items: Iterable[Union["BaseEntity", Dict[str, Any]]]
+    ) -> List["BaseEntity"]:
+        """
+        Create many instances in one storage batch.
+
+        :param items: instances or dicts of field values.
+        :return: List[BaseEntity]. Created instances with ids.
+        """
+        instances = [
+            item if isinstance(item, cls) else cls(**item) for item in items
+        ]
+        return cls.storage.bulk_create(instances)
+
     def save(self):
         self.storage.save(self)
 
     def delete(self):
         self.storage.delete(self)
 
+    def copy(self) -> "BaseEntity":
+        """
+        Instance with the same values and id. Instances, read from storage,
+        may be shared with it and with other callers: change a copy
+        and save it, so they never see half-changed instance.
+        """
+        return self._codec.copy(self)
+
     def update(self, **kwargs):
         for f, v in kwargs.items():
-            if f in self.fields:
-                self.fields[f].value = v
-
-    def __getattribute__(self, name):
-        if name in ("fields", "_get_fields", "__dict__"):
-            return object.__getattribute__(self, name)
-
-        fields = object.__getattribute__(self, "__dict__").get("fields", {})
-        if name in fields:
-            field = fields[name]
-            if hasattr(field, "value"):
-                return field.value
-            raise AttributeError(
-                f"'Field' object for '{name}' has no attribute 'value'"
-            )
-        return object.__getattribute__(self, name)
+            if f in self._fields:
+                setattr(self, f, v)
 
     def __setattr__(self, name, value):
-        fields = self.__dict__.get("fields", {})
-
-        if name in fields:
-            field = fields[name]
-            if hasattr(field, "value"):
-                field.value = value
-                return
-            raise AttributeError(
-                f"'Field' object for '{name}' has no attribute 'value'"
-            )
-
+        field = self._fields.get(name)
+        if field is not None:
+            field.validate(value)
         object.__setattr__(self, name, value)
 
     @classmethod
-    def _get_fields(cls) -> Dict[str, "BaseEntityField"]:
-        if hasattr(cls, "_cached_fields"):
-            return cls._cached_fields
-
-        fields = {}
-
-        for base in cls.__mro__:
-            fields.update(
-                {f: v for f, v in vars(base).items() if isinstance(v, BaseEntityField)}
-            )
-        cls._cached_fields = fields
-        return fields
+    def _get_fields(cls) -> Dict[str, BaseEntityField]:
+        return cls._fields
 
 
 class BaseDataStorage:
+    # Operation name -> method, timed by metrics and surrounded by hooks
+    INSTRUMENTED = {
+        "get": "get",
+        "search": "search",
+        "save": "save",
+        "delete": "_delete",
+        "load": "load_model_container",
+        "parse": "_parse_instance",
+    }
+    CONTAINER_INSTRUMENTED = {
+        "container.insert": "insert",
+        "container.search": "search",
+        "container.delete": "delete",
+    }
+    TREE_INSTRUMENTED = {
+        "tree.insert": "insert",
+        "tree.search": "search",
+        "tree.delete": "delete",
+    }
+
+    def __init__(self, container_class: Union[type, None] = None) -> None:
+        """
+        :param container_class: BaseModelContainer subclass, which holds
+            instances of this storage model. DEFAULT_MODEL_CONTAINER
+            setting is used, when not given.
+        """
+        self._container_class = container_class
+        self.metrics: Union[Metrics, None] = None
+        self.hooks: Dict[str, List[Callable]] = {}
+        # Model, storage is bound to, but not opened for yet
+        self._pending_model: Union[type, None] = None
+        self._opening: Union[int, None] = None
+        self._open_lock = threading.RLock()
+        if lazy_settings.STORAGE_METRICS:
+            self.enable_metrics()
+
+    def _bind(self, model_class: BaseEntity) -> None:
+        """
+        Remember model, storage is opened for on first use.
+        """
+        self._pending_model = model_class
+
+    def open(self) -> "BaseDataStorage":
+        """
+        Open storage for its model: read data file, load container
+        and indexes. Runs once, usually on first use of `Model.storage`,
+        but may be called explicitly, e.g. to load data at start.
+        """
+        if self._pending_model is None:
+            return self
+        with self._open_lock:
+            model_class = self._pending_model
+            if model_class is not None and self._opening is None:
+                self._opening = threading.get_ident()
+                try:
+                    self._init(model_class)
+                finally:
+                    self._opening = None
+                self._pending_model = None
+        return self
+
+    def __getattr__(self, name: str) -> Any:
+        # Called only for missing attributes. Storage, which is used
+        # directly before its model opened it, is opened here
+        state = self.__dict__
+        if (
+            name.startswith("__")
+            or state.get("_pending_model") is None
+            or state.get("_opening") == threading.get_ident()
+        ):
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {name!r}"
+            )
+        self.open()
+        return getattr(self, name)
 
     def _init(self, model_class: BaseEntity, *args, **kwargs):
         """
@@ -116,8 +278,103 @@ class BaseDataStorage:
                 You need not to parse fields names each time,
         """
         self.model_class = model_class
+        self.lock = RWLock()
+        self.id_allocator = IdAllocator()
         self.model_fields_map = self._get_model_fields()
-        self.container_class: BaseModelContainer = lazy_settings.DEFAULT_MODEL_CONTAINER
+        self.container_class: BaseModelContainer = (
+            self._container_class or lazy_settings.DEFAULT_MODEL_CONTAINER
+        )
+        self.indexes = self._init_indexes()
+        self.fulltext = self._init_fulltext()
+
+    @property
+    def latest_id(self) -> int:
+        return self.id_allocator.current
+
+    @latest_id.setter
+    def latest_id(self, value: int) -> None:
+        self.id_allocator.reset(value)
+
+    def enable_metrics(self) -> Metrics:
+        """
+        Start counting calls and latencies of storage operations,
+        container and tree operations. Storage methods are wrapped
+        on this instance only, so disabled metrics cost nothing.
+        Enable metrics before model class is created to measure loading.
+        """
+        if self.metrics is None:
+            self.metrics = Metrics()
+            self._instrument()
+        return self.metrics
+
+    def disable_metrics(self) -> None:
+        self.metrics = None
+        self._instrument()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters and latency histograms of operations,
+        empty when metrics are disabled.
+        """
+        return self.metrics.snapshot() if self.metrics is not None else {}
+
+    def dump_stats(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.stats(), file, indent=2)
+
+    def add_hook(self, event: str, callback: Callable) -> None:
+        """
+        Call callback around storage operation, e.g. to attach profiler.
+
+        :param event: str. "before_<operation>" or "after_<operation>",
+            where operation is one of INSTRUMENTED, e.g. "before_save"
+            or "after_load". Before hooks get arguments of operation,
+            after hooks get its result followed by the arguments.
+        :raises: ValueError if event is unknown
+        """
+        when, _, operation = event.partition("_")
+        if when not in ("before", "after") or operation not in self.INSTRUMENTED:
+            raise ValueError(
+                f"Unknown event {event}. Use before_<operation> or after_<operation>, "
+                f"where operation is one of {list(self.INSTRUMENTED)}"
+            )
+        self.hooks.setdefault(event, []).append(callback)
+        self._instrument()
+
+    def remove_hook(self, event: str, callback: Callable) -> None:
+        callbacks = self.hooks.get(event, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+            self._instrument()
+
+    def _instrument(self) -> None:
+        uninstrument(self, self.INSTRUMENTED)
+        hooks = self.hooks
+        if self.metrics is not None:
+            # Containers are rebuilt on every load, so they are instrumented
+            # after each of them
+            hooks = {
+                **hooks,
+                "after_load": [
+                    self._instrument_container,
+                    *hooks.get("after_load", ()),
+                ],
+            }
+        instrument(self, self.INSTRUMENTED, self.metrics, hooks)
+        container = getattr(getattr(self, "container", None), "container", None)
+        if container is not None:
+            self._instrument_container(container)
+
+    def _instrument_container(self, container: Any, *args, **kwargs) -> None:
+        tree = getattr(container, "tree", None)
+        target, methods = (
+            (tree, self.TREE_INSTRUMENTED)
+            if tree is not None
+            else (container, self.CONTAINER_INSTRUMENTED)
+        )
+        uninstrument(target, methods)
+        if self.metrics is not None:
+            instrument(target, methods, self.metrics, {})
 
     def get_latest_id(self) -> int:
         raise NotImplementedError(
@@ -150,10 +407,187 @@ class BaseDataStorage:
             "You should implement save_instance method ma brazaaa! Don't be lazy!"
         )
 
-    def search(self, **kwargs) -> Any:
-        raise NotImplementedError(
-            "You should implement search method ma brazaaa! Don't be lazy!"
-        )
+    def search(self, **kwargs) -> List[BaseEntity]:
+        """
+        Find instances, which fields are equal to given values.
+        Indexed fields are resolved through their indexes and
+        ids sets are intersected, rest of fields are checked only
+        on found candidates. Without indexed fields container is scanned.
+
+        :param kwargs: Dict[str, Any]. Field names and values.
+        :return: List[BaseEntity]. Found instances ordered by id.
+        :raises: ValueError if key is not model field
+        """
+        for key in kwargs:
+            if key not in self.model_fields_map:
+                raise ValueError(
+                    f"Field {key} is not field of model {self.model_class.__name__}"
+                )
+        with self.lock.read_locked():
+            return self._search(**kwargs)
+
+    def _search(self, **kwargs) -> List[BaseEntity]:
+        indexed = [key for key in kwargs if key in self.indexes]
+        rest = [(key, value) for key, value in kwargs.items() if key not in indexed]
+
+        if "id" in kwargs:
+            instance = self._lookup(kwargs["id"])
+            candidates = [instance] if instance is not None else []
+        elif indexed:
+            ids = None
+            for key in indexed:
+                found = self.indexes[key].lookup(kwargs[key])
+                ids = found if ids is None else ids & found
+                if not ids:
+                    return []
+            candidates = [self._lookup(id) for id in sorted(ids)]
+        else:
+            candidates = self._iter_instances()
+
+        return [
+            instance
+            for instance in candidates
+            if all(getattr(instance, key) == value for key, value in rest)
+        ]
+
+    def _iter_instances(self) -> Iterator[BaseEntity]:
+        """
+        Iterate over all stored instances ordered by id.
+        """
+        return iter(self.container)
+
+    def _lookup(self, id: int) -> Union[BaseEntity, None]:
+        """
+        Find instance by id, returns None if there is no such instance.
+        """
+        return self.container.search(id)
+
+    def _init_indexes(self) -> Dict[str, "BaseIndex"]:
+        from db.layers.indexes import build_index
+
+        return {
+            name: build_index(name, field.indexed)
+            for name, field in self.model_fields_map.items()
+            if field.indexed and name != "id"
+        }
+
+    def _init_fulltext(self) -> Dict[str, "FullTextIndex"]:
+        from db.layers.fulltext import FullTextIndex
+
+        return {
+            name: FullTextIndex(name)
+            for name, field in self.model_fields_map.items()
+            if getattr(field, "fulltext", False)
+        }
+
+    def _index_instance(self, instance: BaseEntity) -> None:
+        for name, index in self.indexes.items():
+            index.update(instance.id, getattr(instance, name))
+        for name, index in self.fulltext.items():
+            index.update(instance.id, getattr(instance, name))
+
+    def _unindex_instance(self, id: int) -> None:
+        for index in self.indexes.values():
+            index.remove(id)
+        for index in self.fulltext.values():
+            index.remove(id)
+
+    def search_text(
+        self, field: str, query: str, mode: str = "and", limit: int = None
+    ) -> List[BaseEntity]:
+        """
+        Find instances by words of full-text indexed field, best matches first.
+
+        :param field: str. Name of StringField with fulltext=True.
+        :param query: str. Words to search, case doesn't matter.
+        :param mode: str. "and" for instances with all words,
+            "or" for instances with any of them.
+        :param limit: int. Return only this many best matches.
+        :raises: ValueError if field has no full-text index
+        """
+        index = self.fulltext.get(field)
+        if index is None:
+            raise ValueError(
+                f"Field {field} of model {self.model_class.__name__} "
+                "has no full-text index"
+            )
+        with self.lock.read_locked():
+            found = [self._lookup(id) for id, _ in index.search(query, mode, limit)]
+        return [instance for instance in found if instance is not None]
+
+    def autocomplete(self, field: str, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Suggest values of field, which start with prefix, ignoring case.
+
+        :param field: str. Name of StringField with indexed="prefix".
+        :param prefix: str. Typed beginning of value.
+        :param limit: int. Return at most this many values.
+        :return: List[str]. Distinct values in alphabetical order.
+        :raises: ValueError if field has no prefix index
+        """
+        from db.layers.indexes import PrefixIndex
+
+        index = self.indexes.get(field)
+        if not isinstance(index, PrefixIndex):
+            raise ValueError(
+                f"Field {field} of model {self.model_class.__name__} "
+                "has no prefix index"
+            )
+        if getattr(self, "auto_refresh", False):
+            self.refresh()
+        with self.lock.read_locked():
+            return index.complete(prefix, limit)
+
+    def bulk_create(self, instances: Iterable[BaseEntity]) -> List[BaseEntity]:
+        """
+        Save new instances inside one atomic batch.
+        """
+        instances = list(instances)
+        with self.atomic():
+            for instance in instances:
+                self.save(instance)
+        return instances
+
+    def bulk_update(self, instances: Iterable[BaseEntity], fields: List[str]) -> None:
+        """
+        Write given fields of instances to their stored records inside
+        one atomic batch. Fields are set on copies of stored records,
+        which replace them only when batch is applied, so on failure
+        stored instances and indexes keep old values.
+
+        :raises: ValueError if field is not model field or instance is not stored
+        """
+        for field in fields:
+            if field not in self.model_fields_map:
+                raise ValueError(
+                    f"Field {field} is not field of model {self.model_class.__name__}"
+                )
+        codec = self.model_class._codec
+        with self.atomic():
+            # All records are checked before the first write, so storages,
+            # which can't roll batch back, fail without writing too
+            updates = []
+            for instance in instances:
+                stored = self._lookup(instance.id) if instance.id else None
+                if stored is None:
+                    raise ValueError(
+                        f"No {self.model_class.__name__} with id {instance.id}"
+                    )
+                updated = codec.copy(stored)
+                for field in fields:
+                    setattr(updated, field, getattr(instance, field))
+                updates.append(updated)
+            for updated in updates:
+                self.save(updated)
+
+    @contextmanager
+    def atomic(self):
+        """
+        Group writes into one batch, which is applied at once and
+        rolled back as a whole on failure. Storages, which don't override it,
+        apply every write immediately and can't roll them back.
+        """
+        yield self
 
     def get_model_instance(self, *args, **kwargs) -> Any:
         return self.model_class(*args, **kwargs)
@@ -259,29 +693,6 @@ class BaseDataStorage:
         pass
 
 
-class BaseEntityField:
-    typ = None
-
-    def __init__(self, required=False, default=None):
-        self.required = required
-        self.default = default
-        self.title = self.__class__.__name__
-        self.value = default
-
-    def set_default(self):
-        if self.default:
-            self.value = self.default
-
-    def validate(self, value) -> None:
-        if not isinstance(value, (self.typ, type(None))):
-            raise ValueError(f"Value must be of type {self.typ}")
-
-    def __setattr__(self, name, value):
-        if name == "value":
-            self.validate(value)
-        super().__setattr__(name, value)
-
-
 class BaseModelContainer:
     def insert(self, value):
         raise NotImplementedError("Method insert not implemented maaan. Implement it!")
@@ -292,6 +703,51 @@ class BaseModelContainer:
     def delete(self, value):
         raise NotImplementedError("Method delete not implemented maaan. Implement it!")
 
+    def load(self, values):
+        """
+        Fill container with values at once, usually on storage loading.
+        Implementations may take advantage of values ordered by key.
+        """
+        for value in values:
+            self.insert(value)
+
+    def range(self, lo=None, hi=None):
+        """
+        Iterate over instances with lo <= key <= hi ordered by key
+        """
+        raise NotImplementedError("Method range not implemented maaan. Implement it!")
+
+    def iter_from(self, key=None, limit=None, inclusive=True):
+        """
+        Iterate over at most `limit` instances ordered by key, starting from key.
+        Pass inclusive=False with the last seen key for keyset pagination.
+        """
+        raise NotImplementedError(
+            "Method iter_from not implemented maaan. Implement it!"
+        )
+
+    def floor(self, key):
+        raise NotImplementedError("Method floor not implemented maaan. Implement it!")
+
+    def ceiling(self, key):
+        raise NotImplementedError(
+            "Method ceiling not implemented maaan. Implement it!"
+        )
+
+    def successor(self, key):
+        raise NotImplementedError(
+            "Method successor not implemented maaan. Implement it!"
+        )
+
+    def __iter__(self):
+        """
+        Iterate over stored instances ordered by key
+        """
+        raise NotImplementedError("Method __iter__ not implemented maaan. Implement it!")
+
+    def __len__(self):
+        raise NotImplementedError("Method __len__ not implemented maaan. Implement it!")
+
     def __str__(self):
         """
         Optional method for string representation of container
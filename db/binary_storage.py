@@ -0,0 +1,240 @@
+import os
+import struct
+import zlib
+from typing import Any, Iterator, List, Tuple, Union
+
+from db.base import BaseEntity
+from db.storage import BaseFileDataStorage
+
+
+class RecordLayout:
+    """
+    Fixed-width binary layout of model record, derived from model fields.
+
+    Record is: live flag (B), null bitmap (I), then fields
+    in codec column order, where
+        IntegerField -> int64 (q)
+        StringField(max_len=N) -> length prefix (H) + N bytes of UTF-8 (Ns)
+    """
+
+    INT = 0
+    STR = 1
+    INT_MIN = -(1 << 63)
+    INT_MAX = (1 << 63) - 1
+    # Length prefix is unsigned short
+    MAX_STR_LEN = 0xFFFF
+
+    def __init__(self, model_class: type) -> None:
+        self.codec = model_class._codec
+        fields = model_class._fields
+        self.columns = self.codec.columns
+        if len(self.columns) > 32:
+            raise ValueError("Binary layout supports at most 32 fields")
+
+        fmt = ["<", "B", "I"]
+        kinds = []
+        for name in self.columns:
+            field = fields[name]
+            if field.typ is int:
+                fmt.append("q")
+                kinds.append((self.INT, None))
+            elif field.typ is str:
+                if field.max_len > self.MAX_STR_LEN:
+                    raise ValueError(
+                        f"Field {name} is longer than {self.MAX_STR_LEN} bytes, "
+                        "which binary layout supports"
+                    )
+                fmt.append(f"H{field.max_len}s")
+                kinds.append((self.STR, field.max_len))
+            else:
+                raise ValueError(
+                    f"Field {name} of type {field.typ} has no binary layout"
+                )
+        self.kinds: Tuple[Tuple[int, Union[int, None]], ...] = tuple(kinds)
+        self.format = "".join(fmt)
+        self.struct = struct.Struct(self.format)
+        self.size = self.struct.size
+        self.signature = zlib.crc32(
+            (self.format + ",".join(self.columns)).encode("utf-8")
+        )
+        self.tombstone = bytes(self.size)
+
+    def pack(self, instance: BaseEntity) -> bytes:
+        """
+        :raises: ValueError if value does not fit in its column
+        """
+        nulls = 0
+        args: List[Any] = [1, 0]
+        for idx, ((kind, max_len), value) in enumerate(
+            zip(self.kinds, self.codec.dump(instance))
+        ):
+            if value is None:
+                nulls |= 1 << idx
+                args.extend((0,) if kind == self.INT else (0, b""))
+            elif kind == self.INT:
+                if not self.INT_MIN <= value <= self.INT_MAX:
+                    raise ValueError(
+                        f"Value of {self.columns[idx]} does not fit in int64: {value}"
+                    )
+                args.append(value)
+            else:
+                data = value.encode("utf-8")
+                if len(data) > max_len:
+                    raise ValueError(
+                        f"Value of {self.columns[idx]} takes {len(data)} bytes, "
+                        f"but only {max_len} fit in record"
+                    )
+                args.extend((len(data), data))
+        args[1] = nulls
+        return self.struct.pack(*args)
+
+    def unpack(self, data: bytes) -> Union[BaseEntity, None]:
+        """
+        Build instance from record bytes, returns None for deleted record.
+        """
+        raw = self.struct.unpack(data)
+        if not raw[0]:
+            return None
+        nulls = raw[1]
+        values = []
+        pos = 2
+        for idx, (kind, _) in enumerate(self.kinds):
+            if kind == self.INT:
+                value = raw[pos]
+                pos += 1
+            else:
+                value = raw[pos + 1][: raw[pos]].decode("utf-8")
+                pos += 2
+            values.append(None if nulls >> idx & 1 else value)
+        return self.codec.build_typed(values)
+
+
+class BinaryDataStorage(BaseFileDataStorage):
+    """
+    Storage of fixed-width binary records.
+
+    Record of id k lives at HEADER_SIZE + (k - 1) * record_size,
+    so get, update and delete by id are single seek with single
+    read or write. Deleted records are zeroed and their ids are never
+    reused. Records are not loaded into memory, only field indexes are
+    built on opening by one sequential pass over file.
+    Records are read and written with positional pread/pwrite, so threads
+    don't fight for shared file position.
+    """
+
+    file_format = "bin"
+    MAGIC = b"BLDB"
+    HEADER = struct.Struct("<4sIQ")
+    HEADER_SIZE = HEADER.size
+    READ_CHUNK = 1024
+
+    def _init(self, *args, **kwargs):
+        super()._init(*args, **kwargs)
+        self.layout = RecordLayout(self.model_class)
+        self.ensure_storage()
+        self._file = open(self.filepath, "r+b")
+        self._check_header()
+        self.latest_id = self.get_latest_id()
+        if self.indexes or self.fulltext:
+            for instance in self._iter_instances():
+                self._index_instance(instance)
+
+    def init_storage(self) -> None:
+        super().init_storage()
+        with open(self.filepath, "wb") as file:
+            file.write(self._header())
+
+    def _header(self) -> bytes:
+        return self.HEADER.pack(self.MAGIC, self.layout.size, self.layout.signature)
+
+    def _check_header(self) -> None:
+        self._file.seek(0)
+        header = self._file.read(self.HEADER_SIZE)
+        if not header:
+            self._file.write(self._header())
+            self._file.flush()
+            return
+        if header != self._header():
+            raise ValueError(
+                f"File {self.filepath} does not match layout of "
+                f"{self.model_class.__name__}. Was model changed?"
+            )
+
+    def _offset(self, id: int) -> int:
+        return self.HEADER_SIZE + (id - 1) * self.layout.size
+
+    def get_latest_id(self) -> int:
+        size = os.fstat(self._file.fileno()).st_size
+        return (size - self.HEADER_SIZE) // self.layout.size
+
+    def get(self, id: int) -> BaseEntity:
+        instance = self._lookup(id)
+        if not instance:
+            raise ValueError(f"No {self.model_class.__name__} with id {id}")
+        return instance
+
+    def _lookup(self, id: int) -> Union[BaseEntity, None]:
+        if not 0 < id <= self.latest_id:
+            return None
+        with self.lock.read_locked():
+            data = os.pread(self._file.fileno(), self.layout.size, self._offset(id))
+        if len(data) < self.layout.size:
+            # Id is allocated, but its record is not written yet
+            return None
+        return self.layout.unpack(data)
+
+    def save(self, instance: BaseEntity) -> None:
+        with self.lock.write_locked():
+            if not instance.id:
+                instance.id = self.id_allocator.allocate()
+                try:
+                    data = self.layout.pack(instance)
+                except (ValueError, struct.error):
+                    self.id_allocator.rewind(instance.id, instance.id - 1)
+                    instance.id = None
+                    raise
+            else:
+                if self._lookup(instance.id) is None:
+                    raise ValueError(
+                        f"No {self.model_class.__name__} with id {instance.id}"
+                    )
+                data = self.layout.pack(instance)
+            os.pwrite(self._file.fileno(), data, self._offset(instance.id))
+            self._index_instance(instance)
+
+    def delete(self, entity: Union[int, BaseEntity]) -> None:
+        self._delete(entity if isinstance(entity, int) else entity.id)
+
+    def _delete(self, id: int) -> None:
+        if not 0 < id <= self.latest_id:
+            return
+        with self.lock.write_locked():
+            os.pwrite(self._file.fileno(), self.layout.tombstone, self._offset(id))
+            self._unindex_instance(id)
+
+    def _iter_instances(self) -> Iterator[BaseEntity]:
+        """
+        Read records sequentially in chunks, skipping deleted ones.
+        """
+        size = self.layout.size
+        offset = self.HEADER_SIZE
+        end = self._offset(self.latest_id + 1)
+        while offset < end:
+            length = min(end - offset, size * self.READ_CHUNK)
+            with self.lock.read_locked():
+                chunk = os.pread(self._file.fileno(), length, offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            for start in range(0, len(chunk), size):
+                instance = self.layout.unpack(chunk[start : start + size])
+                if instance is not None:
+                    yield instance
+
+    def load_model_container(self):
+        container = self.container_class(self.model_class)
+        container.load(self._iter_instances())
+        return container
+
+    def close(self) -> None:
+        self._file.close()
@@ -0,0 +1,435 @@
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import islice
+from typing import Iterator, List, Tuple, Union
+
+from db.base import BaseEntity
+from db.binary_storage import RecordLayout
+from db.storage import BaseFileDataStorage
+
+
+class LeafPage:
+    __slots__ = ("number", "keys", "records", "next")
+
+    def __init__(
+        self,
+        number: int,
+        keys: List[int] = None,
+        records: List[bytes] = None,
+        next: int = 0,
+    ) -> None:
+        self.number = number
+        self.keys = keys if keys is not None else []
+        self.records = records if records is not None else []
+        self.next = next
+
+
+class InternalPage:
+    __slots__ = ("number", "keys", "children")
+
+    def __init__(self, number: int, keys: List[int], children: List[int]) -> None:
+        self.number = number
+        self.keys = keys
+        self.children = children
+
+
+class Pager:
+    """
+    Memory-mapped file of fixed-size pages with bounded LRU cache
+    of decoded pages. Pages are written through to the map
+    on every change, so cached pages are always clean and eviction
+    is just forgetting decoded copy.
+
+    Page 0 is meta page, other pages are leaf or internal pages:
+        leaf: type (B), count (H), next leaf (I), count * (key (q), record)
+        internal: type (B), count (H), first child (I), count * (key (q), child (I))
+    """
+
+    MAGIC = b"BLBT"
+    META = struct.Struct("<4sIIQIIQ")
+    HEADER = struct.Struct("<BHI")
+    KEY = struct.Struct("<q")
+    PAIR = struct.Struct("<qI")
+    LEAF = 1
+    INTERNAL = 2
+    GROW_PAGES = 64
+
+    def __init__(
+        self,
+        filepath: str,
+        layout: RecordLayout,
+        page_size: int = 4096,
+        cache_size: int = 256,
+    ) -> None:
+        self.filepath = filepath
+        self.record_size = layout.size
+        self.signature = layout.signature
+        self.page_size = page_size
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[int, Union[LeafPage, InternalPage]]" = OrderedDict()
+        # Readers share the pager, so cache bookkeeping needs its own lock
+        self.cache_lock = threading.Lock()
+        self.file = open(filepath, "r+b")
+
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(self.page_size * self.GROW_PAGES)
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+            self.root = 1
+            self.page_count = 2
+            self.latest_id = 0
+            self.write_meta()
+            self.write(LeafPage(1))
+        else:
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+            self._read_meta()
+
+    def _read_meta(self) -> None:
+        (
+            magic,
+            page_size,
+            record_size,
+            signature,
+            self.root,
+            self.page_count,
+            self.latest_id,
+        ) = self.META.unpack_from(self.mm, 0)
+        if (magic, record_size, signature) != (
+            self.MAGIC,
+            self.record_size,
+            self.signature,
+        ):
+            raise ValueError(
+                f"File {self.filepath} does not match record layout. "
+                "Was model changed?"
+            )
+        self.page_size = page_size
+
+    def write_meta(self) -> None:
+        self.META.pack_into(
+            self.mm,
+            0,
+            self.MAGIC,
+            self.page_size,
+            self.record_size,
+            self.signature,
+            self.root,
+            self.page_count,
+            self.latest_id,
+        )
+
+    def read(self, number: int) -> Union[LeafPage, InternalPage]:
+        with self.cache_lock:
+            page = self.cache.get(number)
+            if page is not None:
+                self.cache.move_to_end(number)
+                return page
+        page = self._decode(number)
+        self._remember(page)
+        return page
+
+    def write(self, page: Union[LeafPage, InternalPage]) -> None:
+        start = page.number * self.page_size
+        self.mm[start : start + self.page_size] = self._encode(page)
+        self._remember(page)
+
+    def _remember(self, page: Union[LeafPage, InternalPage]) -> None:
+        with self.cache_lock:
+            self.cache[page.number] = page
+            self.cache.move_to_end(page.number)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def allocate(self) -> int:
+        number = self.page_count
+        self.page_count += 1
+        if self.page_count * self.page_size > len(self.mm):
+            self.mm.close()
+            self.file.truncate((self.page_count + self.GROW_PAGES) * self.page_size)
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.write_meta()
+        return number
+
+    def _encode(self, page: Union[LeafPage, InternalPage]) -> bytearray:
+        buf = bytearray(self.page_size)
+        offset = self.HEADER.size
+        if isinstance(page, LeafPage):
+            self.HEADER.pack_into(buf, 0, self.LEAF, len(page.keys), page.next)
+            entry = self.KEY.size + self.record_size
+            for key, record in zip(page.keys, page.records):
+                self.KEY.pack_into(buf, offset, key)
+                buf[offset + self.KEY.size : offset + entry] = record
+                offset += entry
+        else:
+            self.HEADER.pack_into(
+                buf, 0, self.INTERNAL, len(page.keys), page.children[0]
+            )
+            for key, child in zip(page.keys, page.children[1:]):
+                self.PAIR.pack_into(buf, offset, key, child)
+                offset += self.PAIR.size
+        return buf
+
+    def _decode(self, number: int) -> Union[LeafPage, InternalPage]:
+        start = number * self.page_size
+        kind, count, link = self.HEADER.unpack_from(self.mm, start)
+        offset = start + self.HEADER.size
+        if kind == self.LEAF:
+            entry = self.KEY.size + self.record_size
+            keys, records = [], []
+            for _ in range(count):
+                keys.append(self.KEY.unpack_from(self.mm, offset)[0])
+                records.append(self.mm[offset + self.KEY.size : offset + entry])
+                offset += entry
+            return LeafPage(number, keys, records, link)
+        keys, children = [], [link]
+        for key, child in self.PAIR.iter_unpack(
+            self.mm[offset : offset + count * self.PAIR.size]
+        ):
+            keys.append(key)
+            children.append(child)
+        return InternalPage(number, keys, children)
+
+    def flush(self) -> None:
+        self.mm.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.mm.close()
+        self.file.close()
+
+
+class BPlusTree:
+    """
+    B+tree of fixed-size records keyed by integer id, stored in pager pages.
+    Leaves are linked for ordered scans. Appending key greater than
+    all others splits off a new rightmost page instead of halving,
+    so sequentially allocated ids fill pages completely.
+    Deleted keys are removed from their leaves without merging pages.
+    """
+
+    def __init__(self, pager: Pager) -> None:
+        self.pager = pager
+        header = Pager.HEADER.size
+        self.leaf_capacity = (pager.page_size - header) // (
+            Pager.KEY.size + pager.record_size
+        )
+        self.internal_capacity = (pager.page_size - header) // Pager.PAIR.size
+        if self.leaf_capacity < 2:
+            raise ValueError(
+                f"Record of {pager.record_size} bytes does not fit "
+                f"into {pager.page_size} bytes page"
+            )
+
+    def _find_leaf(self, key: int) -> Tuple[LeafPage, List[Tuple[InternalPage, int]]]:
+        path = []
+        page = self.pager.read(self.pager.root)
+        while isinstance(page, InternalPage):
+            idx = bisect_right(page.keys, key)
+            path.append((page, idx))
+            page = self.pager.read(page.children[idx])
+        return page, path
+
+    def search(self, key: int) -> Union[bytes, None]:
+        leaf, _ = self._find_leaf(key)
+        idx = bisect_left(leaf.keys, key)
+        if idx < len(leaf.keys) and leaf.keys[idx] == key:
+            return leaf.records[idx]
+        return None
+
+    def insert(self, key: int, record: bytes) -> None:
+        leaf, path = self._find_leaf(key)
+        idx = bisect_left(leaf.keys, key)
+        if idx < len(leaf.keys) and leaf.keys[idx] == key:
+            leaf.records[idx] = record
+            self.pager.write(leaf)
+            return
+
+        leaf.keys.insert(idx, key)
+        leaf.records.insert(idx, record)
+        if len(leaf.keys) <= self.leaf_capacity:
+            self.pager.write(leaf)
+            return
+
+        appended = idx == len(leaf.keys) - 1 and not leaf.next
+        split = len(leaf.keys) - 1 if appended else len(leaf.keys) // 2
+        new_leaf = LeafPage(
+            self.pager.allocate(), leaf.keys[split:], leaf.records[split:], leaf.next
+        )
+        del leaf.keys[split:]
+        del leaf.records[split:]
+        leaf.next = new_leaf.number
+        self.pager.write(new_leaf)
+        self.pager.write(leaf)
+        self._insert_into_parent(path, new_leaf.keys[0], new_leaf.number)
+
+    def _insert_into_parent(
+        self, path: List[Tuple[InternalPage, int]], key: int, right: int
+    ) -> None:
+        while path:
+            parent, idx = path.pop()
+            parent.keys.insert(idx, key)
+            parent.children.insert(idx + 1, right)
+            if len(parent.keys) <= self.internal_capacity:
+                self.pager.write(parent)
+                return
+
+            appended = idx == len(parent.keys) - 1
+            mid = len(parent.keys) - 1 if appended else len(parent.keys) // 2
+            key = parent.keys[mid]
+            new_page = InternalPage(
+                self.pager.allocate(),
+                parent.keys[mid + 1 :],
+                parent.children[mid + 1 :],
+            )
+            del parent.keys[mid:]
+            del parent.children[mid + 1 :]
+            self.pager.write(new_page)
+            self.pager.write(parent)
+            right = new_page.number
+
+        old_root = self.pager.root
+        root = InternalPage(self.pager.allocate(), [key], [old_root, right])
+        self.pager.write(root)
+        self.pager.root = root.number
+        self.pager.write_meta()
+
+    def delete(self, key: int) -> bool:
+        leaf, _ = self._find_leaf(key)
+        idx = bisect_left(leaf.keys, key)
+        if idx == len(leaf.keys) or leaf.keys[idx] != key:
+            return False
+        del leaf.keys[idx]
+        del leaf.records[idx]
+        self.pager.write(leaf)
+        return True
+
+    def iter_from(self, key: int = None) -> Iterator[Tuple[int, bytes]]:
+        """
+        Iterate (key, record) pairs in key order, starting from given key,
+        following links between leaves.
+        """
+        if key is None:
+            page = self.pager.read(self.pager.root)
+            while isinstance(page, InternalPage):
+                page = self.pager.read(page.children[0])
+            idx = 0
+        else:
+            page, _ = self._find_leaf(key)
+            idx = bisect_left(page.keys, key)
+        while True:
+            keys, records = page.keys, page.records
+            for pos in range(idx, len(keys)):
+                yield keys[pos], records[pos]
+            if not page.next:
+                return
+            page = self.pager.read(page.next)
+            idx = 0
+
+
+class BTreeDataStorage(BaseFileDataStorage):
+    """
+    Disk-resident storage, which does not load records into memory.
+
+    Records are kept in fixed-size pages of memory-mapped file,
+    indexed by on-disk B+tree on id. Only bounded number of decoded pages
+    is cached, so lookup costs a few page reads regardless of table size.
+    Records use the same binary layout as BinaryDataStorage.
+    Lookups run under read lock, so they may go in parallel,
+    writes change pages under write lock.
+    """
+
+    file_format = "btree"
+    READ_CHUNK = 1024
+
+    def __init__(
+        self,
+        page_cache_size: int = 256,
+        page_size: int = 4096,
+        container_class: Union[type, None] = None,
+    ) -> None:
+        super().__init__(container_class)
+        self.page_cache_size = page_cache_size
+        self.page_size = page_size
+
+    def _init(self, *args, **kwargs):
+        super()._init(*args, **kwargs)
+        self.layout = RecordLayout(self.model_class)
+        self.ensure_storage()
+        self.pager = Pager(
+            self.filepath, self.layout, self.page_size, self.page_cache_size
+        )
+        self.tree = BPlusTree(self.pager)
+        self.latest_id = self.get_latest_id()
+        if self.indexes or self.fulltext:
+            for instance in self._iter_instances():
+                self._index_instance(instance)
+
+    def get_latest_id(self) -> int:
+        return self.pager.latest_id
+
+    def get(self, id: int) -> BaseEntity:
+        instance = self._lookup(id)
+        if not instance:
+            raise ValueError(f"No {self.model_class.__name__} with id {id}")
+        return instance
+
+    def _lookup(self, id: int) -> Union[BaseEntity, None]:
+        with self.lock.read_locked():
+            record = self.tree.search(id)
+        return self.layout.unpack(record) if record is not None else None
+
+    def save(self, instance: BaseEntity) -> None:
+        with self.lock.write_locked():
+            if not instance.id:
+                instance.id = self.id_allocator.allocate()
+                try:
+                    record = self.layout.pack(instance)
+                except (ValueError, struct.error):
+                    self.id_allocator.rewind(instance.id, instance.id - 1)
+                    instance.id = None
+                    raise
+                self.pager.latest_id = self.latest_id
+                self.pager.write_meta()
+            else:
+                if self.tree.search(instance.id) is None:
+                    raise ValueError(
+                        f"No {self.model_class.__name__} with id {instance.id}"
+                    )
+                record = self.layout.pack(instance)
+            self.tree.insert(instance.id, record)
+            self._index_instance(instance)
+
+    def delete(self, entity: Union[int, BaseEntity]) -> None:
+        self._delete(entity if isinstance(entity, int) else entity.id)
+
+    def _delete(self, id: int) -> None:
+        with self.lock.write_locked():
+            if self.tree.delete(id):
+                self._unindex_instance(id)
+
+    def _iter_instances(self) -> Iterator[BaseEntity]:
+        """
+        Iterate records in id order. Records are copied in chunks under
+        read lock, next chunk continues after the last seen id,
+        so writers are not blocked for the whole iteration.
+        """
+        key = None
+        while True:
+            with self.lock.read_locked():
+                chunk = list(islice(self.tree.iter_from(key), self.READ_CHUNK))
+            for _, record in chunk:
+                yield self.layout.unpack(record)
+            if len(chunk) < self.READ_CHUNK:
+                return
+            key = chunk[-1][0] + 1
+
+    def load_model_container(self):
+        container = self.container_class(self.model_class)
+        container.load(self._iter_instances())
+        return container
+
+    def close(self) -> None:
+        self.pager.close()
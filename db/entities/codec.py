@@ -0,0 +1,82 @@
+from operator import attrgetter
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+
+def _int_or_none(value: str) -> Any:
+    return None if value == "None" else int(value)
+
+
+def _as_is(value: str) -> str:
+    return value
+
+
+CONVERTERS: Dict[type, Callable[[str], Any]] = {
+    int: _int_or_none,
+    str: _as_is,
+}
+
+
+class RowCodec:
+    """
+    Row layout of model, compiled once when model class is created.
+
+    Columns are field names in storage order (sorted by name),
+    each with converter from its text form. Rows are built by writing
+    slots directly, skipping validation, since storages hold only
+    values, that were validated on their way in.
+    """
+
+    def __init__(self, model_class: type) -> None:
+        fields = model_class._fields
+        self.model_class = model_class
+        self.columns: Tuple[str, ...] = tuple(sorted(fields))
+        self.converters: Tuple[Callable[[str], Any], ...] = tuple(
+            CONVERTERS.get(fields[name].typ, fields[name].typ)
+            for name in self.columns
+        )
+        self.setters = tuple(
+            getattr(model_class, name).__set__ for name in self.columns
+        )
+        self._getter = attrgetter(*self.columns) if self.columns else None
+        self._plan = tuple(zip(self.setters, self.converters))
+
+    def build(self, values: Sequence[str]) -> Any:
+        """
+        Create model instance from text values, ordered as columns.
+        """
+        if len(values) != len(self._plan):
+            raise ValueError(
+                f"Expected {len(self._plan)} values for "
+                f"{self.model_class.__name__}, got {len(values)}"
+            )
+        instance = self.model_class.__new__(self.model_class)
+        for (setter, convert), value in zip(self._plan, values):
+            setter(instance, convert(value))
+        return instance
+
+    def build_typed(self, values: Sequence[Any]) -> Any:
+        """
+        Create model instance from already converted values, ordered as columns.
+        """
+        instance = self.model_class.__new__(self.model_class)
+        for setter, value in zip(self.setters, values):
+            setter(instance, value)
+        return instance
+
+    def dump(self, instance: Any) -> Tuple[Any, ...]:
+        """
+        Values of instance, ordered as columns.
+        """
+        if len(self.columns) == 1:
+            return (self._getter(instance),)
+        return self._getter(instance)
+
+    def copy(self, instance: Any) -> Any:
+        """
+        New instance with the same values, e.g. to change it
+        without touching the stored one.
+        """
+        return self.build_typed(self.dump(instance))
+
+    def dump_text(self, instance: Any) -> Tuple[str, ...]:
+        return tuple(map(str, self.dump(instance)))
@@ -4,13 +4,15 @@ from db.base import BaseEntityField
 class IntegerField(BaseEntityField):
     typ = int
 
-    def __init__(self, max_value: int = None, required=False, default=None):
-        super().__init__(required, default)
+    def __init__(
+        self, max_value: int = None, required=False, default=None, indexed=False
+    ):
+        super().__init__(required, default, indexed)
         self.max_value = max_value
 
     def validate(self, value: int) -> None:
         super().validate(value)
-        if hasattr(self, "max_value") and self.max_value:
+        if self.max_value is not None and value is not None:
             if value > self.max_value:
                 raise ValueError(f"Value must be less than {self.max_value}")
 
@@ -18,21 +20,36 @@ class IntegerField(BaseEntityField):
 class StringField(BaseEntityField):
     typ = str
 
-    def __init__(self, max_len: int, required=False, default=None):
-        super().__init__(required, default)
+    def __init__(
+        self,
+        max_len: int,
+        required=False,
+        default=None,
+        indexed=False,
+        fulltext=False,
+    ):
+        """
+        :param indexed: bool or str. Index type, see db.layers.indexes.
+            "prefix" index serves `field__startswith` lookups
+            and storage.autocomplete.
+        :param fulltext: bool. Keep full-text index of words in values,
+            searched with storage.search_text or `field__search` lookup.
+        """
+        super().__init__(required, default, indexed)
         self.max_len = max_len
+        self.fulltext = fulltext
 
     def validate(self, value: str):
         super().validate(value)
-        if hasattr(self, "value") and len(value) > self.max_len:
+        if value is not None and len(value) > self.max_len:
             raise ValueError(f"Value must be less than {self.max_len} characters")
 
 
 class ForeignKeyField(BaseEntityField):
     typ = int
 
-    def __init__(self, model, required=False, default=None):
-        super().__init__(required, default)
+    def __init__(self, model, required=False, default=None, indexed=False):
+        super().__init__(required, default, indexed)
         self.model = model
 
     def validate(self, value: int):
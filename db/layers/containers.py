@@ -1,22 +1,30 @@
-from typing import Union
+import sys
+import threading
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import chain, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Union
 from db.base import BaseEntity, BaseModelContainer
-from src.utils.data_structures.binary_search_tree import AVLTree
+from src.utils.algorithms import bin_search
+from src.utils.concurrency import RWLock
+from src.utils.data_structures.binary_search_tree import AVLTree, NotSortedError
+from src.utils.data_structures.cache import CACHE_POLICIES
 
 
-class AVLTreeModelContainer(BaseModelContainer):
+class EntityModelContainer(BaseModelContainer):
+    """
+    Common part of containers, which hold model instances keyed by id.
+    """
 
     def __init__(self, entity_class: BaseEntity):
         self.entity_class = entity_class
         self.key_getter = lambda x: x.id
-        self.tree = AVLTree(key_getter=self.key_getter)
 
     def _get_key(self, instance) -> Union[int, str]:
         return self.key_getter(instance)
 
-    def insert(self, value):
-        self._ensure_instance(value)
-        self.tree.insert(value)
-
     def _ensure_instance(self, value):
         if not isinstance(value, self.entity_class):
             raise ValueError(f"Value must be instance of {self.entity_class.__name__}")
@@ -28,11 +36,576 @@ class AVLTreeModelContainer(BaseModelContainer):
             return action(self._get_key(value))
         self._ensure_instance(value)
 
+
+class AVLTreeModelContainer(EntityModelContainer):
+
+    def __init__(self, entity_class: BaseEntity):
+        super().__init__(entity_class)
+        self.tree = AVLTree(key_getter=self.key_getter)
+
+    def insert(self, value):
+        self._ensure_instance(value)
+        self.tree.insert(value)
+
+    def load(self, values):
+        """
+        Build balanced tree in O(n), when values come ordered by id,
+        otherwise fall back to inserting them one by one.
+        """
+        values = iter(values)
+        consumed = []
+
+        def consume():
+            for value in values:
+                self._ensure_instance(value)
+                consumed.append(value)
+                yield value
+
+        try:
+            self.tree = AVLTree.from_sorted(consume(), key_getter=self.key_getter)
+        except NotSortedError:
+            # Errors of values themselves are not caught, they stop loading
+            self.tree = AVLTree(key_getter=self.key_getter)
+            for value in chain(consumed, values):
+                self.insert(value)
+
     def search(self, value):
         return self._call_action(self.tree.search, value)
 
     def delete(self, value):
         return self._call_action(self.tree.delete, value)
 
+    def range(self, lo: Union[int, None] = None, hi: Union[int, None] = None):
+        for _, value in self.tree.range(lo, hi):
+            yield value
+
+    def iter_from(
+        self, key: Union[int, None] = None, limit: int = None, inclusive: bool = True
+    ):
+        for _, value in self.tree.iter_from(key, limit, inclusive):
+            yield value
+
+    def floor(self, key: int):
+        return self._value_of(self.tree.floor(key))
+
+    def ceiling(self, key: int):
+        return self._value_of(self.tree.ceiling(key))
+
+    def successor(self, key: int):
+        return self._value_of(self.tree.successor(key))
+
+    def _value_of(self, pair):
+        return pair[1] if pair else None
+
+    def __iter__(self):
+        for _, value in self.tree.in_order():
+            yield value
+
+    def __len__(self):
+        return len(self.tree)
+
     def __str__(self):
         return str(self.tree)
+
+
+class DictModelContainer(EntityModelContainer):
+    """
+    Hash map container with O(1) search, insert and delete by id.
+
+    Iteration keeps id order for free, while ids are inserted ascending,
+    which is the usual case for storages. Ordered operations
+    (range, floor, ...) use sorted ids list, which is built lazily
+    and dropped on every insert or delete of id.
+    """
+
+    def __init__(self, entity_class: BaseEntity):
+        super().__init__(entity_class)
+        self.items: Dict[int, BaseEntity] = {}
+        self.is_ordered = True
+        self._last_key: Union[int, None] = None
+        self._sorted_keys: Union[List[int], None] = None
+
+    def insert(self, value):
+        self._ensure_instance(value)
+        key = self._get_key(value)
+        if key not in self.items:
+            if self.items and key < self._last_key:
+                self.is_ordered = False
+            self._last_key = key
+            self._sorted_keys = None
+        self.items[key] = value
+
+    def search(self, value):
+        return self._call_action(self.items.get, value)
+
+    def delete(self, value):
+        return self._call_action(self._delete, value)
+
+    def _delete(self, key: int) -> None:
+        if self.items.pop(key, None) is not None:
+            self._sorted_keys = None
+
+    def _keys(self) -> List[int]:
+        if self._sorted_keys is None:
+            self._sorted_keys = (
+                list(self.items) if self.is_ordered else sorted(self.items)
+            )
+        return self._sorted_keys
+
+    def range(self, lo: Union[int, None] = None, hi: Union[int, None] = None):
+        keys = self._keys()
+        start = 0 if lo is None else bisect_left(keys, lo)
+        end = len(keys) if hi is None else bisect_right(keys, hi)
+        for key in keys[start:end]:
+            yield self.items[key]
+
+    def iter_from(
+        self, key: Union[int, None] = None, limit: int = None, inclusive: bool = True
+    ):
+        keys = self._keys()
+        if key is None:
+            start = 0
+        else:
+            start = bisect_left(keys, key) if inclusive else bisect_right(keys, key)
+        end = len(keys) if limit is None else start + limit
+        for found in keys[start:end]:
+            yield self.items[found]
+
+    def floor(self, key: int):
+        keys = self._keys()
+        idx = bisect_right(keys, key)
+        return self.items[keys[idx - 1]] if idx else None
+
+    def ceiling(self, key: int):
+        keys = self._keys()
+        idx = bisect_left(keys, key)
+        return self.items[keys[idx]] if idx < len(keys) else None
+
+    def successor(self, key: int):
+        keys = self._keys()
+        idx = bisect_right(keys, key)
+        return self.items[keys[idx]] if idx < len(keys) else None
+
+    def __iter__(self):
+        if self.is_ordered:
+            return iter(self.items.values())
+        return (self.items[key] for key in self._keys())
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SortedArrayModelContainer(EntityModelContainer):
+    """
+    Read optimised container. Ids are kept in compact array('q'),
+    sorted ascending, with parallel list of instances.
+
+    Search is binary search, ordered operations are bisect plus slicing.
+    Appending id greater than all others is O(1), any other insert
+    or delete shifts arrays and costs O(n).
+    """
+
+    def __init__(self, entity_class: BaseEntity):
+        super().__init__(entity_class)
+        self.ids = array("q")
+        self.values: List[BaseEntity] = []
+
+    def insert(self, value):
+        self._ensure_instance(value)
+        key = self._get_key(value)
+        if not self.ids or key > self.ids[-1]:
+            self.ids.append(key)
+            self.values.append(value)
+            return
+        idx = bisect_left(self.ids, key)
+        if self.ids[idx] == key:
+            self.values[idx] = value
+        else:
+            self.ids.insert(idx, key)
+            self.values.insert(idx, value)
+
+    def load(self, values):
+        values = iter(values)
+        for value in values:
+            self._ensure_instance(value)
+            key = self._get_key(value)
+            if self.ids and key <= self.ids[-1]:
+                self.insert(value)
+                break
+            self.ids.append(key)
+            self.values.append(value)
+        for value in values:
+            self.insert(value)
+
+    def search(self, value):
+        return self._call_action(self._search, value)
+
+    def _search(self, key: int) -> Union[BaseEntity, None]:
+        idx = bin_search(self.ids, key)
+        return self.values[idx] if idx >= 0 else None
+
+    def delete(self, value):
+        return self._call_action(self._delete, value)
+
+    def _delete(self, key: int) -> None:
+        idx = bin_search(self.ids, key)
+        if idx >= 0:
+            del self.ids[idx]
+            del self.values[idx]
+
+    def range(self, lo: Union[int, None] = None, hi: Union[int, None] = None):
+        start = 0 if lo is None else bisect_left(self.ids, lo)
+        end = len(self.ids) if hi is None else bisect_right(self.ids, hi)
+        return iter(self.values[start:end])
+
+    def iter_from(
+        self, key: Union[int, None] = None, limit: int = None, inclusive: bool = True
+    ):
+        if key is None:
+            start = 0
+        elif inclusive:
+            start = bisect_left(self.ids, key)
+        else:
+            start = bisect_right(self.ids, key)
+        end = len(self.values) if limit is None else start + limit
+        return iter(self.values[start:end])
+
+    def floor(self, key: int):
+        idx = bisect_right(self.ids, key)
+        return self.values[idx - 1] if idx else None
+
+    def ceiling(self, key: int):
+        idx = bisect_left(self.ids, key)
+        return self.values[idx] if idx < len(self.ids) else None
+
+    def successor(self, key: int):
+        idx = bisect_right(self.ids, key)
+        return self.values[idx] if idx < len(self.ids) else None
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class CachedModelContainer(EntityModelContainer):
+    """
+    Bounded identity map for tables, which don't fit in memory.
+
+    Ids of all instances are kept in sorted array('q'), but instances
+    themselves only while they are hot: up to `max_entries` of them
+    or `max_bytes` of their estimated size. Cold instances are evicted
+    by LRU or LFU policy and read back with `loader` on demand.
+
+    There is never more than one live object per id. Evicted instance,
+    which is still referenced by caller, is remembered by weak reference
+    and given back instead of being read again. Scans (iteration, ranges)
+    don't push hot instances out: instances, read by scan, are not
+    admitted into cache.
+
+    Lookups may read from disk, so they are guarded by internal mutex,
+    reads themselves are done outside of it.
+    """
+
+    SCAN_CHUNK = 256
+
+    def __init__(
+        self,
+        entity_class: BaseEntity,
+        loader: Callable[[List[int]], Iterator[BaseEntity]],
+        max_entries: Union[int, None] = None,
+        max_bytes: Union[int, None] = None,
+        policy: str = "lru",
+    ):
+        """
+        :param loader: Callable, which reads instances of given ids from disk,
+            in the same order.
+        :param max_entries: int. Max number of cached instances.
+        :param max_bytes: int. Max estimated size of cached instances.
+        :param policy: str. "lru" or "lfu".
+        :raises: ValueError if policy is unknown or no limit is given
+        """
+        super().__init__(entity_class)
+        if policy not in CACHE_POLICIES:
+            raise ValueError(
+                f"Unknown cache policy {policy!r}. Choose one of {list(CACHE_POLICIES)}"
+            )
+        if max_entries is None and max_bytes is None:
+            raise ValueError("Cache needs max_entries or max_bytes limit")
+        self.loader = loader
+        self.ids = array("q")
+        self.cache = CACHE_POLICIES[policy](max_entries, max_bytes, self._evicted)
+        self.measure = max_bytes is not None
+        self.live: "weakref.WeakValueDictionary[int, BaseEntity]" = (
+            weakref.WeakValueDictionary()
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._mutex = threading.Lock()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "cached": len(self.cache),
+            "cached_bytes": self.cache.weight if self.measure else 0,
+            "size": len(self.ids),
+        }
+
+    def _evicted(self, id: int, instance: BaseEntity) -> None:
+        self.evictions += 1
+        self.live[id] = instance
+
+    def _size_of(self, instance: BaseEntity) -> int:
+        if not self.measure:
+            return 1
+        return sys.getsizeof(instance) + sum(
+            map(sys.getsizeof, self.entity_class._codec.dump(instance))
+        )
+
+    def _admit(self, instance: BaseEntity) -> None:
+        self.live.pop(instance.id, None)
+        self.cache.put(instance.id, instance, self._size_of(instance))
+
+    def insert(self, value):
+        self._ensure_instance(value)
+        key = self._get_key(value)
+        with self._mutex:
+            if not self.ids or key > self.ids[-1]:
+                self.ids.append(key)
+            else:
+                idx = bisect_left(self.ids, key)
+                if self.ids[idx] != key:
+                    self.ids.insert(idx, key)
+            self._admit(value)
+
+    def load(self, values):
+        """
+        Collect ids of all values into array, sorting it once at the end
+        when they come out of order, and admit into cache only the last
+        values, which fit into it. The rest are dropped right away:
+        nobody holds instances of loading yet.
+        """
+        ids = array("q", self.ids)
+        ordered = True
+        max_entries, max_weight = self.cache.max_entries, self.cache.max_weight
+        recent = deque(maxlen=max_entries)
+        weight = 0
+        for value in values:
+            self._ensure_instance(value)
+            key = self._get_key(value)
+            if ids and key <= ids[-1]:
+                ordered = False
+            ids.append(key)
+            if max_weight is None:
+                recent.append((value, 1))
+                continue
+            if len(recent) == max_entries:
+                weight -= recent[0][1]
+            size = self._size_of(value)
+            recent.append((value, size))
+            weight += size
+            while weight > max_weight and len(recent) > 1:
+                weight -= recent.popleft()[1]
+        if not ordered:
+            # Value, loaded later, replaces one of the same id
+            ids = array("q", sorted(set(ids)))
+        on_evict, self.cache.on_evict = self.cache.on_evict, None
+        try:
+            with self._mutex:
+                self.ids = ids
+                for value, size in recent:
+                    self.live.pop(value.id, None)
+                    self.cache.put(value.id, value, size)
+        finally:
+            self.cache.on_evict = on_evict
+
+    def search(self, value):
+        return self._call_action(self._search, value)
+
+    def _search(self, key: int) -> Union[BaseEntity, None]:
+        with self._mutex:
+            instance = self._cached(key, admit=True)
+            if instance is not None or bin_search(self.ids, key) < 0:
+                return instance
+            self.misses += 1
+        (instance,) = self.loader([key])
+        with self._mutex:
+            # Other thread may have read it meanwhile, its object wins
+            found = self._cached(key, admit=True)
+            if found is not None:
+                return found
+            self._admit(instance)
+        return instance
+
+    def _cached(self, key: int, admit: bool) -> Union[BaseEntity, None]:
+        """
+        Find instance in cache or among live evicted ones.
+        Live instance is admitted back into cache, unless `admit` is False.
+        """
+        instance = self.cache.get(key) if admit else self.cache.peek(key)
+        if instance is None:
+            instance = self.live.get(key)
+            if instance is not None and admit:
+                self._admit(instance)
+        if instance is not None:
+            self.hits += 1
+        return instance
+
+    def _fetch(self, keys: Iterable[int]) -> Iterator[BaseEntity]:
+        """
+        Iterate instances of keys for scans, reading missing ones
+        from disk in chunks. Instances, read by scan, are only
+        remembered as live ones, not cached.
+        """
+        keys = iter(keys)
+        while True:
+            chunk = list(islice(keys, self.SCAN_CHUNK))
+            if not chunk:
+                return
+            with self._mutex:
+                found = {}
+                for key in chunk:
+                    instance = self._cached(key, admit=False)
+                    if instance is not None:
+                        found[key] = instance
+                missing = [key for key in chunk if key not in found]
+                self.misses += len(missing)
+            loaded = dict(zip(missing, self.loader(missing)))
+            with self._mutex:
+                for key, instance in loaded.items():
+                    known = self._cached(key, admit=False)
+                    if known is None:
+                        self.live[key] = instance
+                    else:
+                        loaded[key] = known
+            found.update(loaded)
+            for key in chunk:
+                yield found[key]
+
+    def delete(self, value):
+        return self._call_action(self._delete, value)
+
+    def _delete(self, key: int) -> None:
+        with self._mutex:
+            idx = bin_search(self.ids, key)
+            if idx >= 0:
+                del self.ids[idx]
+            self.cache.pop(key)
+            self.live.pop(key, None)
+
+    def range(self, lo: Union[int, None] = None, hi: Union[int, None] = None):
+        start = 0 if lo is None else bisect_left(self.ids, lo)
+        end = len(self.ids) if hi is None else bisect_right(self.ids, hi)
+        return self._fetch(self.ids[start:end])
+
+    def iter_from(
+        self, key: Union[int, None] = None, limit: int = None, inclusive: bool = True
+    ):
+        if key is None:
+            start = 0
+        elif inclusive:
+            start = bisect_left(self.ids, key)
+        else:
+            start = bisect_right(self.ids, key)
+        end = len(self.ids) if limit is None else start + limit
+        return self._fetch(self.ids[start:end])
+
+    def floor(self, key: int):
+        idx = bisect_right(self.ids, key)
+        return self._search(self.ids[idx - 1]) if idx else None
+
+    def ceiling(self, key: int):
+        idx = bisect_left(self.ids, key)
+        return self._search(self.ids[idx]) if idx < len(self.ids) else None
+
+    def successor(self, key: int):
+        idx = bisect_right(self.ids, key)
+        return self._search(self.ids[idx]) if idx < len(self.ids) else None
+
+    def __iter__(self):
+        return self._fetch(self.ids[:])
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class LockedModelContainer(BaseModelContainer):
+    """
+    Thread-safe proxy around any container, guarded by reader-writer lock.
+
+    Lookups run under read lock, so many threads read in parallel,
+    inserts and deletes run under write lock. Iteration reads pages of
+    PAGE_SIZE instances with keyset pagination, taking the lock per page,
+    so lock is never held while consumer handles yielded instances.
+    """
+
+    PAGE_SIZE = 256
+
+    def __init__(self, container: BaseModelContainer, lock: RWLock = None):
+        self.container = container
+        self.lock = lock or RWLock()
+        self.key_getter = getattr(container, "key_getter", lambda x: x.id)
+
+    def insert(self, value):
+        with self.lock.write_locked():
+            return self.container.insert(value)
+
+    def delete(self, value):
+        with self.lock.write_locked():
+            return self.container.delete(value)
+
+    def load(self, values):
+        with self.lock.write_locked():
+            return self.container.load(values)
+
+    def search(self, value):
+        with self.lock.read_locked():
+            return self.container.search(value)
+
+    def floor(self, key):
+        with self.lock.read_locked():
+            return self.container.floor(key)
+
+    def ceiling(self, key):
+        with self.lock.read_locked():
+            return self.container.ceiling(key)
+
+    def successor(self, key):
+        with self.lock.read_locked():
+            return self.container.successor(key)
+
+    def iter_from(self, key=None, limit=None, inclusive=True):
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = self.PAGE_SIZE
+            if remaining is not None:
+                size = min(size, remaining)
+            with self.lock.read_locked():
+                page = list(self.container.iter_from(key, size, inclusive))
+            yield from page
+            if len(page) < size:
+                return
+            key, inclusive = self.key_getter(page[-1]), False
+            if remaining is not None:
+                remaining -= len(page)
+
+    def range(self, lo=None, hi=None):
+        for value in self.iter_from(lo):
+            if hi is not None and self.key_getter(value) > hi:
+                return
+            yield value
+
+    def __iter__(self):
+        return self.iter_from()
+
+    def __len__(self):
+        with self.lock.read_locked():
+            return len(self.container)
+
+    def __str__(self):
+        with self.lock.read_locked():
+            return str(self.container)
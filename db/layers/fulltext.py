@@ -0,0 +1,233 @@
+import heapq
+import marshal
+import math
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Set, Tuple, Union
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: Union[str, None]) -> List[str]:
+    """
+    Split text into case folded words. Tokens are interned,
+    so every term is kept in memory once, however many documents have it.
+    """
+    if not text:
+        return []
+    return [sys.intern(token) for token in TOKEN_RE.findall(text.casefold())]
+
+
+class FullTextIndex:
+    """
+    Inverted index of words in StringField values.
+
+    Every term has posting list: array of ids, which contain the term,
+    kept sorted, and parallel array of term frequencies. New records
+    get growing ids, so postings are mostly appended to.
+    Index also remembers terms of each id, so record can be unindexed
+    without knowing its old value.
+
+    Results are ranked by BM25.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    FORMAT_VERSION = 1
+
+    def __init__(self, field_name: str) -> None:
+        self.field_name = field_name
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+    def update(self, id: int, value: Union[str, None]) -> None:
+        self.remove(id)
+        self.add(id, value)
+
+    def add(self, id: int, value: Union[str, None]) -> None:
+        tokens = tokenize(value)
+        if not tokens:
+            return
+        counts = Counter(tokens)
+        for term, count in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array("q"), array("I"))
+            ids, freqs = posting
+            if not ids or id > ids[-1]:
+                ids.append(id)
+                freqs.append(count)
+            else:
+                idx = bisect_left(ids, id)
+                ids.insert(idx, id)
+                freqs.insert(idx, count)
+        self.doc_terms[id] = tuple(counts)
+        self.lengths[id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove(self, id: int) -> None:
+        terms = self.doc_terms.pop(id, None)
+        if terms is None:
+            return
+        self.total_length -= self.lengths.pop(id)
+        for term in terms:
+            ids, freqs = self.postings[term]
+            idx = bisect_left(ids, id)
+            del ids[idx]
+            del freqs[idx]
+            if not ids:
+                del self.postings[term]
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def lookup(self, query: str, mode: str = "and") -> Set[int]:
+        """
+        Ids of documents, which have all (mode="and") or any (mode="or")
+        of query terms.
+        """
+        return set(self._match(tokenize(query), mode))
+
+    def search(
+        self, query: str, mode: str = "and", limit: Union[int, None] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Find documents by query terms, best first.
+
+        :param query: str. Text, which is tokenized like indexed values.
+        :param mode: str. "and" for documents with all terms,
+            "or" for documents with any of them.
+        :param limit: int. Return only this many best results.
+        :return: List[Tuple[int, float]]. Pairs of (id, score).
+        :raises: ValueError if mode is unknown
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores = self._score(terms, self._match(terms, mode))
+        # Equal scores go in id order
+        key = lambda item: (item[1], -item[0])
+        if limit is None:
+            return sorted(scores.items(), key=key, reverse=True)
+        return heapq.nlargest(limit, scores.items(), key=key)
+
+    def _match(self, terms: List[str], mode: str) -> Iterable[int]:
+        if mode not in ("and", "or"):
+            raise ValueError(f"Unknown search mode {mode!r}. Choose 'and' or 'or'")
+        postings = [self.postings.get(term) for term in terms]
+        if mode == "or":
+            found = set()
+            for posting in postings:
+                if posting is not None:
+                    found.update(posting[0])
+            return found
+        if not postings or None in postings:
+            return []
+        # Walk the shortest posting list, probing the others by binary search.
+        # Candidates grow, so each probe starts where the previous one stopped
+        postings.sort(key=lambda posting: len(posting[0]))
+        others = [posting[0] for posting in postings[1:]]
+        starts = [0] * len(others)
+        found = []
+        for id in postings[0][0]:
+            for pos, ids in enumerate(others):
+                idx = bisect_left(ids, id, starts[pos])
+                starts[pos] = idx
+                if idx == len(ids) or ids[idx] != id:
+                    break
+            else:
+                found.append(id)
+        return found
+
+    def _score(self, terms: List[str], ids: Iterable[int]) -> Dict[int, float]:
+        scores = dict.fromkeys(ids, 0.0)
+        if not scores:
+            return scores
+        count = len(self.doc_terms)
+        average = self.total_length / count
+        lengths = self.lengths
+        k1, b = self.K1, self.B
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, freqs = posting
+            idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+            if len(scores) < len(ids):
+                # Few candidates, find their frequencies by binary search
+                for id in scores:
+                    idx = bisect_left(ids, id)
+                    if idx < len(ids) and ids[idx] == id:
+                        scores[id] += idf * _term_weight(
+                            freqs[idx], lengths[id], average, k1, b
+                        )
+            else:
+                for id, freq in zip(ids, freqs):
+                    if id in scores:
+                        scores[id] += idf * _term_weight(
+                            freq, lengths[id], average, k1, b
+                        )
+        return scores
+
+    def dump(self, path: str, state: Any) -> None:
+        """
+        Write index into file, written to temporary file first and renamed,
+        so readers never see half-written index.
+
+        :param state: state of data file, index was built from.
+            Index is loaded back only for the same state.
+        """
+        data = {
+            "version": self.FORMAT_VERSION,
+            "state": state,
+            "postings": {
+                term: (ids.tobytes(), freqs.tobytes())
+                for term, (ids, freqs) in self.postings.items()
+            },
+            "doc_terms": self.doc_terms,
+            "lengths": self.lengths,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            marshal.dump(data, file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls, path: str, field_name: str, state: Any
+    ) -> Union["FullTextIndex", None]:
+        """
+        Read index, dumped for given state of data file.
+
+        :return: FullTextIndex or None if there is no index for this state.
+        """
+        try:
+            with open(path, "rb") as file:
+                # Loading from bytes is much faster, than from file object
+                data = marshal.loads(file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != cls.FORMAT_VERSION
+            or data.get("state") != state
+        ):
+            return None
+        index = cls(field_name)
+        for term, (ids, freqs) in data["postings"].items():
+            posting = (array("q"), array("I"))
+            posting[0].frombytes(ids)
+            posting[1].frombytes(freqs)
+            index.postings[sys.intern(term)] = posting
+        index.doc_terms = data["doc_terms"]
+        index.lengths = data["lengths"]
+        index.total_length = sum(index.lengths.values())
+        return index
+
+
+def _term_weight(freq: int, length: int, average: float, k1: float, b: float):
+    return freq * (k1 + 1) / (freq + k1 * (1 - b + b * length / average))
@@ -0,0 +1,276 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterator, List, Set, Tuple, Union
+
+from src.utils.data_structures.trie import Trie
+
+
+class BaseIndex:
+    """
+    Secondary index on single model field.
+    Maps field values to ids of instances, having this value.
+    Index remembers indexed value of each id, so on update
+    old entry can be removed without knowing the old value.
+    """
+
+    def __init__(self, field_name: str) -> None:
+        self.field_name = field_name
+        self.values: Dict[int, Any] = {}
+
+    def add(self, id: int, value: Any) -> None:
+        raise NotImplementedError("Method add not implemented maaan. Implement it!")
+
+    def remove(self, id: int) -> None:
+        raise NotImplementedError(
+            "Method remove not implemented maaan. Implement it!"
+        )
+
+    def lookup(self, value: Any) -> Set[int]:
+        raise NotImplementedError(
+            "Method lookup not implemented maaan. Implement it!"
+        )
+
+    def update(self, id: int, value: Any) -> None:
+        if id in self.values:
+            if self.values[id] == value:
+                return
+            self.remove(id)
+        self.add(id, value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class HashIndex(BaseIndex):
+    """
+    Index for equality lookups in O(1).
+    """
+
+    def __init__(self, field_name: str) -> None:
+        super().__init__(field_name)
+        self.buckets: Dict[Any, Set[int]] = {}
+
+    def add(self, id: int, value: Any) -> None:
+        self.values[id] = value
+        self.buckets.setdefault(value, set()).add(id)
+
+    def remove(self, id: int) -> None:
+        if id not in self.values:
+            return
+        value = self.values.pop(id)
+        bucket = self.buckets[value]
+        bucket.discard(id)
+        if not bucket:
+            del self.buckets[value]
+
+    def lookup(self, value: Any) -> Set[int]:
+        return set(self.buckets.get(value, ()))
+
+
+class SortedIndex(BaseIndex):
+    """
+    Ordered index, kept as sorted list of (value, id) pairs.
+    Equality lookups are O(log n), also supports range scans.
+    None values are not comparable, so they are kept apart.
+
+    Added pairs wait in pending list until the next read, which merges
+    them in, so index of n loaded records is built with one sort
+    instead of n insertions into sorted list.
+    """
+
+    # Up to this many pending pairs are inserted one by one, more are sorted
+    MAX_INSORT = 32
+
+    def __init__(self, field_name: str) -> None:
+        super().__init__(field_name)
+        self.entries: List[Tuple[Any, int]] = []
+        self.null_ids: Set[int] = set()
+        self._pending: List[Tuple[Any, int]] = []
+        # Readers of storage run in parallel, but only one of them merges
+        self._merge_lock = threading.Lock()
+
+    def add(self, id: int, value: Any) -> None:
+        self.values[id] = value
+        if value is None:
+            self.null_ids.add(id)
+        else:
+            self._pending.append((value, id))
+
+    def remove(self, id: int) -> None:
+        if id not in self.values:
+            return
+        value = self.values.pop(id)
+        if value is None:
+            self.null_ids.discard(id)
+            return
+        entries = self._merged()
+        idx = bisect_left(entries, (value, id))
+        del entries[idx]
+
+    def _merged(self) -> List[Tuple[Any, int]]:
+        """
+        Sorted entries with pending pairs merged in.
+        """
+        if not self._pending:
+            return self.entries
+        with self._merge_lock:
+            pending = self._pending
+            if len(pending) <= self.MAX_INSORT:
+                for entry in pending:
+                    insort(self.entries, entry)
+            else:
+                self.entries.extend(pending)
+                self.entries.sort()
+            self._pending = []
+        return self.entries
+
+    def lookup(self, value: Any) -> Set[int]:
+        if value is None:
+            return set(self.null_ids)
+        return set(self.range(value, value))
+
+    def range(
+        self,
+        lo: Any = None,
+        hi: Any = None,
+        include_lo: bool = True,
+        include_hi: bool = True,
+    ) -> Iterator[int]:
+        """
+        Iterate ids, which values are between lo and hi, ordered by value.
+        None bound means unbounded side.
+        """
+        start, end = self._bounds(lo, hi, include_lo, include_hi)
+        entries = self.entries
+        for idx in range(start, end):
+            yield entries[idx][1]
+
+    def count_range(
+        self,
+        lo: Any = None,
+        hi: Any = None,
+        include_lo: bool = True,
+        include_hi: bool = True,
+    ) -> int:
+        """
+        Number of ids in range, found with two binary searches.
+        """
+        start, end = self._bounds(lo, hi, include_lo, include_hi)
+        return max(end - start, 0)
+
+    def _bounds(
+        self, lo: Any, hi: Any, include_lo: bool, include_hi: bool
+    ) -> Tuple[int, int]:
+        entries = self._merged()
+        if lo is None:
+            start = 0
+        elif include_lo:
+            start = bisect_left(entries, (lo,))
+        else:
+            start = bisect_right(entries, (lo, float("inf")))
+        if hi is None:
+            end = len(entries)
+        elif include_hi:
+            end = bisect_right(entries, (hi, float("inf")))
+        else:
+            end = bisect_left(entries, (hi,))
+        return start, end
+
+
+class PrefixIndex(BaseIndex):
+    """
+    Index of string values for prefix lookups and autocomplete.
+    Values are kept in trie by their case folded form, so prefix lookups
+    ignore case, while equality lookups still compare exact values.
+    Both cost O(length of value) plus size of result, never a scan.
+    """
+
+    def __init__(self, field_name: str) -> None:
+        super().__init__(field_name)
+        # Folded value -> {id: value}
+        self.trie = Trie()
+        self.null_ids: Set[int] = set()
+
+    def add(self, id: int, value: Any) -> None:
+        if value is None:
+            self.values[id] = value
+            self.null_ids.add(id)
+            return
+        if not isinstance(value, str):
+            raise ValueError(
+                f"Prefix index on {self.field_name} takes only strings, got {value!r}"
+            )
+        self.values[id] = value
+        self.trie.setdefault(value.casefold(), {})[id] = value
+
+    def remove(self, id: int) -> None:
+        if id not in self.values:
+            return
+        value = self.values.pop(id)
+        if value is None:
+            self.null_ids.discard(id)
+            return
+        key = value.casefold()
+        bucket = self.trie.get(key)
+        del bucket[id]
+        if not bucket:
+            self.trie.delete(key)
+
+    def lookup(self, value: Any) -> Set[int]:
+        if value is None:
+            return set(self.null_ids)
+        if not isinstance(value, str):
+            # Only strings are indexed, so nothing else equals any of them
+            return set()
+        bucket = self.trie.get(value.casefold(), {})
+        return {id for id, stored in bucket.items() if stored == value}
+
+    def prefix(self, prefix: str) -> Iterator[int]:
+        """
+        Iterate ids, which values start with prefix, ignoring case.
+        Ids go in order of folded values, lazily, so caller may stop early.
+
+        :raises: ValueError if prefix is not string
+        """
+        for _, bucket in self.trie.items(self._folded(prefix)):
+            yield from sorted(bucket)
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Distinct values, which start with prefix, ignoring case,
+        in alphabetical order of folded values.
+
+        :param limit: int. Return at most this many values.
+        :raises: ValueError if prefix is not string
+        """
+        found: List[str] = []
+        for _, bucket in self.trie.items(self._folded(prefix)):
+            for value in sorted(set(bucket.values())):
+                if len(found) == limit:
+                    return found
+                found.append(value)
+        return found
+
+    def _folded(self, prefix: Any) -> str:
+        if not isinstance(prefix, str):
+            raise ValueError(
+                f"Prefix of {self.field_name} must be string, got {prefix!r}"
+            )
+        return prefix.casefold()
+
+
+INDEX_TYPES = {
+    True: SortedIndex,
+    "sorted": SortedIndex,
+    "hash": HashIndex,
+    "prefix": PrefixIndex,
+}
+
+
+def build_index(field_name: str, kind: Union[bool, str]) -> BaseIndex:
+    if kind not in INDEX_TYPES:
+        raise ValueError(
+            f"Unknown index type {kind!r} for field {field_name}. "
+            f"Choose one of {list(INDEX_TYPES)}"
+        )
+    return INDEX_TYPES[kind](field_name)
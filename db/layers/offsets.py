@@ -0,0 +1,169 @@
+from array import array
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, Tuple, Union
+
+
+class OffsetIndex(MutableMapping):
+    """
+    Mapping of record id to (offset, length) of record in file,
+    which moves all records after one in O(log n), when its length changes.
+
+    Records are kept in slots in file order. Offset of slot is its base
+    plus sum of shifts, recorded at it and at slots before it, and that sum
+    is kept in Fenwick tree, so shift of all records after given one
+    is a single point update instead of rewriting every offset.
+    Removed records leave dead slots, which are dropped, when they
+    outnumber live ones.
+
+    Records must be added in file order to be cheap. Record, added before
+    the last one, makes index rebuild, sorting slots, before the next shift.
+    """
+
+    # Dead slots, which are never worth compacting
+    MIN_DEAD = 1024
+
+    def __init__(
+        self, positions: Union[Dict[int, Tuple[int, int]], None] = None
+    ) -> None:
+        self._clear()
+        if positions:
+            self.update(positions)
+
+    def _clear(self) -> None:
+        # id of slot, 0 for dead one
+        self._ids = array("q")
+        self._bases = array("q")
+        self._lengths = array("q")
+        # Shift, recorded at slot, and Fenwick tree of them (1-based)
+        self._shifts = array("q")
+        self._tree = array("q", [0])
+        self._slots: Dict[int, int] = {}
+        self._dead = 0
+        self._ordered = True
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._slots)
+
+    def __contains__(self, id: object) -> bool:
+        return id in self._slots
+
+    def __getitem__(self, id: int) -> Tuple[int, int]:
+        slot = self._slots[id]
+        return self._bases[slot] + self._shift_at(slot), self._lengths[slot]
+
+    def __setitem__(self, id: int, position: Tuple[int, int]) -> None:
+        offset, length = position
+        slot = self._slots.get(id)
+        if slot is not None:
+            if self[id][0] == offset:
+                self._lengths[slot] = length
+                return
+            self._kill(slot)
+        if self._ids and offset < self._last_offset():
+            self._ordered = False
+        slot = len(self._ids)
+        self._ids.append(id)
+        self._lengths.append(length)
+        self._shifts.append(0)
+        # New node of tree covers shifts of some slots before it
+        node = slot + 1
+        self._tree.append(self._prefix(node - 1) - self._prefix(node - (node & -node)))
+        self._bases.append(offset - self._prefix(node))
+        self._slots[id] = slot
+
+    def __delitem__(self, id: int) -> None:
+        """
+        Forget record without moving others, e.g. when its bytes stay in file.
+        """
+        self._kill(self._slots[id])
+        self._maybe_compact()
+
+    def resize(self, id: int, length: int) -> None:
+        """
+        Set new length of record and move records after it by the difference.
+        """
+        self._ensure_ordered()
+        slot = self._slots[id]
+        delta = length - self._lengths[slot]
+        self._lengths[slot] = length
+        if delta and slot + 1 < len(self._ids):
+            self._add_shift(slot + 1, delta)
+
+    def remove(self, id: int) -> None:
+        """
+        Forget record, whose bytes were cut out of file,
+        and move records after it back by its length.
+        """
+        self.resize(id, 0)
+        self._kill(self._slots[id])
+        self._maybe_compact()
+
+    def items(self) -> Iterator[Tuple[int, Tuple[int, int]]]:
+        """
+        Pairs of (id, (offset, length)) in slot order, in O(n).
+        """
+        shift = 0
+        for id, base, length, slot_shift in zip(
+            self._ids, self._bases, self._lengths, self._shifts
+        ):
+            shift += slot_shift
+            if id:
+                yield id, (base + shift, length)
+
+    def _last_offset(self) -> int:
+        slot = len(self._ids) - 1
+        return self._bases[slot] + self._shift_at(slot)
+
+    def _kill(self, slot: int) -> None:
+        del self._slots[self._ids[slot]]
+        self._ids[slot] = 0
+        self._dead += 1
+
+    def _shift_at(self, slot: int) -> int:
+        return self._prefix(slot + 1)
+
+    def _prefix(self, node: int) -> int:
+        tree = self._tree
+        total = 0
+        while node > 0:
+            total += tree[node]
+            node -= node & -node
+        return total
+
+    def _add_shift(self, slot: int, delta: int) -> None:
+        self._shifts[slot] += delta
+        tree = self._tree
+        node = slot + 1
+        size = len(tree)
+        while node < size:
+            tree[node] += delta
+            node += node & -node
+
+    def _ensure_ordered(self) -> None:
+        if not self._ordered:
+            self._rebuild(self.items())
+
+    def _maybe_compact(self) -> None:
+        if self._dead > self.MIN_DEAD and self._dead > len(self._slots):
+            self._rebuild(self.items())
+
+    def _rebuild(self, items: Iterable[Tuple[int, Tuple[int, int]]]) -> None:
+        """
+        Fill index from scratch with live records only, in file order.
+        """
+        if self._ordered:
+            items = list(items)
+        else:
+            items = sorted(items, key=lambda item: item[1][0])
+        self._clear()
+        for id, (offset, length) in items:
+            self._slots[id] = len(self._ids)
+            self._ids.append(id)
+            self._bases.append(offset)
+            self._lengths.append(length)
+        zeros = bytes(8 * len(self._ids))
+        self._shifts.frombytes(zeros)
+        self._tree.frombytes(zeros)
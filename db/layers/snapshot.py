@@ -0,0 +1,128 @@
+import marshal
+import os
+import zlib
+from array import array
+from typing import Any, Dict, List, Tuple, Union
+
+
+class ContainerSnapshot:
+    """
+    Records of file storage in binary form, written next to data file,
+    so next start reads them with one sequential read instead of
+    parsing every line.
+
+    Snapshot keeps live records as tuples of typed values in codec
+    column order, together with their ids and positions in data file.
+    It is tagged with state of data file (generation, size, mtime_ns)
+    and checksum of bytes right before its size. Data file of the same
+    generation is changed only by appends, so snapshot stays valid,
+    while file only grew since: records after snapshot size are replayed
+    from file then.
+    """
+
+    FORMAT_VERSION = 1
+    # Bytes of data file before snapshot size, which must match on load
+    CHECKSUM_BLOCK = 4096
+
+    def __init__(
+        self,
+        state: Tuple[int, int, int],
+        checksum: int,
+        ids: array,
+        offsets: array,
+        lengths: array,
+        rows: List[Tuple[Any, ...]],
+        meta: Union[Dict[str, Any], None] = None,
+    ) -> None:
+        """
+        :param meta: Dict[str, Any]. Counters of storage, which are not
+            derived from live records, e.g. latest id of log.
+        """
+        self.state = state
+        self.checksum = checksum
+        self.ids = ids
+        self.offsets = offsets
+        self.lengths = lengths
+        self.rows = rows
+        self.meta = meta or {}
+
+    @property
+    def size(self) -> int:
+        return self.state[1]
+
+    @classmethod
+    def file_checksum(cls, path: str, size: int) -> int:
+        """
+        Checksum of the last CHECKSUM_BLOCK bytes of file before `size`.
+        """
+        start = max(size - cls.CHECKSUM_BLOCK, 0)
+        with open(path, "rb") as file:
+            file.seek(start)
+            data = file.read(size - start)
+        if len(data) != size - start:
+            return -1
+        return zlib.crc32(data)
+
+    def matches(self, path: str, state: Tuple[int, int, int]) -> bool:
+        """
+        Whether data file in given state is the snapshot file
+        with, maybe, records appended after it.
+        """
+        generation, size, mtime_ns = state
+        if generation != self.state[0] or size < self.size:
+            return False
+        if size == self.size and mtime_ns == self.state[2]:
+            return True
+        return self.file_checksum(path, self.size) == self.checksum
+
+    def dump(self, path: str, schema: Any) -> None:
+        """
+        Write snapshot into file, written to temporary file first and renamed,
+        so readers never see half-written snapshot.
+
+        :param schema: layout of rows, snapshot is loaded back only
+            for the same one.
+        """
+        data = {
+            "version": self.FORMAT_VERSION,
+            "schema": schema,
+            "state": self.state,
+            "checksum": self.checksum,
+            "ids": self.ids.tobytes(),
+            "offsets": self.offsets.tobytes(),
+            "lengths": self.lengths.tobytes(),
+            "rows": self.rows,
+            "meta": self.meta,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            marshal.dump(data, file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, schema: Any) -> Union["ContainerSnapshot", None]:
+        """
+        Read snapshot, dumped for given layout of rows.
+
+        :return: ContainerSnapshot or None if there is no usable snapshot.
+        """
+        try:
+            with open(path, "rb") as file:
+                # Loading from bytes is much faster, than from file object
+                data = marshal.loads(file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != cls.FORMAT_VERSION
+            or data.get("schema") != schema
+        ):
+            return None
+        positions = []
+        for name in ("ids", "offsets", "lengths"):
+            values = array("q")
+            values.frombytes(data[name])
+            positions.append(values)
+        return cls(
+            data["state"], data["checksum"], *positions, data["rows"], data["meta"]
+        )
@@ -0,0 +1,609 @@
+from itertools import islice
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+from db.layers.fulltext import tokenize
+from db.layers.indexes import PrefixIndex, SortedIndex
+from src.utils.sorting import ExternalSorter, sort, top_k
+
+# Lookup name -> factory of predicate, which takes field getter and argument
+LOOKUPS: Dict[str, Callable[[Callable, Any], Callable[[Any], bool]]] = {
+    "exact": lambda get, arg: lambda i: get(i) == arg,
+    "gt": lambda get, arg: lambda i: (v := get(i)) is not None and v > arg,
+    "gte": lambda get, arg: lambda i: (v := get(i)) is not None and v >= arg,
+    "lt": lambda get, arg: lambda i: (v := get(i)) is not None and v < arg,
+    "lte": lambda get, arg: lambda i: (v := get(i)) is not None and v <= arg,
+    "in": lambda get, arg: lambda i: get(i) in arg,
+    "isnull": lambda get, arg: lambda i: (get(i) is None) == arg,
+    "startswith": lambda get, arg: (
+        lambda i: (v := get(i)) is not None and v.startswith(arg)
+    ),
+    # All words of argument are among words of value, no words match nothing
+    "search": lambda get, arg: (
+        lambda i, terms=frozenset(tokenize(arg)): bool(terms)
+        and terms.issubset(tokenize(get(i)))
+    ),
+}
+
+RANGE_LOOKUPS = ("gt", "gte", "lt", "lte")
+
+
+class Condition:
+    """
+    Single `field__lookup=value` condition of query.
+    `test` is predicate, compiled once, which checks instance.
+    """
+
+    __slots__ = ("field", "lookup", "value", "negated", "test")
+
+    def __init__(self, field: str, lookup: str, value: Any, negated: bool = False):
+        self.field = field
+        self.lookup = lookup
+        self.value = value
+        self.negated = negated
+        test = LOOKUPS[lookup](attrgetter(field), value)
+        self.test = (lambda i: not test(i)) if negated else test
+
+    @classmethod
+    def parse(
+        cls, model_class: type, key: str, value: Any, negated: bool = False
+    ) -> "Condition":
+        """
+        :raises: ValueError if field is not model field or lookup is unknown
+        """
+        field, _, lookup = key.partition("__")
+        lookup = lookup or "exact"
+        if field not in model_class._fields:
+            raise ValueError(
+                f"Field {field} is not field of model {model_class.__name__}"
+            )
+        if lookup not in LOOKUPS:
+            raise ValueError(
+                f"Unknown lookup {lookup!r} in {key}. Choose one of {list(LOOKUPS)}"
+            )
+        if lookup == "in":
+            value = frozenset(value)
+        return cls(field, lookup, value, negated)
+
+    def __str__(self) -> str:
+        text = f"{self.field}__{self.lookup}={self.value!r}"
+        return f"not {text}" if self.negated else text
+
+
+class Descending:
+    """
+    Sort key wrapper, which reverses order of wrapped value.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __lt__(self, other: "Descending") -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: "Descending") -> bool:
+        return self.value == other.value
+
+
+def make_sort_key(ordering: Tuple[str, ...]) -> Callable[[Any], Tuple[Any, ...]]:
+    """
+    Build key function for `order_by` fields, where "-field" means descending.
+    None values go after others in ascending order and before them
+    in descending one, so they never get compared with real values.
+    """
+    getters = []
+    for name in ordering:
+        getter = attrgetter(name.lstrip("-"))
+        if name.startswith("-"):
+            getters.append(lambda i, get=getter: Descending(_nulls_last(get(i))))
+        else:
+            getters.append(lambda i, get=getter: _nulls_last(get(i)))
+    return lambda instance: tuple(get(instance) for get in getters)
+
+
+def _nulls_last(value: Any) -> Tuple[bool, Any]:
+    return (True, 0) if value is None else (False, value)
+
+
+def sort_rows(
+    rows: Iterable[Any], ordering: Tuple[str, ...], limit: Union[int, None] = None
+) -> List[Any]:
+    """
+    Sort instances by `order_by` fields, ties are broken by id.
+    With limit only top `limit` instances are kept in a heap instead
+    of sorting all of them.
+
+    When all fields go in one direction, keys are built by attrgetter
+    in C. Only for mixed directions or when some value is None,
+    and so can't be compared, slower key of make_sort_key is used.
+    """
+    rows = list(rows)
+    names = [name.lstrip("-") for name in ordering]
+    descending = [name.startswith("-") for name in ordering]
+    tie_break = "id" not in names
+    try:
+        if not any(descending):
+            key = attrgetter(*names, "id") if tie_break else attrgetter(*names)
+            return _sort(rows, key, limit, reverse=False)
+        if all(descending):
+            key = get = attrgetter(*names)
+            if tie_break:
+                # Reversed order of negated id is ascending order of id
+                key = lambda instance: (get(instance), -instance.id)
+            return _sort(rows, key, limit, reverse=True)
+    except TypeError:
+        pass
+    if tie_break:
+        ordering += ("id",)
+    return _sort(rows, make_sort_key(ordering), limit, reverse=False)
+
+
+def _sort(
+    rows: List[Any],
+    key: Callable[[Any], Any],
+    limit: Union[int, None],
+    reverse: bool,
+) -> List[Any]:
+    if limit is None:
+        return sort(rows, key=key, reverse=reverse)
+    return top_k(rows, limit, key=key, reverse=reverse)
+
+
+class Plan:
+    """
+    Chosen way to fetch candidates of query.
+
+    source: callable, which yields candidate instances.
+    ordered_by: field, by which source yields instances in ascending order.
+    used: conditions, fully checked by source itself.
+    description: human-readable plan, shown by QuerySet.explain.
+    """
+
+    __slots__ = ("source", "ordered_by", "used", "description")
+
+    def __init__(
+        self,
+        source: Callable[[], Iterable[Any]],
+        ordered_by: Union[str, None],
+        used: Tuple[Condition, ...],
+        description: str,
+    ) -> None:
+        self.source = source
+        self.ordered_by = ordered_by
+        self.used = used
+        self.description = description
+
+
+class Planner:
+    """
+    Chooses access path for conditions of query, cheapest first:
+        1. id lookup for id__exact / id__in
+           or full-text index for field__search, which yields best matches first
+        2. secondary index lookup for field__exact / field__in
+           or prefix index lookup for field__startswith,
+           the smallest set of ids wins
+        3. range scan of sorted index or of container by id. Among several
+           ranges the one, which serves order_by of limited query,
+           wins, otherwise the one with fewer entries
+        4. full scan of sorted index, when query is ordered by indexed
+           field and limited, so scan stops early
+        5. full scan of storage in id order
+
+    Every id, found in index, costs separate lookup, so index is skipped
+    when it matches more than INDEX_RATIO of all instances, unless it
+    serves order of limited query.
+    """
+
+    INDEX_RATIO = 0.1
+
+    def __init__(self, storage: Any) -> None:
+        self.storage = storage
+        self.container = getattr(storage, "container", None)
+
+    def plan(
+        self,
+        conditions: List[Condition],
+        ordering: Tuple[str, ...],
+        limited: bool,
+    ) -> Plan:
+        positive = [c for c in conditions if not c.negated]
+        return (
+            self._plan_id_lookup(positive)
+            or self._plan_fulltext(positive)
+            or self._plan_index_lookup(positive)
+            or self._plan_range(positive, ordering, limited)
+            or self._plan_ordered_scan(ordering, limited)
+            or Plan(self.storage._iter_instances, "id", (), "full scan")
+        )
+
+    def _plan_id_lookup(self, conditions: List[Condition]) -> Union[Plan, None]:
+        for condition in conditions:
+            if condition.field == "id" and condition.lookup in ("exact", "in"):
+                ids = _lookup_values(condition)
+                return Plan(
+                    lambda: self._fetch(sorted(ids)),
+                    "id",
+                    (condition,),
+                    f"id lookup of {len(ids)} id(s)",
+                )
+        return None
+
+    def _plan_fulltext(self, conditions: List[Condition]) -> Union[Plan, None]:
+        fulltext = getattr(self.storage, "fulltext", {})
+        for condition in conditions:
+            index = fulltext.get(condition.field)
+            if index is not None and condition.lookup == "search":
+                found = index.search(condition.value)
+                return Plan(
+                    lambda: self._fetch(id for id, _ in found),
+                    None,
+                    (condition,),
+                    f"full-text search on {condition.field}, {len(found)} id(s)",
+                )
+        return None
+
+    def _plan_index_lookup(self, conditions: List[Condition]) -> Union[Plan, None]:
+        best = None
+        for condition in conditions:
+            index = self.storage.indexes.get(condition.field)
+            if index is None:
+                continue
+            limit = len(index) * self.INDEX_RATIO
+            if condition.lookup in ("exact", "in"):
+                ids = set()
+                for value in _lookup_values(condition):
+                    ids |= index.lookup(value)
+                used = (condition,)
+            elif condition.lookup == "startswith" and isinstance(index, PrefixIndex):
+                # Prefix index ignores case, so found ids are rechecked.
+                # Ids are taken lazily and dropped as soon as there are too many
+                ids = set(islice(index.prefix(condition.value), int(limit) + 1))
+                used = ()
+            else:
+                continue
+            if len(ids) > limit:
+                continue
+            if best is None or len(ids) < len(best[1]):
+                best = (condition, ids, used)
+        if best is None:
+            return None
+        condition, ids, used = best
+        return Plan(
+            lambda: self._fetch(sorted(ids)),
+            "id",
+            used,
+            f"index lookup on {condition.field}, {len(ids)} id(s)",
+        )
+
+    def _plan_range(
+        self, conditions: List[Condition], ordering: Tuple[str, ...], limited: bool
+    ) -> Union[Plan, None]:
+        ranges: Dict[str, List[Condition]] = {}
+        for condition in conditions:
+            if condition.lookup in RANGE_LOOKUPS:
+                ranges.setdefault(condition.field, []).append(condition)
+
+        candidates = []
+        for field, used in ranges.items():
+            lo, hi, include_lo, include_hi = _merge_bounds(used)
+            # Limited query, served in order by range, stops early
+            serves_order = limited and ordering == (field,)
+            index = self.storage.indexes.get(field)
+            if isinstance(index, SortedIndex):
+                size = index.count_range(lo, hi, include_lo, include_hi)
+                if not serves_order and size > len(index) * self.INDEX_RATIO:
+                    continue
+                source = self._index_range_source(
+                    index, lo, hi, include_lo, include_hi
+                )
+            elif field == "id" and self.container is not None:
+                # Size of id range is unknown, but it can't exceed container
+                size = len(self.container)
+                source = self._id_range_source(lo, hi, include_lo, include_hi)
+            else:
+                continue
+            description = "range scan on {} {}{}, {}{}".format(
+                field,
+                "[" if include_lo else "(",
+                "-inf" if lo is None else lo,
+                "inf" if hi is None else hi,
+                "]" if include_hi else ")",
+            )
+            candidates.append(
+                (not serves_order, size, Plan(source, field, tuple(used), description))
+            )
+        if not candidates:
+            return None
+        return min(candidates, key=lambda item: item[:2])[2]
+
+    def _plan_ordered_scan(
+        self, ordering: Tuple[str, ...], limited: bool
+    ) -> Union[Plan, None]:
+        if not limited or len(ordering) != 1:
+            return None
+        field = ordering[0]
+        index = self.storage.indexes.get(field)
+        if not isinstance(index, SortedIndex):
+            return None
+
+        def source() -> Iterator[Any]:
+            yield from self._fetch(index.range())
+            # None values go last in ascending order
+            yield from self._fetch(sorted(index.null_ids))
+
+        return Plan(source, field, (), f"ordered scan of index on {field}")
+
+    def _index_range_source(
+        self,
+        index: SortedIndex,
+        lo: Any,
+        hi: Any,
+        include_lo: bool,
+        include_hi: bool,
+    ) -> Callable[[], Iterator[Any]]:
+        return lambda: self._fetch(index.range(lo, hi, include_lo, include_hi))
+
+    def _id_range_source(
+        self, lo: Any, hi: Any, include_lo: bool, include_hi: bool
+    ) -> Callable[[], Iterator[Any]]:
+        def source() -> Iterator[Any]:
+            for instance in self.container.iter_from(lo, inclusive=include_lo):
+                if hi is not None and (
+                    instance.id > hi or (instance.id == hi and not include_hi)
+                ):
+                    return
+                yield instance
+
+        return source
+
+    def _fetch(self, ids: Iterable[int]) -> Iterator[Any]:
+        lookup = self.storage._lookup
+        for id in ids:
+            instance = lookup(id)
+            if instance is not None:
+                yield instance
+
+
+def _lookup_values(condition: Condition) -> Iterable[Any]:
+    return condition.value if condition.lookup == "in" else (condition.value,)
+
+
+def _merge_bounds(conditions: List[Condition]) -> Tuple[Any, Any, bool, bool]:
+    """
+    Merge range conditions of one field into the tightest bounds.
+
+    :return: Tuple of (lo, hi, include_lo, include_hi).
+    """
+    lo = hi = None
+    include_lo = include_hi = True
+    for condition in conditions:
+        value, inclusive = condition.value, condition.lookup in ("gte", "lte")
+        if condition.lookup in ("gt", "gte"):
+            if lo is None or value > lo or (value == lo and not inclusive):
+                lo, include_lo = value, inclusive
+        elif hi is None or value < hi or (value == hi and not inclusive):
+            hi, include_hi = value, inclusive
+    return lo, hi, include_lo, include_hi
+
+
+class QuerySet:
+    """
+    Lazy query over stored instances of model.
+
+        User.objects.filter(age__gte=18).exclude(username="root")
+            .order_by("-age", "username")[:20]
+
+    Nothing is read until queryset is iterated, then results are cached.
+    filter, exclude, order_by and slicing return new querysets.
+    Supported lookups: exact, gt, gte, lt, lte, in, isnull, startswith, search.
+    Instances with equal order_by values are ordered by id. Without
+    order_by, order of instances depends on chosen plan, `field__search`
+    on full-text indexed field gives best matches first.
+
+    Query is run under read lock of storage. Planner picks access path
+    (see Planner), limit is pushed down, so scan stops as soon as enough
+    instances are found, and ordered limited queries keep only top k
+    instances in a heap instead of sorting all of them.
+    """
+
+    def __init__(self, model_class: type) -> None:
+        self.model_class = model_class
+        self._conditions: Tuple[Condition, ...] = ()
+        self._ordering: Tuple[str, ...] = ()
+        self._start = 0
+        self._stop: Union[int, None] = None
+        self._result_cache: Union[List[Any], None] = None
+
+    def _clone(self) -> "QuerySet":
+        clone = self.__class__(self.model_class)
+        clone._conditions = self._conditions
+        clone._ordering = self._ordering
+        clone._start = self._start
+        clone._stop = self._stop
+        return clone
+
+    def _check_not_sliced(self, action: str) -> None:
+        if self._start or self._stop is not None:
+            raise ValueError(f"Can't {action} once query is sliced")
+
+    def all(self) -> "QuerySet":
+        return self._clone()
+
+    def filter(self, **kwargs) -> "QuerySet":
+        return self._add_conditions(kwargs, negated=False)
+
+    def exclude(self, **kwargs) -> "QuerySet":
+        return self._add_conditions(kwargs, negated=True)
+
+    def _add_conditions(self, kwargs: Dict[str, Any], negated: bool) -> "QuerySet":
+        self._check_not_sliced("filter")
+        clone = self._clone()
+        clone._conditions += tuple(
+            Condition.parse(self.model_class, key, value, negated)
+            for key, value in kwargs.items()
+        )
+        return clone
+
+    def order_by(self, *fields: str) -> "QuerySet":
+        """
+        :param fields: field names, "-field" for descending order.
+        """
+        self._check_not_sliced("reorder")
+        for name in fields:
+            if name.lstrip("-") not in self.model_class._fields:
+                raise ValueError(
+                    f"Field {name.lstrip('-')} is not field "
+                    f"of model {self.model_class.__name__}"
+                )
+        clone = self._clone()
+        clone._ordering = tuple(fields)
+        return clone
+
+    def __getitem__(self, item: Union[int, slice]) -> Any:
+        if isinstance(item, slice):
+            if item.step not in (None, 1):
+                raise ValueError("Slicing with step is not supported")
+            start, stop = item.start or 0, item.stop
+            if start < 0 or (stop is not None and stop < 0):
+                raise ValueError("Negative indexing is not supported")
+            clone = self._clone()
+            clone._start = self._start + start
+            if stop is not None:
+                stop = self._start + stop
+                clone._stop = stop if self._stop is None else min(stop, self._stop)
+            if clone._stop is not None:
+                clone._start = min(clone._start, clone._stop)
+            return clone
+        if item < 0:
+            raise ValueError("Negative indexing is not supported")
+        if self._result_cache is not None:
+            return self._result_cache[item]
+        found = self[item : item + 1]._fetch_all()
+        if not found:
+            raise IndexError("QuerySet index out of range")
+        return found[0]
+
+    def _fetch_all(self) -> List[Any]:
+        if self._result_cache is None:
+            self._result_cache = self._execute()
+        return self._result_cache
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._fetch_all())
+
+    def __len__(self) -> int:
+        return len(self._fetch_all())
+
+    def __bool__(self) -> bool:
+        return self.exists()
+
+    def count(self) -> int:
+        return len(self)
+
+    def exists(self) -> bool:
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        return bool(self[:1]._fetch_all())
+
+    def first(self) -> Union[Any, None]:
+        found = self[:1]._fetch_all()
+        return found[0] if found else None
+
+    def explain(self) -> str:
+        """
+        Describe how query would be run, without running it.
+        """
+        storage = self.model_class.storage
+        with storage.lock.read_locked():
+            plan = self._plan(storage)
+        steps = [plan.description]
+        residual = [c for c in self._conditions if c not in plan.used]
+        if residual:
+            steps.append("filter " + ", ".join(map(str, residual)))
+        if self._ordering and self._ordering != (plan.ordered_by,):
+            order = ", ".join(self._ordering)
+            steps.append(
+                f"top {self._stop} by {order}"
+                if self._stop is not None
+                else f"sort by {order}"
+            )
+        if self._start or self._stop is not None:
+            steps.append(f"slice [{self._start}:{self._stop}]")
+        return " -> ".join(steps)
+
+    def _plan(self, storage: Any) -> Plan:
+        return Planner(storage).plan(
+            list(self._conditions), self._ordering, self._stop is not None
+        )
+
+    def iterator(self, max_in_memory: Union[int, None] = None) -> Iterator[Any]:
+        """
+        Iterate results without caching them, e.g. to export big table
+        ordered by any field.
+
+        Results are sorted by external merge sort: at most `max_in_memory`
+        instances (SORT_BUFFER_SIZE setting by default) are kept in memory,
+        the rest are spilled into sorted runs under DATA_DIR, see
+        ExternalSorter. Storage is read once under read lock, runs are
+        merged after the lock is released, so writers are not blocked,
+        while results are consumed. Without order_by instances go in id
+        order. Spilled instances are built again from their values,
+        so they are copies of stored ones.
+        """
+        if self._stop is not None:
+            # Limited query keeps only top instances in memory anyway
+            yield from self._execute()
+            return
+        ordering = self._ordering or ("id",)
+        if "id" not in (name.lstrip("-") for name in ordering):
+            ordering += ("id",)
+        codec = self.model_class._codec
+        sorter = ExternalSorter(
+            make_sort_key(ordering),
+            max_items=max_in_memory,
+            dump=codec.dump,
+            load=codec.build_typed,
+        )
+        storage = self.model_class.storage
+        if getattr(storage, "auto_refresh", False):
+            storage.refresh()
+        with storage.lock.read_locked():
+            sorter.extend(self._rows(storage)[1])
+        yield from islice(sorter, self._start, None)
+
+    def _rows(self, storage: Any) -> Tuple[Plan, Iterable[Any]]:
+        """
+        Plan of query and instances, matching its conditions.
+        Must be called under read lock of storage.
+        """
+        plan = self._plan(storage)
+        residual = [c for c in self._conditions if c not in plan.used]
+        rows: Iterable[Any] = plan.source()
+        for condition in residual:
+            rows = filter(condition.test, rows)
+        return plan, rows
+
+    def _execute(self) -> List[Any]:
+        storage = self.model_class.storage
+        if getattr(storage, "auto_refresh", False):
+            storage.refresh()
+        with storage.lock.read_locked():
+            plan, rows = self._rows(storage)
+            if self._ordering and self._ordering != (plan.ordered_by,):
+                rows = sort_rows(rows, self._ordering, self._stop)
+            return list(islice(rows, self._start, self._stop))
+
+    def __repr__(self) -> str:
+        return f"<QuerySet of {self.model_class.__name__}: {self.explain()}>"
+
+
+class Manager:
+    """
+    Entry point of queries, available as `Model.objects`.
+    Every access gives fresh QuerySet of all instances of model.
+    """
+
+    def __get__(self, instance: Any, owner: type) -> QuerySet:
+        return QuerySet(owner)
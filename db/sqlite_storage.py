@@ -0,0 +1,233 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Union
+
+from db.base import BaseEntity
+from db.storage import BaseFileDataStorage
+
+
+class SqliteDataStorage(BaseFileDataStorage):
+    """
+    Storage backed by stdlib sqlite3.
+
+    Table is created from model fields, IntegerField and StringField
+    are mapped to INTEGER and TEXT columns, id is INTEGER PRIMARY KEY
+    and indexed fields get SQL indexes instead of in-memory ones.
+    The highest id ever given is kept in SEQUENCE_TABLE, so ids
+    of deleted records are never given again, also after reopening.
+    Each thread reuses its own connection, statements are built once
+    and served from sqlite3 statement cache. Nothing is loaded on init.
+    """
+
+    file_format = "sqlite3"
+    COLUMN_TYPES = {int: "INTEGER", str: "TEXT"}
+    # Table name -> the highest id, given to its records
+    SEQUENCE_TABLE = "id_sequence"
+
+    def __init__(
+        self, cached_statements: int = 128, container_class: Union[type, None] = None
+    ) -> None:
+        super().__init__(container_class)
+        self.cached_statements = cached_statements
+
+    def _init(self, *args, **kwargs):
+        super()._init(*args, **kwargs)
+        self.codec = self.model_class._codec
+        self.table = self.model_class.__name__.lower()
+        self._local = threading.local()
+        self._build_statements()
+        self.ensure_storage()
+        self.init_schema()
+        self.latest_id = self.get_latest_id()
+
+    def _init_indexes(self) -> Dict[str, Any]:
+        return {}
+
+    def _init_fulltext(self) -> Dict[str, Any]:
+        return {}
+
+    def _build_statements(self) -> None:
+        columns = ", ".join(self.codec.columns)
+        placeholders = ", ".join("?" for _ in self.codec.columns)
+        assignments = ", ".join(
+            f"{name} = ?" for name in self.codec.columns if name != "id"
+        )
+        self._select_sql = f"SELECT {columns} FROM {self.table}"
+        self._get_sql = f"{self._select_sql} WHERE id = ?"
+        self._insert_sql = (
+            f"INSERT INTO {self.table} ({columns}) VALUES ({placeholders})"
+        )
+        self._update_sql = f"UPDATE {self.table} SET {assignments} WHERE id = ?"
+        self._delete_sql = f"DELETE FROM {self.table} WHERE id = ?"
+        self._update_columns = [name for name in self.codec.columns if name != "id"]
+        self._sequence_sql = (
+            f"INSERT INTO {self.SEQUENCE_TABLE} (name, latest_id) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE "
+            "SET latest_id = max(latest_id, excluded.latest_id)"
+        )
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.filepath, cached_statements=self.cached_statements
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def init_schema(self) -> None:
+        columns = []
+        for name in self.codec.columns:
+            field = self.model_fields_map[name]
+            if field.typ not in self.COLUMN_TYPES:
+                raise ValueError(f"Field {name} of type {field.typ} has no SQL type")
+            column = f"{name} {self.COLUMN_TYPES[field.typ]}"
+            if name == "id":
+                column += " PRIMARY KEY"
+            columns.append(column)
+        with self.connection as connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ({', '.join(columns)})"
+            )
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.SEQUENCE_TABLE} "
+                "(name TEXT PRIMARY KEY, latest_id INTEGER NOT NULL)"
+            )
+            for name, field in self.model_fields_map.items():
+                if field.indexed and name != "id":
+                    connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_{self.table}_{name} "
+                        f"ON {self.table} ({name})"
+                    )
+
+    def get_latest_id(self) -> int:
+        """
+        The highest id ever given. Files, written before sequence was kept,
+        have no sequence row, the highest stored id is taken for them.
+        """
+        row = self.connection.execute(
+            f"SELECT max(coalesce((SELECT MAX(id) FROM {self.table}), 0), "
+            f"coalesce((SELECT latest_id FROM {self.SEQUENCE_TABLE} "
+            "WHERE name = ?), 0))",
+            (self.table,),
+        ).fetchone()
+        return row[0]
+
+    def get(self, id: int) -> BaseEntity:
+        instance = self._lookup(id)
+        if not instance:
+            raise ValueError(f"No {self.model_class.__name__} with id {id}")
+        return instance
+
+    def _lookup(self, id: int) -> Union[BaseEntity, None]:
+        row = self.connection.execute(self._get_sql, (id,)).fetchone()
+        return self.codec.build_typed(row) if row else None
+
+    @contextmanager
+    def atomic(self):
+        """
+        Run writes of the block in one transaction of this thread's connection.
+        On failure transaction is rolled back and ids, given to new
+        instances, are taken back. Nested blocks join the outer one.
+        """
+        if getattr(self._local, "created", None) is not None:
+            yield self
+            return
+        self._local.created = []
+        latest_id = self.latest_id
+        try:
+            with self.connection:
+                yield self
+        except BaseException:
+            created = self._local.created
+            self.id_allocator.rewind(
+                max((instance.id for instance in created), default=latest_id),
+                latest_id,
+            )
+            for instance in created:
+                instance.id = None
+            raise
+        finally:
+            self._local.created = None
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Commit after block, unless it runs inside atomic block.
+        """
+        if getattr(self._local, "created", None) is not None:
+            yield self.connection
+            return
+        with self.connection as connection:
+            yield connection
+
+    def save(self, instance: BaseEntity) -> None:
+        with self._transaction() as connection:
+            if not instance.id:
+                # Ids come from allocator, not from sqlite rowid. Sequence
+                # is moved in the same transaction, so it is rolled back with it
+                instance.id = self.id_allocator.allocate()
+                try:
+                    connection.execute(self._insert_sql, self.codec.dump(instance))
+                    connection.execute(self._sequence_sql, (self.table, instance.id))
+                except BaseException:
+                    self.id_allocator.rewind(instance.id, instance.id - 1)
+                    instance.id = None
+                    raise
+                created = getattr(self._local, "created", None)
+                if created is not None:
+                    created.append(instance)
+                return
+            values = [getattr(instance, name) for name in self._update_columns]
+            cursor = connection.execute(self._update_sql, (*values, instance.id))
+            if not cursor.rowcount:
+                raise ValueError(
+                    f"No {self.model_class.__name__} with id {instance.id}"
+                )
+
+    def delete(self, entity: Union[int, BaseEntity]) -> None:
+        self._delete(entity if isinstance(entity, int) else entity.id)
+
+    def _delete(self, id: int) -> None:
+        with self._transaction() as connection:
+            connection.execute(self._delete_sql, (id,))
+
+    def search(self, **kwargs) -> List[BaseEntity]:
+        """
+        Find instances, which fields are equal to given values,
+        using SQL WHERE clause, so indexed fields are served by SQL indexes.
+        """
+        conditions, params = [], []
+        for key, value in kwargs.items():
+            if key not in self.model_fields_map:
+                raise ValueError(
+                    f"Field {key} is not field of model {self.model_class.__name__}"
+                )
+            if value is None:
+                conditions.append(f"{key} IS NULL")
+            else:
+                conditions.append(f"{key} = ?")
+                params.append(value)
+        sql = self._select_sql
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        rows = self.connection.execute(sql + " ORDER BY id", params)
+        return [self.codec.build_typed(row) for row in rows]
+
+    def _iter_instances(self) -> Iterator[BaseEntity]:
+        for row in self.connection.execute(self._select_sql + " ORDER BY id"):
+            yield self.codec.build_typed(row)
+
+    def load_model_container(self):
+        container = self.container_class(self.model_class)
+        container.load(self._iter_instances())
+        return container
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -1,13 +1,33 @@
+import atexit
 import json
 import os
-from typing import Any, Dict, List, Union
+import struct
+import threading
+from array import array
+from contextlib import contextmanager
+from itertools import chain
+from typing import Any, Dict, Iterator, List, Tuple, Union
 
 from db.base import BaseDataStorage, BaseEntity, BaseEntityField, BaseModelContainer
+from db.layers.containers import CachedModelContainer, LockedModelContainer
+from db.layers.fulltext import FullTextIndex
+from db.layers.offsets import OffsetIndex
+from db.layers.snapshot import ContainerSnapshot
 from src.utils.functions import create_file_force
 from utils.settings import lazy_settings
 
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, files are not locked there
+    fcntl = None
+
 
 class BaseFileDataStorage(BaseDataStorage):
+    GENERATION = struct.Struct("<Q")
+    # Bytes of file tail, moved at once, when record changes its length
+    SPLICE_CHUNK = 1 << 20
+
     def _init(self, *args, **kwargs) -> None:
         model = args[0]
         self.encoding = "utf-8"
@@ -15,8 +35,68 @@ class BaseFileDataStorage(BaseDataStorage):
             lazy_settings.DATA_DIR,
             f"{model.__name__.lower()}.{self.file_format}",
         )
+        self.lock_path = self.filepath + ".lock"
+        self._lock_fd: Union[int, None] = None
+        self._flock_depth = 0
         super()._init(*args, **kwargs)
 
+    @property
+    def lock_fd(self) -> int:
+        """
+        Descriptor of lock file, which lives next to data file.
+        Besides locking, lock file keeps generation counter of data file.
+        """
+        if self._lock_fd is None:
+            create_file_force(self.lock_path)
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._lock_fd
+
+    @contextmanager
+    def _file_locked(self, exclusive: bool = True):
+        """
+        Hold advisory lock of data file, shared with other processes.
+        Lock is held by descriptor, which is shared by threads of process,
+        so callers must hold write lock of storage. Nested blocks join
+        the outer one.
+
+        :param exclusive: bool. Exclusive lock for writers, shared for readers.
+        """
+        if self._flock_depth or fcntl is None:
+            self._flock_depth += 1
+            try:
+                yield
+            finally:
+                self._flock_depth -= 1
+            return
+        fcntl.flock(self.lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self._flock_depth = 1
+        try:
+            yield
+        finally:
+            self._flock_depth = 0
+            fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def read_generation(self) -> int:
+        """
+        Generation of data file. It grows on every change, which is not
+        plain append, so other processes know, that appending the tail
+        is not enough to catch up.
+        """
+        data = os.pread(self.lock_fd, self.GENERATION.size, 0)
+        if len(data) < self.GENERATION.size:
+            return 0
+        return self.GENERATION.unpack(data)[0]
+
+    def _bump_generation(self) -> None:
+        os.pwrite(self.lock_fd, self.GENERATION.pack(self.read_generation() + 1), 0)
+
+    def _file_state(self) -> Tuple[int, int, int]:
+        """
+        :return: Tuple of (generation, size, mtime_ns) of data file.
+        """
+        stat = os.stat(self.filepath)
+        return self.read_generation(), stat.st_size, stat.st_mtime_ns
+
     def init_storage(self) -> None:
         create_file_force(self.filepath)
 
@@ -48,8 +128,116 @@ class BaseFileDataStorage(BaseDataStorage):
         with open(self.filepath, "r", encoding=self.encoding) as file:
             return file.readlines()
 
+    def _iter_lines_with_offsets(self, start: int = 0) -> Iterator[Tuple[int, bytes]]:
+        """
+        Iterate over raw lines of file together with their byte offsets.
+
+        :param start: int. Offset to start from, must be start of line.
+        :return: Iterator[Tuple[int, bytes]]. Pairs of (offset, line),
+            where line includes trailing newline.
+        """
+        offset = start
+        with open(self.filepath, "rb") as file:
+            file.seek(start)
+            for line in file:
+                yield offset, line
+                offset += len(line)
+
+    def _append_bytes(self, data: bytes) -> int:
+        """
+        Append data to the end of file.
+
+        :param data: bytes. Data to append.
+        :return: int. Offset where data was written.
+        """
+        with open(self.filepath, "ab") as file:
+            offset = file.seek(0, os.SEEK_END)
+            file.write(data)
+        return offset
+
+    def _splice_bytes(self, offset: int, length: int, data: bytes) -> None:
+        """
+        Replace `length` bytes starting at `offset` with `data`.
+        When sizes are equal, data is patched in place, otherwise
+        the tail of file after replaced region is shifted. Shift copies
+        the whole tail, chunk by chunk, so it costs O(size of tail) of disk
+        I/O, though only SPLICE_CHUNK bytes of it are in memory at once.
+
+        :param offset: int. Start of replaced region.
+        :param length: int. Length of replaced region.
+        :param data: bytes. New content of region, may be empty.
+        """
+        delta = len(data) - length
+        with open(self.filepath, "r+b") as file:
+            fd = file.fileno()
+            size = os.fstat(fd).st_size
+            start = offset + length
+            if delta < 0:
+                # Move tail back, starting from its head
+                position = start
+                while position < size:
+                    chunk = os.pread(fd, self.SPLICE_CHUNK, position)
+                    os.pwrite(fd, chunk, position + delta)
+                    position += len(chunk)
+            elif delta > 0:
+                # Move tail forward, starting from its end
+                position = size
+                while position > start:
+                    step = min(self.SPLICE_CHUNK, position - start)
+                    position -= step
+                    chunk = os.pread(fd, step, position)
+                    os.pwrite(fd, chunk, position + delta)
+            os.pwrite(fd, data, offset)
+            if delta < 0:
+                file.truncate(size + delta)
+        self._bump_generation()
+
 
 class FileDataStorage(BaseFileDataStorage):
+    """
+    Text storage, which keeps all records in container.
+
+    Several processes may share one file. Writes hold exclusive lock
+    of file and catch up with other processes first. Reads compare
+    generation, size and mtime of file with ones seen last time:
+    when other process only appended records, just the new tail is read,
+    otherwise container is reloaded.
+
+    For tables, which don't fit in memory, pass `cache_size` or
+    `cache_bytes`: container keeps only hot records then and reads
+    the rest by offsets index, see CachedModelContainer.
+    """
+
+    file_format = "txt"
+
+    def __init__(
+        self,
+        container_class: Union[type, None] = None,
+        auto_refresh: bool = True,
+        cache_size: Union[int, None] = None,
+        cache_bytes: Union[int, None] = None,
+        cache_policy: str = "lru",
+        snapshot: Union[bool, None] = None,
+    ) -> None:
+        """
+        :param cache_size: int. Keep at most this many records in memory.
+        :param cache_bytes: int. Keep records of at most this estimated size
+            in memory.
+        :param cache_policy: str. Which records to evict, "lru" or "lfu".
+        :param snapshot: bool. Persist loaded records for warm start,
+            STORAGE_SNAPSHOT setting is used, when not given.
+            Cached storage never uses snapshot: it holds all records
+            at once, which cache must not.
+        :raises: ValueError if snapshot is asked for cached storage
+        """
+        if snapshot and (cache_size is not None or cache_bytes is not None):
+            raise ValueError("Snapshot can't be used with cache_size or cache_bytes")
+        super().__init__(container_class)
+        self.auto_refresh = auto_refresh
+        self.cache_size = cache_size
+        self.cache_bytes = cache_bytes
+        self.cache_policy = cache_policy
+        self.snapshot = snapshot
 
     def _init(self, *args, **kwargs):
         """
@@ -74,17 +262,217 @@ class FileDataStorage(BaseFileDataStorage):
                 This done for fast access to fields by index.
                 You need not to parse fields names each time,
         """
-        self.file_format = "txt"
+        if self.snapshot is None:
+            self.snapshot = lazy_settings.STORAGE_SNAPSHOT and not self._is_cached()
         super()._init(*args, **kwargs)
         self.text_sep = "<-->"
         self.data: List[str] = []
         self.model_fields_map = self.get_sorted_model_fields()
         self.fields_idx_map = self.get_fields_indexes_map()
+        self.codec = self.model_class._codec
+        self.offsets: OffsetIndex = OffsetIndex()
+        self._local = threading.local()
         self.ensure_storage()
+        self._fulltext_state = None
+        self._snapshot_state = None
+        with self._file_locked(exclusive=False):
+            self._seen = self._file_state()
+            self._load_container()
         self.latest_id = self.get_latest_id()
-        self.container = self.load_model_container()
+        if self.fulltext:
+            self.save_fulltext()
+        if self.snapshot:
+            self.save_snapshot()
+        if self.fulltext or self.snapshot:
+            atexit.register(self._save_at_exit)
+
+    @property
+    def _batch(self) -> Union[Dict[int, Union[BaseEntity, None]], None]:
+        """
+        Writes, collected by atomic block of current thread.
+        """
+        return getattr(self._local, "batch", None)
+
+    @_batch.setter
+    def _batch(self, value: Union[Dict[int, Union[BaseEntity, None]], None]) -> None:
+        self._local.batch = value
+
+    def refresh(self) -> bool:
+        """
+        Catch up with changes, made to file by other processes.
+
+        :return: bool. Whether file was changed.
+        """
+        if self._file_state() == self._seen:
+            return False
+        with self.lock.write_locked(), self._file_locked(exclusive=False):
+            return self._refresh()
+
+    def _refresh(self) -> bool:
+        state = self._file_state()
+        if state == self._seen:
+            return False
+        generation, size, _ = state
+        seen_generation, seen_size, _ = self._seen
+        if generation == seen_generation and size > seen_size:
+            self._load_tail(seen_size)
+        else:
+            self._reload()
+        self._seen = state
+        return True
+
+    def _load_tail(self, start: int) -> None:
+        """
+        Apply records, appended by other processes after `start` offset.
+        """
+        batch = {}
+        for offset, line in self._iter_lines_with_offsets(start):
+            if not line.strip():
+                continue
+            instance = self._parse_instance(line.decode(self.encoding))
+            self.offsets[instance.id] = (offset, len(line))
+            batch[instance.id] = instance
+        self._apply_batch_to_container(batch)
+        self.id_allocator.advance_to(max(batch, default=0))
+
+    def _reload(self) -> None:
+        self.indexes = self._init_indexes()
+        self.fulltext = self._init_fulltext()
+        self._load_container()
+        self.id_allocator.advance_to(self.get_latest_id())
+
+    def _load_container(self) -> None:
+        """
+        Load container and indexes. Full-text indexes, persisted
+        for current state of file, are loaded as they are, the rest
+        are built while records are parsed.
+        """
+        state = self._file_state()
+        persisted = {}
+        for name in list(self.fulltext):
+            index = FullTextIndex.load(self._fulltext_path(name), name, state)
+            if index is not None:
+                persisted[name] = index
+                # Keep loaded index away from records loading
+                del self.fulltext[name]
+        self.container = LockedModelContainer(self.load_model_container(), self.lock)
+        self.fulltext.update(persisted)
+        if persisted:
+            self._fulltext_state = state
+
+    def _fulltext_path(self, field: str) -> str:
+        return f"{self.filepath}.{field}.fts"
+
+    def save_fulltext(self) -> None:
+        """
+        Persist full-text indexes next to data file, so next start
+        loads them instead of tokenizing all records again.
+        Indexes are written only when file was changed since last time.
+        """
+        with self.lock.write_locked(), self._file_locked(exclusive=False):
+            self._refresh()
+            state = self._file_state()
+            if state == self._fulltext_state:
+                return
+            for name, index in self.fulltext.items():
+                index.dump(self._fulltext_path(name), state)
+            self._fulltext_state = state
+
+    def _snapshot_path(self) -> str:
+        return f"{self.filepath}.snapshot"
+
+    def _snapshot_schema(self) -> Tuple[Tuple[str, str], ...]:
+        return tuple(
+            (name, self.model_fields_map[name].typ.__name__)
+            for name in self.codec.columns
+        )
+
+    def _read_snapshot(self) -> Union[ContainerSnapshot, None]:
+        """
+        Snapshot, which is still valid for current state of data file.
+        """
+        if not self.snapshot:
+            return None
+        snapshot = ContainerSnapshot.load(
+            self._snapshot_path(), self._snapshot_schema()
+        )
+        if snapshot is None or not snapshot.matches(
+            self.filepath, self._file_state()
+        ):
+            return None
+        return snapshot
+
+    def _snapshot_meta(self) -> Dict[str, Any]:
+        return {}
+
+    def save_snapshot(self) -> None:
+        """
+        Persist loaded records next to data file, so next start reads
+        them at once instead of parsing the whole file.
+        Snapshot is written only when file was changed since it was
+        loaded or written last time. Cached storage never writes it.
+        """
+        if self._is_cached():
+            return
+        with self.lock.write_locked(), self._file_locked(exclusive=False):
+            self._refresh()
+            state = self._file_state()
+            if state == self._snapshot_state:
+                return
+            ids, offsets, lengths = array("q"), array("q"), array("q")
+            dump = self.codec.dump
+            rows = []
+            for instance in self.container.container:
+                offset, length = self.offsets[instance.id]
+                ids.append(instance.id)
+                offsets.append(offset)
+                lengths.append(length)
+                rows.append(dump(instance))
+            ContainerSnapshot(
+                state,
+                ContainerSnapshot.file_checksum(self.filepath, state[1]),
+                ids,
+                offsets,
+                lengths,
+                rows,
+                self._snapshot_meta(),
+            ).dump(self._snapshot_path(), self._snapshot_schema())
+            self._snapshot_state = state
+
+    def _save_at_exit(self) -> None:
+        if not os.path.exists(self.filepath):
+            # Data file is gone, there is nothing to persist
+            return
+        try:
+            if self.fulltext:
+                self.save_fulltext()
+            if self.snapshot:
+                self.save_snapshot()
+        except OSError:
+            # Data file may be gone already, it will be rebuilt then
+            pass
+
+    @contextmanager
+    def _write_locked(self):
+        """
+        Hold write lock of storage and exclusive lock of file,
+        catching up with other processes before the block.
+        """
+        with self.lock.write_locked(), self._file_locked():
+            self._refresh()
+            try:
+                yield
+            finally:
+                self._seen = self._file_state()
+
+    def search(self, **kwargs) -> List[BaseEntity]:
+        if self.auto_refresh:
+            self.refresh()
+        return super().search(**kwargs)
 
     def get(self, id: int) -> Dict[str, Any]:
+        if self.auto_refresh:
+            self.refresh()
         instance = self._get_from_container(id=id)
         if not instance:
             raise ValueError(f"No {self.model_class.__name__} with id {id}")
@@ -94,44 +482,46 @@ class FileDataStorage(BaseFileDataStorage):
         return self.container.search(value=id)
 
     def _parse_instance(self, data: str) -> BaseEntity:
-        instance = self.get_model_instance()
-        values = data.strip().split(self.text_sep)
-        fields_map_list = list(self.fields_idx_map.keys())
-
-        for idx, value in enumerate(values):
-            field_name = fields_map_list[idx]
-            field = self.model_fields_map[field_name]
-            value = self._convert_value_to_type(field, value)
-            field.validate(value)
-            setattr(instance, field_name, value)
-        return instance
-
-    def _convert_value_to_type(self, field: BaseEntityField, value):
-        return field.typ(value)
+        return self.codec.build(data.rstrip("\r\n").split(self.text_sep))
 
     def unparse_instance(self, instance: BaseEntity) -> str:
-        return self.text_sep.join(
-            [str(getattr(instance, title)) for title in self.fields_idx_map.keys()]
-        )
+        return self.text_sep.join(self.codec.dump_text(instance))
+
+    def _encode_instance(self, instance: BaseEntity) -> bytes:
+        return (self.unparse_instance(instance) + "\n").encode(self.encoding)
 
     def save(self, instance):
-        if not instance.id:
-            instance.id = self.latest_id + 1
-            self.latest_id += 1
-            with open(self.filepath, "a", encoding=self.encoding) as f:
-                f.write(self.unparse_instance(instance) + "\n")
-        else:
-            line_number = self._find_line_number_by_field("id", instance.id)
-            print(line_number, instance.id)
-            self._replace_line_in_file(line_number, self.unparse_instance(instance))
+        if self._batch is not None:
+            self._stage_save(instance)
+            return
+        with self._write_locked():
+            if not instance.id:
+                instance.id = self.id_allocator.allocate()
+                data = self._encode_instance(instance)
+                self.offsets[instance.id] = (self._append_bytes(data), len(data))
+                self.container.insert(instance)
+            else:
+                self._update_record(instance)
+                # Saved instance may be a copy of the stored one
+                self.container.insert(instance)
+            self._index_instance(instance)
+
+    def _update_record(self, instance: BaseEntity) -> None:
+        """
+        Rewrite record of instance, using offsets index.
+        Same-length records are patched in place.
+        """
+        if instance.id not in self.offsets:
+            raise ValueError(
+                f"No {self.model_class.__name__} with id {instance.id}"
+            )
+        offset, length = self.offsets[instance.id]
+        data = self._encode_instance(instance)
+        self._splice_bytes(offset, length, data)
+        self.offsets.resize(instance.id, len(data))
 
     def get_latest_id(self):
-        data = self._read_file()
-        if not data:
-            return 0
-        last_line = data[-1]
-        value = last_line.split(self.text_sep)[self.fields_idx_map["id"]]
-        return int(value)
+        return max(self.offsets, default=0)
 
     def _find_line_number_by_field(self, field: str, value: Any) -> Union[int, None]:
         """
@@ -179,26 +569,119 @@ class FileDataStorage(BaseFileDataStorage):
         return instances
 
     def load_model_container(self):
-        container = self.container_class(self.model_class)
-        instances = self._load_instances()
-        for instance in instances:
-            container.insert(instance)
+        """
+        Parse all records into container and build offsets index,
+        where key is instance id and value is (offset, length)
+        of its record in file.
+
+        When snapshot of file is valid, records are taken from it
+        and only records, appended after it, are parsed.
+        """
+        container = self._new_container()
+        self.offsets = OffsetIndex()
+        snapshot = self._read_snapshot()
+        if snapshot is None:
+            container.load(self._iter_records())
+            return container
+        # File of the same generation only grows by new records
+        container.load(
+            chain(self._iter_snapshot(snapshot), self._iter_records(snapshot.size))
+        )
+        self._snapshot_state = snapshot.state
         return container
 
+    def _is_cached(self) -> bool:
+        return self.cache_size is not None or self.cache_bytes is not None
+
+    def _new_container(self) -> BaseModelContainer:
+        if not self._is_cached():
+            return self.container_class(self.model_class)
+        return CachedModelContainer(
+            self.model_class,
+            self._read_instances,
+            self.cache_size,
+            self.cache_bytes,
+            self.cache_policy,
+        )
+
+    def cache_stats(self) -> Union[Dict[str, int], None]:
+        """
+        Hits, misses and evictions of cached container,
+        None when storage keeps all records in memory.
+        """
+        container = self.container.container
+        if not isinstance(container, CachedModelContainer):
+            return None
+        return container.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Operation metrics, plus counters of cached container under "cache" key.
+        """
+        stats = super().stats()
+        cache = self.cache_stats()
+        if cache is not None:
+            stats["cache"] = cache
+        return stats
+
+    def _read_instances(self, ids: List[int]) -> Iterator[BaseEntity]:
+        """
+        Read records of given ids by offsets index.
+        """
+        with open(self.filepath, "rb") as file:
+            fd = file.fileno()
+            for id in ids:
+                offset, length = self.offsets[id]
+                data = os.pread(fd, length, offset)
+                yield self._parse_record(data.decode(self.encoding))
+
+    def _parse_record(self, line: str) -> BaseEntity:
+        return self._parse_instance(line)
+
+    def _iter_records(self, start: int = 0) -> Iterator[BaseEntity]:
+        """
+        Parse records of file one by one, filling offsets and field indexes.
+        """
+        for offset, line in self._iter_lines_with_offsets(start):
+            if not line.strip():
+                continue
+            instance = self._parse_instance(line.decode(self.encoding))
+            self.offsets[instance.id] = (offset, len(line))
+            self._index_instance(instance)
+            yield instance
+
+    def _iter_snapshot(self, snapshot: ContainerSnapshot) -> Iterator[BaseEntity]:
+        """
+        Build records of snapshot, filling offsets and field indexes.
+        """
+        build = self.codec.build_typed
+        for id, offset, length, row in zip(
+            snapshot.ids, snapshot.offsets, snapshot.lengths, snapshot.rows
+        ):
+            self.offsets[id] = (offset, length)
+            instance = build(row)
+            self._index_instance(instance)
+            yield instance
+
     def delete(self, entity: Union[int, BaseEntity]) -> None:
         if isinstance(entity, int):
-            self.delete_instance_by_id(entity)
+            self._delete(entity)
         else:
-            self.delete_instance_by_id(entity.id)
+            self._delete(entity.id)
 
     def _delete(self, id: int) -> None:
-        line = self._find_line_number_by_field("id", id)
-        if line is not None:
-            with open(self.filepath, "r", encoding=self.encoding) as f:
-                lines = f.readlines()
-            del lines[line]
-            with open(self.filepath, "w", encoding=self.encoding) as f:
-                f.writelines(lines)
+        if self._batch is not None:
+            self._stage_delete(id)
+            return
+        with self._write_locked():
+            position = self.offsets.get(id)
+            if position is None:
+                return
+            offset, length = position
+            self._splice_bytes(offset, length, b"")
+            self.offsets.remove(id)
+            self.container.delete(id)
+            self._unindex_instance(id)
 
     # def parse(self, **kwargs) -> Any:
     #     """
@@ -216,37 +699,618 @@ class FileDataStorage(BaseFileDataStorage):
     #     with open(self.filepath, 'r', encoding=self.encoding) as f:
     #         f.readlines() #TODO: REVIEW
 
+    @contextmanager
+    def atomic(self):
+        """
+        Collect saves and deletes in memory and apply them on exit at once.
+        Batch of only new records is appended with one write, otherwise
+        new file is written next to data file and renamed over it.
+        Container and indexes are updated only after file is written,
+        so on any failure nothing is applied to them and ids, given to new
+        instances, are taken back. Stored instances, changed in place
+        before saving, keep their changes though: change copies instead,
+        as bulk_update does. Reads inside block see state before it.
+        Batch belongs to current thread, nested blocks join the outer one.
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = {}
+        latest_id = self.latest_id
+        try:
+            yield self
+            with self._write_locked():
+                self._apply_batch(self._rebase_batch(self._batch, latest_id))
+        except BaseException:
+            for id, instance in self._batch.items():
+                if id > latest_id and instance is not None:
+                    instance.id = None
+            self.id_allocator.rewind(max(self._batch, default=latest_id), latest_id)
+            raise
+        finally:
+            self._batch = None
+
+    def _rebase_batch(
+        self, batch: Dict[int, Union[BaseEntity, None]], latest_id: int
+    ) -> Dict[int, Union[BaseEntity, None]]:
+        """
+        Give new ids to instances, created in batch, when other process
+        has taken their ids meanwhile. Instances, created and deleted
+        in the same batch, are dropped.
+        """
+        created = [id for id in batch if id > latest_id]
+        if not any(id in self.offsets for id in created):
+            return batch
+        rebased = {id: value for id, value in batch.items() if id <= latest_id}
+        for id in created:
+            instance = batch[id]
+            if instance is not None:
+                instance.id = self.id_allocator.allocate()
+                rebased[instance.id] = instance
+        return rebased
+
+    def _is_stored(self, id: int) -> bool:
+        if id in self._batch:
+            return self._batch[id] is not None
+        return id in self.offsets
+
+    def _stage_save(self, instance: BaseEntity) -> None:
+        if not instance.id:
+            instance.id = self.id_allocator.allocate()
+        elif not self._is_stored(instance.id):
+            raise ValueError(f"No {self.model_class.__name__} with id {instance.id}")
+        self._batch[instance.id] = instance
+
+    def _stage_delete(self, id: int) -> None:
+        if self._is_stored(id):
+            self._batch[id] = None
+
+    def _apply_batch(self, batch: Dict[int, Union[BaseEntity, None]]) -> None:
+        if not batch:
+            return
+        if any(id in self.offsets for id in batch):
+            self._rewrite_with_batch(batch)
+        else:
+            self._append_batch(batch)
+        self._apply_batch_to_container(batch)
+
+    def _apply_batch_to_container(
+        self, batch: Dict[int, Union[BaseEntity, None]]
+    ) -> None:
+        for id, instance in batch.items():
+            if instance is None:
+                self.container.delete(id)
+                self._unindex_instance(id)
+            else:
+                self.container.insert(instance)
+                self._index_instance(instance)
+
+    def _append_batch(self, batch: Dict[int, Union[BaseEntity, None]]) -> None:
+        start = os.path.getsize(self.filepath)
+        offset = start
+        chunks, offsets = [], {}
+        for id in sorted(batch):
+            if batch[id] is None:
+                continue
+            data = self._encode_instance(batch[id])
+            offsets[id] = (offset, len(data))
+            offset += len(data)
+            chunks.append(data)
+        try:
+            with open(self.filepath, "ab") as file:
+                file.write(b"".join(chunks))
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            with open(self.filepath, "r+b") as file:
+                file.truncate(start)
+            raise
+        self.offsets.update(offsets)
+
+    def _rewrite_with_batch(self, batch: Dict[int, Union[BaseEntity, None]]) -> None:
+        ids_by_offset = {offset: id for id, (offset, _) in self.offsets.items()}
+        tmp_path = self.filepath + ".tmp"
+        offsets = {}
+        try:
+            with open(tmp_path, "wb") as dst:
+                for offset, line in self._iter_lines_with_offsets():
+                    id = ids_by_offset.get(offset)
+                    if id in batch:
+                        if batch[id] is None:
+                            continue
+                        line = self._encode_instance(batch[id])
+                    if id is not None:
+                        offsets[id] = (dst.tell(), len(line))
+                    dst.write(line)
+                for id in sorted(batch):
+                    if id not in self.offsets and batch[id] is not None:
+                        data = self._encode_instance(batch[id])
+                        offsets[id] = (dst.tell(), len(data))
+                        dst.write(data)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp_path, self.filepath)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._bump_generation()
+        self.offsets = OffsetIndex(offsets)
+
+
+class LogFileDataStorage(FileDataStorage):
+    """
+    Append-only variant of FileDataStorage.
+
+    Every save appends a new version of record and every delete appends
+    a tombstone, so writes never touch existing bytes of file.
+    On load the log is replayed and only the last version of each id is kept.
+    When ratio of dead records to live ones passes `compaction_threshold`,
+    live set is rewritten into a new file in background thread.
+
+    Record format:
+        S<-->version<-->field1<-->field2...
+        D<-->version<-->id
+    """
+
+    file_format = "log"
+    save_marker = "S"
+    delete_marker = "D"
+
+    def __init__(
+        self,
+        compaction_threshold: Union[float, None] = None,
+        container_class: Union[type, None] = None,
+        **kwargs,
+    ) -> None:
+        """
+        :param kwargs: options of FileDataStorage, like cache_size.
+        """
+        super().__init__(container_class, **kwargs)
+        self.compaction_threshold = compaction_threshold
+
+    def _init(self, *args, **kwargs):
+        if self.compaction_threshold is None:
+            self.compaction_threshold = lazy_settings.LOG_COMPACTION_THRESHOLD
+        self.version = 0
+        self.max_id = 0
+        self.records_count = 0
+        self._compaction: Union[threading.Thread, None] = None
+        self._compaction_lock = threading.Lock()
+        super()._init(*args, **kwargs)
 
-class JsonDataStorage(BaseDataStorage):
-    def __init__(self, model, filepath: str) -> None:
-        self.filepath = filepath
-        super().__init__(model)
-        self.init_storage()
-        self.data = self.parse()
+    @property
+    def dead_records(self) -> int:
+        return self.records_count - len(self.offsets)
 
-    def get(self, **kwargs) -> Dict[str, Any]:
+    def load_model_container(self):
+        """
+        Replay log, keeping only the last version of each id.
+        Superseded versions are never parsed.
+
+        When snapshot of log is valid, replay starts with its records
+        and covers only records, appended after it.
+        """
+        container = self._new_container()
+        id_idx = self.fields_idx_map["id"]
+        latest: Dict[int, Union[Tuple[int, int, Union[str, tuple]], None]] = {}
+        self.records_count = 0
+        start = 0
+        snapshot = self._read_snapshot()
+        if snapshot is not None:
+            latest = dict(
+                zip(
+                    snapshot.ids,
+                    zip(snapshot.offsets, snapshot.lengths, snapshot.rows),
+                )
+            )
+            self.version = max(self.version, snapshot.meta["version"])
+            self.max_id = max(self.max_id, snapshot.meta["max_id"])
+            self.records_count = snapshot.meta["records_count"]
+            start = snapshot.size
+            self._snapshot_state = snapshot.state
+
+        for offset, line in self._iter_lines_with_offsets(start):
+            if not line.strip():
+                continue
+            marker, version, payload = line.decode(self.encoding).split(
+                self.text_sep, 2
+            )
+            self.records_count += 1
+            self.version = max(self.version, int(version))
+            if marker == self.delete_marker:
+                id = int(payload)
+                latest[id] = None
+            else:
+                id = int(payload.split(self.text_sep)[id_idx])
+                latest[id] = (offset, len(line), payload)
+            self.max_id = max(self.max_id, id)
+
+        self.offsets = {}
+        container.load(self._iter_live_records(latest))
+        return container
+
+    def _load_tail(self, start: int) -> None:
+        """
+        Replay records, appended by other processes after `start` offset.
+        """
+        batch = {}
+        for offset, line in self._iter_lines_with_offsets(start):
+            if not line.strip():
+                continue
+            marker, version, payload = line.decode(self.encoding).split(
+                self.text_sep, 2
+            )
+            self.records_count += 1
+            self.version = max(self.version, int(version))
+            if marker == self.delete_marker:
+                id = int(payload)
+                self.offsets.pop(id, None)
+                batch[id] = None
+            else:
+                instance = self._parse_instance(payload)
+                id = instance.id
+                self.offsets[id] = (offset, len(line))
+                batch[id] = instance
+            self.max_id = max(self.max_id, id)
+        self._apply_batch_to_container(batch)
+        self.id_allocator.advance_to(self.max_id)
+
+    def _iter_live_records(
+        self, latest: Dict[int, Union[Tuple[int, int, Union[str, tuple]], None]]
+    ) -> Iterator[BaseEntity]:
+        """
+        :param latest: id -> (offset, length, payload) of the last version
+            of record or None for deleted one. Payload is text of record
+            or tuple of values, taken from snapshot.
+        """
+        build = self.codec.build_typed
+        for id in sorted(latest):
+            record = latest[id]
+            if record is None:
+                continue
+            offset, length, payload = record
+            self.offsets[id] = (offset, length)
+            if isinstance(payload, tuple):
+                instance = build(payload)
+            else:
+                instance = self._parse_instance(payload)
+            self._index_instance(instance)
+            yield instance
+
+    def get_latest_id(self):
+        return self.max_id
+
+    def _snapshot_meta(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "max_id": self.max_id,
+            "records_count": self.records_count,
+        }
+
+    def _parse_record(self, line: str) -> BaseEntity:
+        return self._parse_instance(line.split(self.text_sep, 2)[2])
+
+    def _encode_record(self, marker: str, payload: str) -> bytes:
+        self.version += 1
+        line = self.text_sep.join((marker, str(self.version), payload))
+        return (line + "\n").encode(self.encoding)
+
+    def save(self, instance):
+        if self._batch is not None:
+            self._stage_save(instance)
+            return
+        with self._write_locked():
+            if not instance.id:
+                instance.id = self.id_allocator.allocate()
+                self.max_id = max(self.max_id, instance.id)
+            data = self._encode_record(
+                self.save_marker, self.unparse_instance(instance)
+            )
+            self.offsets[instance.id] = (self._append_bytes(data), len(data))
+            self.records_count += 1
+            self.container.insert(instance)
+            self._index_instance(instance)
+        self._maybe_compact()
+
+    def _delete(self, id: int) -> None:
+        if self._batch is not None:
+            self._stage_delete(id)
+            return
+        with self._write_locked():
+            if self.offsets.pop(id, None) is None:
+                return
+            self._append_bytes(self._encode_record(self.delete_marker, str(id)))
+            self.records_count += 1
+            self.container.delete(id)
+            self._unindex_instance(id)
+        self._maybe_compact()
+
+    def _apply_batch(self, batch: Dict[int, Union[BaseEntity, None]]) -> None:
+        """
+        Append all records of batch with one write.
         """
-        Filters data by keyword args, where:
+        if not batch:
+            return
+        with self._write_locked():
+            start = os.path.getsize(self.filepath)
+            offset = start
+            chunks, offsets, deleted = [], {}, []
+            for id, instance in batch.items():
+                if instance is None:
+                    if id not in self.offsets:
+                        continue
+                    data = self._encode_record(self.delete_marker, str(id))
+                    deleted.append(id)
+                else:
+                    data = self._encode_record(
+                        self.save_marker, self.unparse_instance(instance)
+                    )
+                    offsets[id] = (offset, len(data))
+                offset += len(data)
+                chunks.append(data)
+            try:
+                with open(self.filepath, "ab") as file:
+                    file.write(b"".join(chunks))
+                    file.flush()
+                    os.fsync(file.fileno())
+            except BaseException:
+                with open(self.filepath, "r+b") as file:
+                    file.truncate(start)
+                raise
+            for id in deleted:
+                del self.offsets[id]
+            self.offsets.update(offsets)
+            self.records_count += len(chunks)
+            self.max_id = max(self.max_id, max(batch))
+            self._apply_batch_to_container(batch)
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        with self.lock.write_locked():
+            if self.dead_records <= self.compaction_threshold * max(
+                len(self.offsets), 1
+            ):
+                return
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._compaction = threading.Thread(target=self.compact, daemon=True)
+            self._compaction.start()
+
+    def compact(self) -> None:
+        """
+        Rewrite live records into a new file and atomically replace the log.
+
+        Live records are copied as raw bytes without holding the write lock,
+        since bytes already written to log never change. Records appended
+        meanwhile are copied as is under the lock right before the swap.
+        Only one compaction runs at a time. When other process has rewritten
+        the log meanwhile, compaction is dropped.
+        """
+        with self._compaction_lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        tmp_path = f"{self.filepath}.{os.getpid()}.compact"
+        with self._write_locked():
+            generation = self.read_generation()
+            snapshot_size = os.path.getsize(self.filepath)
+            snapshot_count = self.records_count
+            positions = sorted(self.offsets.items(), key=lambda item: item[1][0])
+
+        copied: Dict[int, Tuple[int, int]] = {}
+        with open(self.filepath, "rb") as src, open(tmp_path, "wb") as dst:
+            for id, (offset, length) in positions:
+                src.seek(offset)
+                copied[id] = (dst.tell(), length)
+                dst.write(src.read(length))
+
+        with self._write_locked():
+            if self.read_generation() != generation:
+                os.remove(tmp_path)
+                return
+            with open(self.filepath, "rb") as src, open(tmp_path, "ab") as dst:
+                tail_start = dst.seek(0, os.SEEK_END)
+                src.seek(snapshot_size)
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp_path, self.filepath)
+            self._bump_generation()
+            self.offsets = {
+                id: (
+                    (offset - snapshot_size + tail_start, length)
+                    if offset >= snapshot_size
+                    else copied[id]
+                )
+                for id, (offset, length) in self.offsets.items()
+            }
+            self.records_count = len(positions) + self.records_count - snapshot_count
+
+
+class JsonDataStorage(BaseFileDataStorage):
+    """
+    JSON Lines storage: one JSON object per line.
+
+    File is never loaded as a whole. Queries stream it line by line
+    and evaluate filters during the scan, so memory does not grow
+    with file size. Cheap raw text check is done before parsing line,
+    so most of non-matching lines are never decoded.
+    New records are appended, updates and deletes stream the file
+    into a temporary copy, which replaces the original.
+
+    Container is not filled on init, but load_model_container
+    still returns one with all records, when it is really needed.
+    """
+
+    file_format = "jsonl"
+    TAIL_CHUNK = 4096
+
+    def _init(self, *args, **kwargs):
+        super()._init(*args, **kwargs)
+        self.codec = self.model_class._codec
+        self.ensure_storage()
+        self.latest_id = self.get_latest_id()
+
+    def _init_indexes(self) -> Dict[str, Any]:
+        # Records are streamed from file, in-memory indexes would stay empty
+        return {}
+
+    def _init_fulltext(self) -> Dict[str, Any]:
+        return {}
+
+    def _dumps(self, instance: BaseEntity) -> bytes:
+        record = dict(zip(self.codec.columns, self.codec.dump(instance)))
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        return (line + "\n").encode(self.encoding)
+
+    def _build(self, record: Dict[str, Any]) -> BaseEntity:
+        return self.codec.build_typed([record.get(name) for name in self.codec.columns])
+
+    def get_latest_id(self) -> int:
+        """
+        Id of the last record. Records are appended with growing ids,
+        so only the tail of file is read.
+        """
+        with open(self.filepath, "rb") as file:
+            end = file.seek(0, os.SEEK_END)
+            tail = b""
+            while end > 0:
+                start = max(0, end - self.TAIL_CHUNK)
+                file.seek(start)
+                tail = file.read(end - start) + tail
+                end = start
+                lines = tail.strip().splitlines()
+                if len(lines) > 1 or (lines and start == 0):
+                    return int(json.loads(lines[-1])["id"])
+        return 0
+
+    def _compile_filters(self, kwargs: Dict[str, Any]):
+        """
+        Split filters into raw byte needles and exact checks.
+        Needle is JSON form of value and is used only when it can't be
+        written differently by other JSON encoders (plain ASCII without escapes).
+        """
+        for key in kwargs:
+            if key not in self.model_fields_map:
+                raise ValueError(
+                    f"Field {key} is not field of model {self.model_class.__name__}"
+                )
+        needles = []
+        for value in kwargs.values():
+            text = json.dumps(value)
+            if text.isascii() and "\\" not in text:
+                needles.append(text.encode(self.encoding))
+        return needles, list(kwargs.items())
+
+    def iter_records(self, **kwargs) -> Iterator[Dict[str, Any]]:
+        """
+        Stream raw records, which fields are equal to given values.
+        """
+        needles, checks = self._compile_filters(kwargs)
+        with open(self.filepath, "rb") as file:
+            for line in file:
+                if not all(needle in line for needle in needles):
+                    continue
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if all(record.get(key) == value for key, value in checks):
+                    yield record
+
+    def iter_search(self, **kwargs) -> Iterator[BaseEntity]:
+        for record in self.iter_records(**kwargs):
+            yield self._build(record)
+
+    def search(self, **kwargs) -> List[BaseEntity]:
+        return list(self.iter_search(**kwargs))
+
+    def _iter_instances(self) -> Iterator[BaseEntity]:
+        return self.iter_search()
+
+    def get(self, **kwargs) -> BaseEntity:
+        """
+        Find single instance by keyword args, where:
             key: field name
             value: field value
+        Scan stops on first match, when filtering by id.
         :param kwargs: Dict[str, Any] of course.
-        :return: Dict[str, Any]
+        :return: BaseEntity
         raises: ValueError if no kwargs provided
         raises: ValueError if no data found
         raises: ValueError if more than one data found
         raises: ValueError if key is not model field
         """
         if not kwargs:
-            return self.data
-        filtered = []
-        for item in self.data:
-            for key, value in kwargs.items():
-                if item.get(key) == value:
-                    filtered.append(item)
-
-    def parse(self) -> Dict[str, Any]:
-        with open(self.filepath, "r", encoding="utf-8") as file:
-            return json.load(file)
+            raise ValueError("Provide at least one field to get instance by")
+        found = None
+        for record in self.iter_records(**kwargs):
+            if found is not None:
+                raise ValueError(
+                    f"More than one {self.model_class.__name__} found for {kwargs}"
+                )
+            found = record
+            if "id" in kwargs:
+                break
+        if found is None:
+            raise ValueError(f"No {self.model_class.__name__} found for {kwargs}")
+        return self._build(found)
+
+    def _lookup(self, id: int) -> Union[BaseEntity, None]:
+        for record in self.iter_records(id=id):
+            return self._build(record)
+        return None
+
+    def save(self, instance: BaseEntity) -> None:
+        with self.lock.write_locked(), self._file_locked():
+            if not instance.id:
+                # Other processes may have appended records meanwhile
+                self.id_allocator.advance_to(self.get_latest_id())
+                instance.id = self.id_allocator.allocate()
+                self._append_bytes(self._dumps(instance))
+            elif not self._rewrite(instance.id, self._dumps(instance)):
+                raise ValueError(
+                    f"No {self.model_class.__name__} with id {instance.id}"
+                )
+
+    def delete(self, entity: Union[int, BaseEntity]) -> None:
+        self._delete(entity if isinstance(entity, int) else entity.id)
+
+    def _delete(self, id: int) -> None:
+        with self.lock.write_locked(), self._file_locked():
+            self._rewrite(id, b"")
+
+    def _rewrite(self, id: int, data: bytes) -> bool:
+        """
+        Stream file into temporary copy, replacing record of id with data.
+
+        :return: bool. Whether record was found.
+        """
+        needle = str(id).encode(self.encoding)
+        tmp_path = self.filepath + ".tmp"
+        found = False
+        with open(self.filepath, "rb") as src, open(tmp_path, "wb") as dst:
+            for line in src:
+                if (
+                    not found
+                    and needle in line
+                    and line.strip()
+                    and json.loads(line).get("id") == id
+                ):
+                    found = True
+                    dst.write(data)
+                else:
+                    dst.write(line)
+        if found:
+            os.replace(tmp_path, self.filepath)
+        else:
+            os.remove(tmp_path)
+        return found
+
+    def load_model_container(self):
+        container = self.container_class(self.model_class)
+        container.load(self._iter_instances())
+        return container
 
 
 # class FileDataStorage(BaseFileDataStorage):
@@ -0,0 +1,96 @@
+import shlex
+from typing import Awaitable, Callable, Dict, List, Union
+
+from src.apps.book.service import BookService
+from src.apps.book.view import BookView
+
+HELP = """Commands:
+    add <title> <author> [year]   add book, quote values with spaces
+    get <id>                      show book
+    set <id> <field> <value>      change title, author or year of book
+    delete <id>                   delete book
+    author <author>               books of author
+    search <words>                books, which titles have all words
+    suggest <prefix>              titles, starting with prefix
+    help                          this help"""
+
+
+class BookController:
+    """
+    Turns command lines of session into service calls and renders
+    their results. One controller may serve any number of sessions
+    of one event loop, calls never block it.
+
+        reply = await controller.handle('add "Dune" "Frank Herbert" 1965')
+    """
+
+    def __init__(
+        self,
+        service: Union[BookService, None] = None,
+        view: Union[BookView, None] = None,
+    ) -> None:
+        self.service = service or BookService()
+        self.view = view or BookView()
+        self.commands: Dict[str, Callable[[List[str]], Awaitable[str]]] = {
+            "add": self.add,
+            "get": self.get,
+            "set": self.update,
+            "delete": self.delete,
+            "author": self.author,
+            "search": self.search,
+            "suggest": self.suggest,
+            "help": self.help,
+        }
+
+    async def handle(self, line: str) -> str:
+        """
+        Run command line and return text reply. Errors of command
+        are replied too, so session goes on.
+        """
+        try:
+            name, *args = shlex.split(line) or ["help"]
+            command = self.commands.get(name.lower())
+            if command is None:
+                raise ValueError(f"Unknown command {name}, try help")
+            return await command(args)
+        except (ValueError, TypeError) as e:
+            return self.view.error(e)
+
+    async def add(self, args: List[str]) -> str:
+        if len(args) not in (2, 3):
+            raise ValueError("Usage: add <title> <author> [year]")
+        year = int(args[2]) if len(args) == 3 else None
+        return self.view.book(await self.service.add_book(args[0], args[1], year))
+
+    async def get(self, args: List[str]) -> str:
+        return self.view.book(await self.service.get_book(_id(args)))
+
+    async def update(self, args: List[str]) -> str:
+        if len(args) != 3:
+            raise ValueError("Usage: set <id> <field> <value>")
+        field, value = args[1], args[2]
+        changes = {field: int(value) if field == "year" else value}
+        return self.view.book(await self.service.update_book(_id(args), changes))
+
+    async def delete(self, args: List[str]) -> str:
+        id = _id(args)
+        await self.service.remove_book(id)
+        return self.view.message(f"Book #{id} deleted")
+
+    async def author(self, args: List[str]) -> str:
+        return self.view.books(await self.service.books_of(" ".join(args)))
+
+    async def search(self, args: List[str]) -> str:
+        return self.view.books(await self.service.search(" ".join(args)))
+
+    async def suggest(self, args: List[str]) -> str:
+        return self.view.titles(await self.service.suggest_titles(" ".join(args)))
+
+    async def help(self, args: List[str]) -> str:
+        return self.view.message(HELP)
+
+
+def _id(args: List[str]) -> int:
+    if not args or not args[0].isdigit():
+        raise ValueError("Book id must be a number")
+    return int(args[0])
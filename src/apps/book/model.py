@@ -1,2 +1,12 @@
-class Book:
-    def __init__(self) ->:
\ No newline at end of file
+from db.base import BaseEntity
+from db.entities.fields import IntegerField, StringField
+from utils.settings import lazy_settings
+
+
+class Book(BaseEntity):
+    storage = lazy_settings.DEFAULT_DATA_STORAGE()
+
+    id = IntegerField()
+    title = StringField(max_len=200, required=True, indexed="prefix", fulltext=True)
+    author = StringField(max_len=100, required=True, indexed=True)
+    year = IntegerField(max_value=9999)
@@ -0,0 +1,48 @@
+from typing import List, Union
+
+from db.aio import AsyncStorage
+from src.apps.book.model import Book
+
+
+class BookRepository:
+    """
+    Stored books for async callers. Every call runs on executor
+    of AsyncStorage, so event loop is never blocked by storage.
+    """
+
+    def __init__(self, storage: Union[AsyncStorage, None] = None) -> None:
+        self.storage = storage or AsyncStorage.for_model(Book)
+
+    async def get(self, id: int) -> Book:
+        """
+        :raises: ValueError if there is no book with such id
+        """
+        return await self.storage.get(id)
+
+    async def add(self, **fields) -> Book:
+        return await self.storage.create(**fields)
+
+    async def save(self, book: Book) -> None:
+        await self.storage.save(book)
+
+    async def remove(self, id: int) -> None:
+        await self.storage.delete(id)
+
+    async def find(self, **kwargs) -> List[Book]:
+        return await self.storage.search(**kwargs)
+
+    async def search_title(self, query: str, limit: int = 20) -> List[Book]:
+        """
+        Best matches of words of query in titles.
+        """
+        storage = await self.storage.open()
+        return await self.storage.run(
+            storage.search_text, "title", query, limit=limit
+        )
+
+    async def complete_title(self, prefix: str, limit: int = 10) -> List[str]:
+        storage = await self.storage.open()
+        return await self.storage.run(storage.autocomplete, "title", prefix, limit)
+
+    def close(self) -> None:
+        self.storage.close()
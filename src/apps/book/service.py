@@ -0,0 +1,70 @@
+from typing import Any, Dict, List, Union
+
+from src.apps.book.model import Book
+from src.apps.book.repository import BookRepository
+
+
+class BookService:
+    """
+    Use cases of book library. Values are cleaned here,
+    fields validate them once more, when they are set.
+    """
+
+    def __init__(self, repository: Union[BookRepository, None] = None) -> None:
+        self.repository = repository or BookRepository()
+
+    async def add_book(
+        self, title: str, author: str, year: Union[int, None] = None
+    ) -> Book:
+        """
+        :raises: ValueError if title or author is empty
+        """
+        return await self.repository.add(
+            title=_required(title, "title"),
+            author=_required(author, "author"),
+            year=year,
+        )
+
+    async def get_book(self, id: int) -> Book:
+        return await self.repository.get(id)
+
+    async def update_book(self, id: int, changes: Dict[str, Any]) -> Book:
+        """
+        Changes are made on copy of stored book, which replaces it on save,
+        so concurrent readers see either old or new book, never a mix.
+
+        :param changes: Dict[str, Any]. Field name -> new value.
+        :raises: ValueError if there is no book with such id or field is unknown
+        """
+        book = (await self.repository.get(id)).copy()
+        for name, value in changes.items():
+            if name not in Book._fields or name == "id":
+                raise ValueError(f"Field {name} of book can't be changed")
+            if name in ("title", "author"):
+                value = _required(value, name)
+            setattr(book, name, value)
+        await self.repository.save(book)
+        return book
+
+    async def remove_book(self, id: int) -> None:
+        """
+        :raises: ValueError if there is no book with such id
+        """
+        await self.repository.get(id)
+        await self.repository.remove(id)
+
+    async def books_of(self, author: str) -> List[Book]:
+        return await self.repository.find(author=_required(author, "author"))
+
+    async def search(self, query: str, limit: int = 20) -> List[Book]:
+        return await self.repository.search_title(query, limit)
+
+    async def suggest_titles(self, prefix: str, limit: int = 10) -> List[str]:
+        return await self.repository.complete_title(prefix, limit)
+
+
+def _required(value: Union[str, None], name: str) -> str:
+    value = (value or "").strip()
+    if not value:
+        raise ValueError(f"Book {name} can't be empty")
+    return value
@@ -0,0 +1,26 @@
+from typing import Iterable
+
+from src.apps.book.model import Book
+
+
+class BookView:
+    """
+    Text representation of books for console and network sessions.
+    """
+
+    def book(self, book: Book) -> str:
+        year = f" ({book.year})" if book.year is not None else ""
+        return f"#{book.id} {book.title} by {book.author}{year}"
+
+    def books(self, books: Iterable[Book]) -> str:
+        lines = [self.book(book) for book in books]
+        return "\n".join(lines) if lines else "No books found"
+
+    def titles(self, titles: Iterable[str]) -> str:
+        return "\n".join(titles) or "No titles found"
+
+    def message(self, text: str) -> str:
+        return text
+
+    def error(self, error: Exception) -> str:
+        return f"Error: {error}"
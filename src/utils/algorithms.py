@@ -1,26 +1,22 @@
-from typing import Any, Callable, List
+from bisect import bisect_left
+from typing import Any, Callable, List, Sequence
 
+from src.utils.sorting import sort
 
-def bin_search(arr: List[int], target: int) -> int:
-    left = 0
-    right = len(arr) - 1
-    while left <= right:
-        mid = (left + right) // 2
-        if arr[mid] == target:
-            return mid
-        if arr[mid] > target:
-            right = mid - 1
-        else:
-            left = mid + 1
 
+def bin_search(arr: Sequence[int], target: int) -> int:
+    """
+    Index of target in ascending sorted sequence, or -1 if it is absent.
+    Works with any sequence, including array('q').
+    """
+    idx = bisect_left(arr, target)
+    if idx < len(arr) and arr[idx] == target:
+        return idx
+    return -1
 
-def qsort(arr: List[Any], key: Callable[[Any], Any] = lambda x: x) -> List[Any]:
-    if len(arr) <= 1:
-        return arr
-
-    pivot = key(arr[len(arr) // 2])
-    left = [item for item in arr if key(item) < pivot]
-    middle = [item for item in arr if key(item) == pivot]
-    right = [item for item in arr if key(item) > pivot]
 
-    return qsort(left, key) + middle + qsort(right, key)
+def qsort(arr: List[Any], key: Callable[[Any], Any] = lambda x: x) -> List[Any]:
+    """
+    Sorted copy of arr. Kept for old callers, see src.utils.sorting.
+    """
+    return sort(arr, key=key)
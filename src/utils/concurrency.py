@@ -0,0 +1,132 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """
+    Reader-writer lock: many readers or one writer at a time.
+
+    Writers are preferred: new readers wait while some writer is waiting,
+    so writers don't starve under steady read load. Lock is reentrant:
+    thread may take read or write lock again while holding write lock,
+    and read lock again while holding read lock. Upgrading read lock
+    to write lock is not supported and raises RuntimeError.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def _read_stack(self) -> list:
+        stack = getattr(self._local, "reads", None)
+        if stack is None:
+            stack = self._local.reads = []
+        return stack
+
+    def acquire_read(self) -> None:
+        stack = self._read_stack()
+        me = threading.get_ident()
+        if self._writer == me or stack:
+            # Nested read is served by the lock thread already holds
+            stack.append(False)
+            return
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        stack.append(True)
+
+    def release_read(self) -> None:
+        if not self._read_stack().pop():
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        if self._read_stack():
+            raise RuntimeError("Can't take write lock while holding read lock")
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self) -> None:
+        self._write_depth -= 1
+        if self._write_depth:
+            return
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class IdAllocator:
+    """
+    Thread-safe allocator of growing integer ids.
+    """
+
+    def __init__(self, current: int = 0) -> None:
+        self._lock = threading.Lock()
+        self._current = current
+
+    @property
+    def current(self) -> int:
+        return self._current
+
+    def allocate(self) -> int:
+        with self._lock:
+            self._current += 1
+            return self._current
+
+    def reset(self, value: int) -> None:
+        with self._lock:
+            self._current = value
+
+    def rewind(self, expected: int, value: int) -> bool:
+        """
+        Give ids back, moving current id down to value, but only if nobody
+        allocated ids since current id was `expected`.
+
+        :return: bool. Whether ids were given back.
+        """
+        with self._lock:
+            if self._current != expected:
+                return False
+            self._current = value
+            return True
+
+    def advance_to(self, value: int) -> None:
+        """
+        Make sure next allocated id is greater than value.
+        """
+        with self._lock:
+            if value > self._current:
+                self._current = value
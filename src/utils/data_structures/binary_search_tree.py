@@ -1,7 +1,15 @@
-from typing import Any, Callable, Union
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, Union
+
+
+class NotSortedError(ValueError):
+    """
+    Keys of values, given to AVLTree.from_sorted, are not strictly ascending.
+    """
 
 
 class Node:
+    __slots__ = ("key", "value", "left", "right", "height")
+
     def __init__(self, key, value) -> None:
         self.key = key
         self.value = value
@@ -16,6 +24,46 @@ class AVLTree:
     ) -> None:
         self.root = None
         self.key_getter = key_getter
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def from_sorted(
+        cls,
+        items: Iterable[Any],
+        key_getter: Callable[[Any], Union[int, str]] = lambda x: x,
+    ) -> "AVLTree":
+        """
+        Build balanced tree from values ordered by strictly ascending keys in O(n).
+        Keys are taken from items one by one, as they are consumed.
+
+        :raises: NotSortedError if keys are not strictly ascending
+        """
+        tree = cls(key_getter)
+        keys, values = [], []
+        for value in items:
+            key = key_getter(value)
+            if keys and not keys[-1] < key:
+                raise NotSortedError(
+                    f"Keys must be strictly ascending, got {key} after {keys[-1]}"
+                )
+            keys.append(key)
+            values.append(value)
+        tree.root = tree._build(keys, values, 0, len(keys))
+        tree.size = len(keys)
+        return tree
+
+    def _build(self, keys: list, values: list, lo: int, hi: int) -> Optional[Node]:
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        node = Node(keys[mid], values[mid])
+        node.left = self._build(keys, values, lo, mid)
+        node.right = self._build(keys, values, mid + 1, hi)
+        self._update_height(node)
+        return node
 
     def get_key(self, value: Any) -> Union[int, str]:
         try:
@@ -23,52 +71,83 @@ class AVLTree:
         except Exception as e:
             raise ValueError(f"Can't get key from value: {value}") from e
 
+    def search(self, key: Union[int, str]) -> Union[None, Any]:
+        node = self.root
+        while node:
+            if key == node.key:
+                return node.value
+            node = node.left if key < node.key else node.right
+        return None
+
     def insert(self, value: Any) -> None:
         key = self.key_getter(value)
-        self.root = self._insert(self.root, key, value)
+        path = []
+        node = self.root
+        while node:
+            if key == node.key:
+                node.value = value
+                return
+            path.append(node)
+            node = node.left if key < node.key else node.right
+
+        new_node = Node(key, value)
+        self.size += 1
+        if not path:
+            self.root = new_node
+            return
+        parent = path[-1]
+        if key < parent.key:
+            parent.left = new_node
+        else:
+            parent.right = new_node
+        self._rebalance_path(path)
 
     def delete(self, key: Union[str, int]) -> None:
-        self.root = self._delete(self.root, key)
+        path = []
+        node = self.root
+        while node and key != node.key:
+            path.append(node)
+            node = node.left if key < node.key else node.right
+        if not node:
+            return
 
-    def search(self, key: Union[int, str]) -> Union[None, Any]:
-        return self._search(self.root, key)
+        if node.left and node.right:
+            # Replace node with its in-order successor, then unlink successor
+            path.append(node)
+            successor = node.right
+            while successor.left:
+                path.append(successor)
+                successor = successor.left
+            node.key, node.value = successor.key, successor.value
+            node = successor
 
-    def _search(self, node: Node, key) -> Union[None, Any]:
-        if not node:
-            return None
-        if key == node.key:
-            return node.value
-        if key < node.key:
-            return self._search(node.left, key)
-        return self._search(node.right, key)
+        self._replace_child(path[-1] if path else None, node, node.left or node.right)
+        self.size -= 1
+        self._rebalance_path(path)
 
-    def _insert(self, node, key, value) -> Node:
-        if not node:
-            return Node(key, value)
-        if key == node.key:
-            node.value = value
-        elif key < node.key:
-            node.left = self._insert(node.left, key, value)
+    def _replace_child(
+        self, parent: Optional[Node], child: Node, new_child: Optional[Node]
+    ) -> None:
+        if parent is None:
+            self.root = new_child
+        elif parent.left is child:
+            parent.left = new_child
         else:
-            node.right = self._insert(node.right, key, value)
-        return self._balance(node)
+            parent.right = new_child
 
-    def _delete(self, node, key) -> Node:
-        if not node:
-            return None
-        if key == node.key:
-            if not node.left:
-                return node.right
-            if not node.right:
-                return node.left
-            min_node = self._find_min(node.right)
-            node.key, node.value = min_node.key, min_node.value
-            node.right = self._delete(node.right, min_node.key)
-        elif key < node.key:
-            node.left = self._delete(node.left, key)
-        else:
-            node.right = self._delete(node.right, key)
-        return self._balance(node)
+    def _rebalance_path(self, path: list) -> None:
+        """
+        Restore balance of nodes on path from root to changed node, bottom up.
+        Stops as soon as subtree keeps its height and root.
+        """
+        for idx in range(len(path) - 1, -1, -1):
+            node = path[idx]
+            old_height = node.height
+            new_node = self._balance(node)
+            if new_node is not node:
+                self._replace_child(path[idx - 1] if idx else None, node, new_node)
+            elif node.height == old_height:
+                return
 
     def _find_min(self, node: Node) -> Node:
         while node.left:
@@ -127,14 +206,100 @@ class AVLTree:
         node.right = self._rotate_right(node.right)
         return self._rotate_left(node)
 
-    def in_order(self):
-        yield from self._in_order(self.root)
+    def floor(self, key: Union[int, str]) -> Optional[Tuple[Any, Any]]:
+        """
+        Greatest (key, value) pair with key <= given key.
+        """
+        node, found = self.root, None
+        while node:
+            if key == node.key:
+                return node.key, node.value
+            if key < node.key:
+                node = node.left
+            else:
+                found = node
+                node = node.right
+        return (found.key, found.value) if found else None
 
-    def _in_order(self, node: Node):
-        if node:
-            yield from self._in_order(node.left)
+    def ceiling(self, key: Union[int, str]) -> Optional[Tuple[Any, Any]]:
+        """
+        Least (key, value) pair with key >= given key.
+        """
+        node, found = self.root, None
+        while node:
+            if key == node.key:
+                return node.key, node.value
+            if key > node.key:
+                node = node.right
+            else:
+                found = node
+                node = node.left
+        return (found.key, found.value) if found else None
+
+    def successor(self, key: Union[int, str]) -> Optional[Tuple[Any, Any]]:
+        """
+        Least (key, value) pair with key strictly greater than given key.
+        Given key need not be present in tree.
+        """
+        node, found = self.root, None
+        while node:
+            if key < node.key:
+                found = node
+                node = node.left
+            else:
+                node = node.right
+        return (found.key, found.value) if found else None
+
+    def iter_from(
+        self,
+        key: Union[int, str, None] = None,
+        limit: Optional[int] = None,
+        inclusive: bool = True,
+    ) -> Iterator[Tuple[Any, Any]]:
+        """
+        Iterate (key, value) pairs in key order, starting from given key.
+        Uses explicit stack of left spine, so it costs O(log n) to find
+        the start and amortized O(1) per yielded pair.
+
+        :param key: start key, None means from the smallest key.
+        :param limit: max count of pairs to yield, None means no limit.
+        :param inclusive: whether pair with key equal to start key is yielded.
+        """
+        stack = []
+        node = self.root
+        while node:
+            if key is None or node.key > key or (inclusive and node.key == key):
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+
+        count = 0
+        while stack:
+            if limit is not None and count >= limit:
+                return
+            node = stack.pop()
             yield node.key, node.value
-            yield from self._in_order(node.right)
+            count += 1
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+
+    def range(
+        self, lo: Union[int, str, None] = None, hi: Union[int, str, None] = None
+    ) -> Iterator[Tuple[Any, Any]]:
+        """
+        Iterate (key, value) pairs with lo <= key <= hi in key order.
+        None bound means unbounded side.
+        """
+        for key, value in self.iter_from(lo):
+            if hi is not None and key > hi:
+                return
+            yield key, value
+
+    def in_order(self):
+        yield from self.iter_from()
 
     def __str__(self) -> str:
         lines = []
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, Union
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded mapping, which evicts least recently used entries.
+
+    Cache is bounded by number of entries, by total weight of entries
+    or by both. Weight of entry is given on put, e.g. its size in bytes.
+    The newest entry is never evicted, even when it alone outweighs
+    the budget. Every evicted entry is passed to `on_evict`.
+    """
+
+    def __init__(
+        self,
+        max_entries: Union[int, None] = None,
+        max_weight: Union[int, None] = None,
+        on_evict: Union[Callable[[Hashable, Any], None], None] = None,
+    ) -> None:
+        if max_entries is not None and max_entries < 1:
+            raise ValueError(f"max_entries must be positive, got {max_entries}")
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.on_evict = on_evict
+        self.weight = 0
+        self._entries: Dict[Hashable, Any] = OrderedDict()
+        self._weights: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Value of key, marking entry as used.
+        """
+        value = self._entries.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self._touch(key)
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Value of key, without marking entry as used.
+        """
+        return self._entries.get(key, default)
+
+    def put(self, key: Hashable, value: Any, weight: int = 1) -> None:
+        if key in self._entries:
+            self._discard(key)
+        self._make_room(weight)
+        self._entries[key] = value
+        self._weights[key] = weight
+        self.weight += weight
+        self._added(key)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._entries:
+            return default
+        return self._discard(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._weights.clear()
+        self.weight = 0
+
+    def _is_full(self, weight: int) -> bool:
+        """
+        Whether new entry of given weight doesn't fit.
+        """
+        return (
+            self.max_entries is not None and len(self._entries) >= self.max_entries
+        ) or (self.max_weight is not None and self.weight + weight > self.max_weight)
+
+    def _make_room(self, weight: int) -> None:
+        while self._entries and self._is_full(weight):
+            key = self._victim()
+            value = self._discard(key)
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+
+    def _discard(self, key: Hashable) -> Any:
+        self.weight -= self._weights.pop(key)
+        self._removed(key)
+        return self._entries.pop(key)
+
+    def _touch(self, key: Hashable) -> None:
+        self._entries.move_to_end(key)
+
+    def _added(self, key: Hashable) -> None:
+        pass
+
+    def _removed(self, key: Hashable) -> None:
+        pass
+
+    def _victim(self) -> Hashable:
+        return next(iter(self._entries))
+
+
+class LFUCache(LRUCache):
+    """
+    Bounded mapping, which evicts least frequently used entries,
+    the least recently used of them when there are several.
+
+    Entries are grouped into buckets by use count, so every operation
+    is O(1): victim is the oldest entry of the lowest bucket.
+    Only after explicit pop of the last least used entry the lowest
+    bucket is searched again.
+    """
+
+    def __init__(
+        self,
+        max_entries: Union[int, None] = None,
+        max_weight: Union[int, None] = None,
+        on_evict: Union[Callable[[Hashable, Any], None], None] = None,
+    ) -> None:
+        super().__init__(max_entries, max_weight, on_evict)
+        self._entries = {}
+        self._counts: Dict[Hashable, int] = {}
+        # Use count -> keys with this count, oldest first
+        self._buckets: Dict[int, Dict[Hashable, None]] = {}
+        self._min_count: Union[int, None] = 0
+
+    def clear(self) -> None:
+        super().clear()
+        self._counts.clear()
+        self._buckets.clear()
+        self._min_count = 0
+
+    def _touch(self, key: Hashable) -> None:
+        count = self._counts[key]
+        self._unlink(key, count)
+        if count == self._min_count and count not in self._buckets:
+            self._min_count = count + 1
+        self._link(key, count + 1)
+
+    def _added(self, key: Hashable) -> None:
+        self._link(key, 1)
+        self._min_count = 1
+
+    def _removed(self, key: Hashable) -> None:
+        count = self._counts.pop(key)
+        self._unlink(key, count)
+        if count == self._min_count and count not in self._buckets:
+            # Found lazily, only when victim is needed
+            self._min_count = None
+
+    def _victim(self) -> Hashable:
+        if self._min_count is None:
+            self._min_count = min(self._buckets)
+        return next(iter(self._buckets[self._min_count]))
+
+    def _link(self, key: Hashable, count: int) -> None:
+        self._counts[key] = count
+        self._buckets.setdefault(count, {})[key] = None
+
+    def _unlink(self, key: Hashable, count: int) -> None:
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+
+
+CACHE_POLICIES = {
+    "lru": LRUCache,
+    "lfu": LFUCache,
+}
@@ -0,0 +1,225 @@
+from typing import Any, Iterator, List, Tuple, Union
+
+_MISSING = object()
+
+
+class TrieNode:
+    __slots__ = ("edge", "children", "order", "value", "size")
+
+    def __init__(self, edge: str, value: Any = _MISSING) -> None:
+        self.edge = edge
+        # First char of child edge -> child, None for leaves to save memory
+        self.children = None
+        # Sorted first chars of children, built on first ordered walk
+        self.order = None
+        self.value = value
+        # Number of keys in subtree, including this node
+        self.size = 0
+
+    def add_child(self, child: "TrieNode") -> None:
+        if self.children is None:
+            self.children = {}
+        self.children[child.edge[0]] = child
+        self.order = None
+
+    def remove_child(self, child: "TrieNode") -> None:
+        del self.children[child.edge[0]]
+        if not self.children:
+            self.children = None
+        self.order = None
+
+    def merge_child(self) -> None:
+        """
+        Absorb the only child into this valueless node, so chain
+        of nodes with single child becomes one edge.
+        """
+        (child,) = self.children.values()
+        self.edge += child.edge
+        self.children = child.children
+        self.order = child.order
+        self.value = child.value
+
+
+class Trie:
+    """
+    Compressed prefix tree (radix tree), mapping strings to values.
+
+    Chains of nodes with single child are kept as one node with longer edge,
+    so tree has at most two nodes per key. Every node counts keys below it,
+    so number of keys with prefix is found in O(length of prefix), and prefix
+    scans walk only the matching subtree and stop after `limit` keys.
+    Keys come out in lexicographic order.
+    """
+
+    def __init__(self) -> None:
+        self.root = TrieNode("")
+
+    def __len__(self) -> int:
+        return self.root.size
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: str, default: Any = None) -> Any:
+        node = self._find(key)
+        if node is None or node.value is _MISSING:
+            return default
+        return node.value
+
+    def insert(self, key: str, value: Any) -> None:
+        """
+        Set value of key, replacing old one if key is already in tree.
+        """
+        self._node_for(key).value = value
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        """
+        Return value of key, inserting default first if key is not in tree.
+        """
+        node = self._node_for(key, default)
+        return node.value
+
+    def delete(self, key: str) -> bool:
+        """
+        Remove key from tree.
+
+        :return: bool. Whether key was in tree.
+        """
+        path = [self.root]
+        node, rest = self.root, key
+        while rest:
+            node = node.children.get(rest[0]) if node.children else None
+            if node is None or not rest.startswith(node.edge):
+                return False
+            path.append(node)
+            rest = rest[len(node.edge) :]
+        if node.value is _MISSING:
+            return False
+        node.value = _MISSING
+        for visited in path:
+            visited.size -= 1
+        if node is self.root:
+            return True
+        parent = path[-2]
+        if node.children is None:
+            parent.remove_child(node)
+            if (
+                parent is not self.root
+                and parent.value is _MISSING
+                and len(parent.children) == 1
+            ):
+                parent.merge_child()
+        elif len(node.children) == 1:
+            node.merge_child()
+        return True
+
+    def count(self, prefix: str = "") -> int:
+        """
+        Number of keys, which start with prefix.
+        """
+        found = self._find_prefix(prefix)
+        return found[0].size if found else 0
+
+    def items(
+        self, prefix: str = "", limit: Union[int, None] = None
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        Iterate (key, value) pairs of keys, which start with prefix,
+        in key order.
+
+        :param limit: int. Stop after this many keys.
+        """
+        found = self._find_prefix(prefix)
+        if found is None or limit == 0:
+            return
+        yielded = 0
+        stack = [found]
+        while stack:
+            node, key = stack.pop()
+            if node.value is not _MISSING:
+                yield key, node.value
+                yielded += 1
+                if yielded == limit:
+                    return
+            if node.children:
+                if node.order is None:
+                    node.order = sorted(node.children)
+                # Pushed in reverse, so the smallest child is walked first
+                for char in reversed(node.order):
+                    child = node.children[char]
+                    stack.append((child, key + child.edge))
+
+    def keys(self, prefix: str = "", limit: Union[int, None] = None) -> List[str]:
+        return [key for key, _ in self.items(prefix, limit)]
+
+    def _find(self, key: str) -> Union[TrieNode, None]:
+        node, rest = self.root, key
+        while rest:
+            node = node.children.get(rest[0]) if node.children else None
+            if node is None or not rest.startswith(node.edge):
+                return None
+            rest = rest[len(node.edge) :]
+        return node
+
+    def _find_prefix(self, prefix: str) -> Union[Tuple[TrieNode, str], None]:
+        """
+        Find the topmost node, which keys all start with prefix.
+
+        :return: Tuple of (node, key of node) or None if no key has prefix.
+        """
+        node, rest = self.root, prefix
+        while rest:
+            node = node.children.get(rest[0]) if node.children else None
+            if node is None:
+                return None
+            if len(rest) <= len(node.edge):
+                # Prefix ends inside of edge, all keys below continue it
+                if not node.edge.startswith(rest):
+                    return None
+                return node, prefix + node.edge[len(rest) :]
+            if not rest.startswith(node.edge):
+                return None
+            rest = rest[len(node.edge) :]
+        return node, prefix
+
+    def _node_for(self, key: str, default: Any = _MISSING) -> TrieNode:
+        """
+        Find node of key, creating it and splitting edges on the way if needed.
+        New key gets default value.
+        """
+        path = [self.root]
+        node, rest = self.root, key
+        while rest:
+            child = node.children.get(rest[0]) if node.children else None
+            if child is None:
+                child = TrieNode(rest)
+                node.add_child(child)
+                path.append(child)
+                node = child
+                break
+            common = _common_prefix_length(child.edge, rest)
+            if common < len(child.edge):
+                # Split edge: new middle node takes the common part
+                middle = TrieNode(child.edge[:common])
+                middle.size = child.size
+                node.remove_child(child)
+                child.edge = child.edge[common:]
+                middle.add_child(child)
+                node.add_child(middle)
+                child = middle
+            path.append(child)
+            node = child
+            rest = rest[common:]
+        if node.value is _MISSING:
+            node.value = None if default is _MISSING else default
+            for visited in path:
+                visited.size += 1
+        return node
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    length = min(len(a), len(b))
+    for idx in range(length):
+        if a[idx] != b[idx]:
+            return idx
+    return length
@@ -0,0 +1,173 @@
+import json
+import threading
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Union
+
+# Upper bounds of histogram buckets: 1 microsecond doubled up to ~17 seconds
+BUCKET_BOUNDS = tuple(2**power / 1e6 for power in range(25))
+
+
+class Histogram:
+    """
+    Latency histogram with buckets, growing by powers of two.
+    Recording is one bisect over 25 bounds, percentiles are
+    upper bounds of buckets, so they are precise up to factor of two.
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Upper bound of bucket, where given fraction of samples ends.
+        """
+        if not self.count:
+            return 0.0
+        needed = fraction * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= needed:
+                return BUCKET_BOUNDS[idx] if idx < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else 0.0,
+            "min_s": self.min if self.count else 0.0,
+            "max_s": self.max,
+            "p50_s": self.percentile(0.5),
+            "p90_s": self.percentile(0.9),
+            "p99_s": self.percentile(0.99),
+            # Upper bound in seconds -> samples, empty buckets are skipped
+            "buckets": {
+                str(BUCKET_BOUNDS[idx]) if idx < len(BUCKET_BOUNDS) else "inf": count
+                for idx, count in enumerate(self.counts)
+                if count
+            },
+        }
+
+
+class Metrics:
+    """
+    Thread-safe registry of operation latencies and failures.
+    """
+
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Histogram] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, failed: bool = False) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+            if failed:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Counters and latencies of every recorded operation.
+        """
+        with self._lock:
+            return {
+                name: {**histogram.as_dict(), "errors": self.errors.get(name, 0)}
+                for name, histogram in sorted(self.histograms.items())
+            }
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {}
+            self.errors = {}
+
+
+def instrument(
+    target: Any,
+    methods: Dict[str, str],
+    metrics: Union[Metrics, None],
+    hooks: Dict[str, List[Callable]],
+) -> None:
+    """
+    Wrap methods of target object, timing them into metrics
+    and calling hooks around them.
+
+    Wrappers are set on the object itself, shadowing methods of its class,
+    so objects, which are not instrumented, don't pay anything.
+
+    :param methods: Dict[str, str]. Operation name -> method name.
+        Missing methods are skipped.
+    :param metrics: Metrics or None, when only hooks are needed.
+    :param hooks: Dict[str, List[Callable]]. "before_<operation>" hooks
+        are called with arguments of method, "after_<operation>" hooks
+        with its result followed by the arguments.
+    """
+    for name, method_name in methods.items():
+        method = getattr(type(target), method_name, None)
+        if method is None:
+            continue
+        before = tuple(hooks.get(f"before_{name}", ()))
+        after = tuple(hooks.get(f"after_{name}", ()))
+        if metrics is None and not before and not after:
+            continue
+        bound = method.__get__(target, type(target))
+        setattr(target, method_name, _wrap(bound, name, metrics, before, after))
+
+
+def uninstrument(target: Any, methods: Dict[str, str]) -> None:
+    """
+    Remove wrappers, set by instrument, so class methods are used again.
+    """
+    for method_name in methods.values():
+        target.__dict__.pop(method_name, None)
+
+
+def _wrap(
+    method: Callable,
+    name: str,
+    metrics: Union[Metrics, None],
+    before: tuple,
+    after: tuple,
+) -> Callable:
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        for hook in before:
+            hook(*args, **kwargs)
+        start = perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except BaseException:
+            if metrics is not None:
+                metrics.record(name, perf_counter() - start, failed=True)
+            raise
+        if metrics is not None:
+            metrics.record(name, perf_counter() - start)
+        for hook in after:
+            hook(result, *args, **kwargs)
+        return result
+
+    return wrapper
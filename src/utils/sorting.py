@@ -0,0 +1,213 @@
+import heapq
+import os
+import pickle
+import tempfile
+from itertools import islice
+from operator import itemgetter
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List, Tuple, Union
+
+from utils.settings import lazy_settings
+
+_first = itemgetter(0)
+
+
+def sort(
+    items: Iterable[Any],
+    key: Union[Callable[[Any], Any], None] = None,
+    reverse: bool = False,
+) -> List[Any]:
+    """
+    Stable sort in memory. Key is computed once per item, not once
+    per comparison, and there is no recursion, so skewed data costs
+    O(n log n) as any other.
+    """
+    return sorted(items, key=key, reverse=reverse)
+
+
+def top_k(
+    items: Iterable[Any],
+    k: int,
+    key: Union[Callable[[Any], Any], None] = None,
+    reverse: bool = False,
+) -> List[Any]:
+    """
+    The first k items of sorted order, found in one pass over items,
+    keeping only k of them in a heap. Stable as `sort`.
+
+    :param reverse: bool. Take the k largest instead of the k smallest.
+    """
+    if reverse:
+        return heapq.nlargest(k, items, key=key)
+    return heapq.nsmallest(k, items, key=key)
+
+
+class ExternalSorter:
+    """
+    Stable merge sort of more items, than fit in memory.
+
+    Added items are collected in buffer of at most `max_items`.
+    Full buffer is sorted and spilled into temporary file as sorted run.
+    Iteration merges runs, reading them sequentially, so only one item
+    of each run is kept in memory. Every MAX_RUNS runs of the same size
+    are merged into one bigger run as soon as they are spilled,
+    so number of open files stays bounded and every item is rewritten
+    only O(log n) times.
+    Input, which fits into buffer, is sorted in memory and never touches disk.
+
+    Runs keep (key, item) pairs, so key is computed once per item.
+    Items and keys must be picklable, `dump` and `load` convert items,
+    which are not, e.g. model instances into tuples of values and back.
+
+        sorter = ExternalSorter(key=attrgetter("age"), max_items=100_000)
+        sorter.extend(rows)
+        for row in sorter:
+            ...
+
+    Run files are anonymous temporary files, removed as soon as they
+    are closed: after merge or when sorter is garbage collected.
+    """
+
+    # The most runs merged at once
+    MAX_RUNS = 64
+    # Pairs, pickled together, so only this many of each run are in memory
+    CHUNK_SIZE = 1024
+
+    def __init__(
+        self,
+        key: Union[Callable[[Any], Any], None] = None,
+        reverse: bool = False,
+        max_items: Union[int, None] = None,
+        directory: Union[str, None] = None,
+        dump: Union[Callable[[Any], Any], None] = None,
+        load: Union[Callable[[Any], Any], None] = None,
+    ) -> None:
+        """
+        :param max_items: int. Items kept in memory before spilling,
+            SORT_BUFFER_SIZE setting is used, when not given.
+        :param directory: str. Where run files are created,
+            DATA_DIR setting is used, when not given.
+        :param dump: Callable. Converts item into picklable value.
+        :param load: Callable. Converts value, made by dump, back into item.
+        """
+        if max_items is None:
+            max_items = lazy_settings.SORT_BUFFER_SIZE
+        if max_items < 1:
+            raise ValueError(f"max_items must be positive, got {max_items}")
+        self.key = key
+        self.reverse = reverse
+        self.max_items = max_items
+        self.directory = directory or lazy_settings.DATA_DIR
+        self.dump = dump
+        self.load = load
+        self.buffer: List[Any] = []
+        # Run files in order of spilling, each with number of merges behind it
+        self.runs: List[Tuple[int, BinaryIO]] = []
+        self.spilled = 0
+
+    def __len__(self) -> int:
+        return self.spilled + len(self.buffer)
+
+    def add(self, item: Any) -> None:
+        self.buffer.append(item)
+        if len(self.buffer) >= self.max_items:
+            self._spill()
+
+    def extend(self, items: Iterable[Any]) -> None:
+        for item in items:
+            self.add(item)
+
+    def __iter__(self) -> Iterator[Any]:
+        """
+        Yield all added items in sorted order. Sorter is emptied.
+        """
+        if not self.runs:
+            buffer, self.buffer = self.buffer, []
+            yield from sort(buffer, key=self.key, reverse=self.reverse)
+            return
+        if self.buffer:
+            self._spill()
+        runs = [run for _, run in self.runs]
+        self.runs = []
+        self.spilled = 0
+        try:
+            load = self.load
+            for _, item in self._merge(runs):
+                yield item if load is None else load(item)
+        finally:
+            for run in runs:
+                run.close()
+
+    def _spill(self) -> None:
+        key, dump = self.key, self.dump
+        pairs = [
+            (item if key is None else key(item), item if dump is None else dump(item))
+            for item in self.buffer
+        ]
+        self.buffer = []
+        # Items are never compared, so equal keys keep order of addition
+        pairs.sort(key=_first, reverse=self.reverse)
+        self.runs.append((0, self._write_run(pairs)))
+        self.spilled += len(pairs)
+        # Runs of the last level are merged, when there are MAX_RUNS of them.
+        # Merged runs are neighbours, so order of equal keys is kept
+        runs = self.runs
+        while len(runs) >= self.MAX_RUNS and all(
+            level == runs[-1][0] for level, _ in runs[-self.MAX_RUNS :]
+        ):
+            group = [run for _, run in runs[-self.MAX_RUNS :]]
+            try:
+                merged = self._write_run(self._merge(group))
+            finally:
+                for run in group:
+                    run.close()
+            runs[-self.MAX_RUNS :] = [(runs[-1][0] + 1, merged)]
+
+    def _write_run(self, pairs: Iterable[Tuple[Any, Any]]) -> BinaryIO:
+        os.makedirs(self.directory, exist_ok=True)
+        run = tempfile.TemporaryFile(dir=self.directory, prefix="sort-", suffix=".run")
+        try:
+            pairs = iter(pairs)
+            while True:
+                chunk = list(islice(pairs, self.CHUNK_SIZE))
+                if not chunk:
+                    break
+                pickle.dump(chunk, run, pickle.HIGHEST_PROTOCOL)
+            run.seek(0)
+        except BaseException:
+            run.close()
+            raise
+        return run
+
+    def _merge(self, runs: List[BinaryIO]) -> Iterator[Tuple[Any, Any]]:
+        # heapq.merge takes equal keys from earlier runs first, so it is stable
+        return heapq.merge(
+            *(_read_run(run) for run in runs), key=_first, reverse=self.reverse
+        )
+
+
+def _read_run(run: BinaryIO) -> Iterator[Tuple[Any, Any]]:
+    while True:
+        try:
+            chunk = pickle.load(run)
+        except EOFError:
+            return
+        yield from chunk
+
+
+def external_sort(
+    items: Iterable[Any],
+    key: Union[Callable[[Any], Any], None] = None,
+    reverse: bool = False,
+    max_items: Union[int, None] = None,
+    directory: Union[str, None] = None,
+    dump: Union[Callable[[Any], Any], None] = None,
+    load: Union[Callable[[Any], Any], None] = None,
+) -> Iterator[Any]:
+    """
+    Sort items with ExternalSorter, see it for parameters.
+    All items are read and spilled right away, sorted output
+    is merged lazily, while it is consumed.
+    """
+    sorter = ExternalSorter(key, reverse, max_items, directory, dump, load)
+    sorter.extend(items)
+    return iter(sorter)
@@ -0,0 +1,39 @@
+import itertools
+
+import pytest
+
+from db.base import BaseEntity
+from db.entities.fields import IntegerField, StringField
+from utils.settings import lazy_settings
+
+_models = itertools.count()
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """
+    Keep data files of every test in its own temporary directory.
+    """
+    path = tmp_path / "data"
+    path.mkdir()
+    monkeypatch.setattr(lazy_settings, "DATA_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def make_model():
+    """
+    Build model with username and age fields, stored in fresh file.
+    """
+
+    def make(storage, **fields):
+        name = f"User{next(_models)}Entity"
+        attrs = {
+            "id": IntegerField(),
+            "username": StringField(max_len=50, required=True, indexed=True),
+            "age": IntegerField(required=True),
+            **fields,
+        }
+        return type(name, (BaseEntity,), {"storage": storage, **attrs})
+
+    return make
@@ -0,0 +1,17 @@
+import pytest
+
+from benchmarks.stress_threads import STORAGES
+
+
+@pytest.mark.parametrize("name", list(STORAGES))
+def test_empty_batch_writes_nothing(make_model, name):
+    User = make_model(STORAGES[name]())
+    storage = User.storage
+    with storage.atomic():
+        pass
+    assert User.bulk_create([]) == []
+    assert storage.search() == []
+
+    user = User(username="a", age=1)
+    storage.save(user)
+    assert user.id == 1
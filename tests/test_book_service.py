@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from db.aio import AsyncStorage
+from db.storage import FileDataStorage
+from src.apps.book.model import Book
+from src.apps.book.repository import BookRepository
+from src.apps.book.service import BookService
+
+
+@pytest.fixture
+def storage():
+    storage = FileDataStorage()
+    storage._init(Book)
+    return storage
+
+
+@pytest.fixture
+def service(storage):
+    repository = BookRepository(AsyncStorage(storage))
+    yield BookService(repository)
+    repository.close()
+
+
+def test_update_book_replaces_stored_book(service, storage):
+    async def scenario():
+        book = await service.add_book("Dune", "Frank Herbert", 1965)
+        stored = storage.get(id=book.id)
+        updated = await service.update_book(book.id, {"title": "Dune 2", "year": 1970})
+        return stored, updated
+
+    stored, updated = asyncio.run(scenario())
+    # Book, read before update, is never changed under its reader
+    assert (stored.title, stored.year) == ("Dune", 1965)
+    assert storage.get(id=stored.id) is updated
+    assert (updated.title, updated.year) == ("Dune 2", 1970)
+    assert [book.id for book in storage.search(title="Dune 2")] == [stored.id]
+    assert storage.search(title="Dune") == []
+
+
+@pytest.mark.parametrize(
+    "changes", [{"author": ""}, {"id": 5}, {"pages": 100}, {"year": 10**5}]
+)
+def test_rejected_update_changes_nothing(service, storage, changes):
+    async def scenario():
+        book = await service.add_book("Dune", "Frank Herbert", 1965)
+        with pytest.raises(ValueError):
+            await service.update_book(book.id, {"title": "Other", **changes})
+        return book
+
+    book = asyncio.run(scenario())
+    stored = storage.get(id=book.id)
+    assert (stored.title, stored.author, stored.year) == ("Dune", "Frank Herbert", 1965)
@@ -0,0 +1,58 @@
+import pytest
+
+from db.layers.containers import CachedModelContainer
+from db.storage import FileDataStorage, LogFileDataStorage
+
+
+def make_container(model, **kwargs):
+    return CachedModelContainer(model, lambda ids: iter(()), **kwargs)
+
+
+def users(model, ids):
+    result = []
+    for id in ids:
+        user = model(username=f"u{id}", age=id)
+        user.id = id
+        result.append(user)
+    return result
+
+
+def test_cached_load_keeps_last_rows(make_model):
+    User = make_model(None)
+    container = make_container(User, max_entries=3)
+    container.load(users(User, range(1, 11)))
+    assert list(container.ids) == list(range(1, 11))
+    assert sorted(container.cache) == [8, 9, 10]
+    assert container.stats()["evictions"] == 0
+
+
+def test_cached_load_sorts_and_deduplicates_ids(make_model):
+    User = make_model(None)
+    container = make_container(User, max_entries=2)
+    loaded = users(User, [3, 1, 2, 3])
+    container.load(loaded)
+    assert list(container.ids) == [1, 2, 3]
+    # The later value of the same id wins
+    assert container.search(3) is loaded[-1]
+
+
+def test_cached_load_respects_max_bytes(make_model):
+    User = make_model(None)
+    container = make_container(User, max_bytes=1000)
+    container.load(users(User, range(1, 101)))
+    assert 0 < len(container.cache) < 100
+    assert container.cache.weight <= 1000
+    assert 100 in container.cache
+
+
+@pytest.mark.parametrize("storage_class", [FileDataStorage, LogFileDataStorage])
+def test_cached_storage_keeps_no_snapshot(make_model, storage_class):
+    User = make_model(storage_class(cache_size=10))
+    storage = User.storage
+    for id in range(50):
+        storage.save(User(username=f"u{id}", age=id))
+    storage.save_snapshot()
+    assert not storage.snapshot
+    assert storage.get(id=1).age == 0
+    with pytest.raises(ValueError):
+        storage_class(cache_size=10, snapshot=True)
@@ -0,0 +1,31 @@
+import pytest
+
+from db.layers.indexes import PrefixIndex
+
+
+@pytest.fixture
+def index():
+    index = PrefixIndex("title")
+    index.add(1, "Dune")
+    index.add(2, "dune")
+    index.add(3, None)
+    return index
+
+
+def test_prefix_lookup(index):
+    assert index.lookup("Dune") == {1}
+    assert index.lookup(None) == {3}
+    assert list(index.prefix("DU")) == [1, 2]
+    assert index.complete("d") == ["Dune", "dune"]
+
+
+@pytest.mark.parametrize("value", [5, 1.5, b"Dune", ("Dune",)])
+def test_prefix_lookup_of_non_string_finds_nothing(index, value):
+    assert index.lookup(value) == set()
+
+
+def test_prefix_of_non_string_is_rejected(index):
+    with pytest.raises(ValueError):
+        list(index.prefix(5))
+    with pytest.raises(ValueError):
+        index.complete(5)
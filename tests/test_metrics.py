@@ -0,0 +1,22 @@
+import pytest
+
+from benchmarks.stress_threads import STORAGES
+
+
+@pytest.mark.parametrize("name", list(STORAGES))
+def test_operations_are_counted_and_hooked(make_model, name):
+    storage = STORAGES[name]()
+    storage.enable_metrics()
+    deleted = []
+    storage.add_hook("after_delete", lambda result, id: deleted.append(id))
+    User = make_model(storage)
+
+    user = User(username="a", age=1)
+    User.storage.save(user)
+    User.storage.get(id=user.id)
+    User.storage.delete(user)
+
+    stats = User.storage.stats()
+    for operation in ("save", "get", "delete"):
+        assert stats[operation]["count"] == 1, operation
+    assert deleted == [user.id]
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from db.layers.offsets import OffsetIndex
+from db.storage import FileDataStorage
+
+
+def positions(records):
+    """
+    Expected (offset, length) of live records, placed one after another.
+    Forgotten records still take their bytes.
+    """
+    result, offset = {}, 0
+    for id, length, live in records:
+        if live:
+            result[id] = (offset, length)
+        offset += length
+    return result
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_offset_index_follows_file_layout(seed, monkeypatch):
+    monkeypatch.setattr(OffsetIndex, "MIN_DEAD", 1)
+    rnd = random.Random(seed)
+    records, next_id = [], 1
+    index = OffsetIndex()
+    for _ in range(300):
+        live = [record for record in records if record[2]]
+        op = rnd.random()
+        if op < 0.3 or not live:
+            length = rnd.randint(1, 20)
+            index[next_id] = (sum(record[1] for record in records), length)
+            records.append([next_id, length, True])
+            next_id += 1
+        elif op < 0.55:
+            record = rnd.choice(live)
+            record[1] = rnd.randint(1, 20)
+            index.resize(record[0], record[1])
+        elif op < 0.75:
+            record = rnd.choice(live)
+            records.remove(record)
+            index.remove(record[0])
+        elif op < 0.9:
+            # Bytes of forgotten record stay in file
+            record = rnd.choice(live)
+            record[2] = False
+            del index[record[0]]
+        else:
+            # Positions, given out of file order, are sorted before next shift,
+            # also when forgetting most of them compacts index first
+            items = list(positions(records).items())
+            rnd.shuffle(items)
+            index = OffsetIndex(dict(items))
+            for record in rnd.sample(live, len(live) // 2 + 1):
+                record[2] = False
+                del index[record[0]]
+        expected = positions(records)
+        assert dict(index.items()) == expected
+        assert {id: index[id] for id in index} == expected
+
+
+def test_compaction_keeps_file_order(monkeypatch):
+    monkeypatch.setattr(OffsetIndex, "MIN_DEAD", 1)
+    index = OffsetIndex({1: (5, 5), 2: (0, 5), 3: (10, 5)})
+    for id in range(4, 10):
+        index[id] = (15 + (id - 4) * 5, 5)
+    for id in range(4, 10):
+        del index[id]
+    index.resize(2, 10)
+    assert dict(index.items()) == {2: (0, 10), 1: (10, 5), 3: (15, 5)}
+
+
+def test_resized_and_deleted_records_survive_reopen(make_model):
+    rnd = random.Random(0)
+    User = make_model(FileDataStorage(snapshot=False))
+    storage = User.storage
+    expected = {}
+    for _ in range(500):
+        op = rnd.random()
+        if op < 0.4 or not expected:
+            user = User(username="u" * rnd.randint(1, 30), age=rnd.randrange(10**9))
+            storage.save(user)
+        elif op < 0.8:
+            user = storage.get(id=rnd.choice(list(expected)))
+            user.username = "v" * rnd.randint(1, 30)
+            storage.save(user)
+        else:
+            id = rnd.choice(list(expected))
+            storage.delete(id)
+            del expected[id]
+            continue
+        expected[user.id] = (user.username, user.age)
+
+    def stored(storage):
+        return {user.id: (user.username, user.age) for user in storage.search()}
+
+    assert stored(storage) == expected
+    reopened = FileDataStorage(snapshot=False)
+    reopened._init(User)
+    assert stored(reopened) == expected
+    for id in rnd.sample(list(expected), 20):
+        assert storage.get(id=id).username == expected[id][0]
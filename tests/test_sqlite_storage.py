@@ -0,0 +1,39 @@
+import pytest
+
+from db.sqlite_storage import SqliteDataStorage
+
+
+def reopen(model):
+    storage = SqliteDataStorage()
+    storage._init(model)
+    return storage
+
+
+def test_ids_of_deleted_records_are_not_reused(make_model):
+    User = make_model(SqliteDataStorage())
+    for name in ("a", "b"):
+        User.storage.save(User(username=name, age=1))
+    User.storage.delete(2)
+    User.storage.close()
+
+    storage = reopen(User)
+    user = User(username="c", age=1)
+    storage.save(user)
+    assert user.id == 3
+    storage.close()
+
+
+def test_rolled_back_ids_are_given_again(make_model):
+    User = make_model(SqliteDataStorage())
+    User.storage.save(User(username="a", age=1))
+    with pytest.raises(RuntimeError):
+        with User.storage.atomic():
+            User.storage.save(User(username="b", age=1))
+            raise RuntimeError("stop")
+    User.storage.close()
+
+    storage = reopen(User)
+    user = User(username="c", age=1)
+    storage.save(user)
+    assert user.id == 2
+    storage.close()
@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from benchmarks.stress_threads import STORAGES
+from db.binary_storage import BinaryDataStorage
+from db.storage import FileDataStorage
+from utils.settings import lazy_settings
+
+
+def write_records(model, lines):
+    """
+    Write data file of model, before its storage is opened.
+    """
+    storage = model._declared_storage()
+    path = os.path.join(
+        lazy_settings.DATA_DIR, f"{model.__name__.lower()}.{storage.file_format}"
+    )
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("".join(f"{line}\n" for line in lines))
+
+
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_malformed_record_fails_loading(make_model, snapshot):
+    # Columns are age, id, username
+    User = make_model(FileDataStorage(snapshot=snapshot))
+    write_records(
+        User, ["1<-->1<-->a", "2<-->2<-->b", "broken", "4<-->4<-->d", "5<-->5<-->e"]
+    )
+    with pytest.raises(ValueError):
+        User.storage.get(id=1)
+
+
+def test_unordered_records_are_loaded(make_model):
+    User = make_model(FileDataStorage(snapshot=False))
+    write_records(User, ["2<-->2<-->b", "1<-->1<-->a", "3<-->3<-->c"])
+    assert [user.id for user in User.storage.search()] == [1, 2, 3]
+    user = User(username="d", age=4)
+    User.storage.save(user)
+    assert user.id == 4
+
+
+@pytest.mark.parametrize("name", list(STORAGES))
+def test_failed_bulk_update_changes_nothing(make_model, name):
+    User = make_model(STORAGES[name]())
+    storage = User.storage
+    first = User(username="a", age=1)
+    storage.save(first)
+    storage.save(User(username="b", age=2))
+    changed = User(username="A2", age=100)
+    changed.id = first.id
+    missing = User(username="c", age=3)
+    missing.id = 99
+
+    with pytest.raises(ValueError):
+        storage.bulk_update([changed, missing], ["username", "age"])
+
+    stored = storage.get(id=first.id)
+    assert (stored.username, stored.age) == ("a", 1)
+    assert [user.id for user in storage.search(username="a")] == [first.id]
+    assert storage.search(username="A2") == []
+    assert first.username == "a"
+
+    storage.bulk_update([changed], ["username", "age"])
+    stored = storage.get(id=first.id)
+    assert (stored.username, stored.age) == ("A2", 100)
+    assert storage.search(username="a") == []
+    assert [user.id for user in storage.search(username="A2")] == [first.id]
+
+
+@pytest.mark.parametrize("name", ["file", "log"])
+def test_failed_batch_keeps_stored_instances(make_model, name, monkeypatch):
+    User = make_model(STORAGES[name]())
+    storage = User.storage
+    user = User(username="a", age=1)
+    storage.save(user)
+    changed = User(username="b", age=2)
+    changed.id = user.id
+
+    def fail(batch):
+        raise OSError("disk is full")
+
+    monkeypatch.setattr(storage, "_apply_batch", fail)
+    with pytest.raises(OSError):
+        storage.bulk_update([changed], ["username"])
+    monkeypatch.undo()
+
+    assert storage.get(id=user.id).username == "a"
+    assert [found.id for found in storage.search(username="a")] == [user.id]
+
+
+@pytest.mark.parametrize("name", ["bin", "btree"])
+@pytest.mark.parametrize("age", [2**63, -(2**63) - 1, 2**70])
+def test_int_out_of_layout_range_is_rejected(make_model, name, age):
+    User = make_model(STORAGES[name]())
+    storage = User.storage
+    user = User(username="a", age=age)
+
+    with pytest.raises(ValueError):
+        storage.save(user)
+    assert user.id is None
+    with pytest.raises(ValueError):
+        storage.get(id=1)
+
+    user.age = 2**63 - 1
+    storage.save(user)
+    assert user.id == 1
+    assert storage.get(id=1).age == 2**63 - 1
+
+    user.age = age
+    with pytest.raises(ValueError):
+        storage.save(user)
+    assert storage.get(id=1).age == 2**63 - 1
+
+
+def test_string_longer_than_layout_is_rejected(make_model):
+    User = make_model(BinaryDataStorage())
+    # Field allows 50 characters, but not 50 characters of 2 bytes each
+    user = User(username="ы" * 50, age=1)
+    with pytest.raises(ValueError):
+        User.storage.save(user)
+    assert user.id is None
+
+
+def test_allocated_unwritten_id_is_missing(make_model):
+    User = make_model(BinaryDataStorage())
+    storage = User.storage
+    storage.id_allocator.allocate()
+    with pytest.raises(ValueError):
+        storage.get(id=1)
@@ -0,0 +1,8 @@
+import pytest
+
+from benchmarks.stress_threads import STORAGES, run
+
+
+@pytest.mark.parametrize("name", list(STORAGES))
+def test_concurrent_operations_lose_nothing(name):
+    assert run(name, threads=8, ops=100) == []
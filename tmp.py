@@ -7,7 +7,7 @@ class UserEntity(BaseEntity):
     storage = lazy_settings.DEFAULT_DATA_STORAGE()
 
     id = IntegerField()
-    username = StringField(max_len=50, required=True)
+    username = StringField(max_len=50, required=True, indexed=True)
     age = IntegerField(required=True)
 
 user = UserEntity.create(age=12, username="python")
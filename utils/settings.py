@@ -4,25 +4,49 @@ from config import settings
 
 
 class LazySettings:
+    """
+    Access point of config.settings. Dotted import paths, like
+    "db.storage.FileDataStorage", are replaced with objects they point to.
+
+    Every setting is resolved on first access and cached as attribute
+    of this object, so later accesses are plain attribute reads.
+    Assigning attribute overrides setting, `reset` forgets all of them.
+    """
+
     def __getattr__(self, name):
+        # Called only for settings, which were not resolved yet
+        if name.startswith("__"):
+            raise AttributeError(name)
         value = getattr(settings, name, None)
-        if value and "." in value:
+        if _is_import_path(value):
+            import_path, obj = value.rsplit(".", 1)
             try:
-                import_path, obj = value.rsplit(".", 1)
-                print(import_path, obj)
                 module = importlib.import_module(import_path)
-                return getattr(module, obj)
             except ImportError as e:
                 raise ImportError(f"Could not import module {import_path}") from e
+            try:
+                value = getattr(module, obj)
             except AttributeError as e:
                 # Handle circular import gracefully
                 raise AttributeError(
                     f"Module {import_path} has no attribute {obj}"
                 ) from e
+        setattr(self, name, value)
         return value
 
     def __call__(self, *args, **kwds):
-        return self.__getattr__(*args, **kwds)
+        return getattr(self, *args, **kwds)
+
+    def reset(self) -> None:
+        self.__dict__.clear()
+
+
+def _is_import_path(value) -> bool:
+    return (
+        isinstance(value, str)
+        and "." in value
+        and all(part.isidentifier() for part in value.split("."))
+    )
 
 
 lazy_settings = LazySettings()